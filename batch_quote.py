@@ -0,0 +1,344 @@
+"""批量报价：不经过页面，按块读取 CSV/XLSX 订单文件，计算第四步预算和建议报价并逐块写出
+
+用法：
+    python batch_quote.py orders.csv -o quotes.csv --data "C:\\Basic Information\\Data.xlsx"
+    python batch_quote.py orders.csv -o quotes.csv --workers 0     # 多进程，0 表示使用全部CPU核心
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from budget_engine import compute_totals, compute_budget, product_specs_table
+from container_solver import FROZEN_NOTES, solve_containers_batch, describe_mix
+from data_loader import DEFAULT_DATA_PATH, DEFAULT_EXCHANGE_PAIR, SAMPLE_PRODUCT, load_reference_data
+from fx_store import FxStore
+from hs_tariff import TariffTable
+
+CHUNK_SIZE = 5000
+# 多进程时每个工作进程最多排队的块数，限制主进程中待写出结果占用的内存
+TASKS_PER_WORKER = 2
+
+# 订单文件表头 -> 字段名（表头也可以直接使用字段名）
+ORDER_COLUMNS = {
+    '商品编号': 'product_code', '交易数量': 'quantity', '采购单价': 'purchase_price',
+    '贸易术语': 'trade_term', '支付方式': 'payment', '运输要求': 'transport_note',
+    '增值税%': 'vat_rate', '退税率%': 'export_rebate_rate', '汇率': 'exchange_rate',
+    '预期利润率%': 'expected_profit_rate', '检验检疫': 'inspection_type', 'HS编码': 'hs_code',
+    '报价日期': 'quote_date', '货币对': 'exchange_pair',
+}
+REQUIRED_COLUMNS = ['product_code', 'quantity', 'purchase_price']
+
+BUDGET_COLUMNS = [
+    'purchase_total', 'rebate', 'inland_fee', 'freight_cny', 'forwarder_fee', 'inspection_fee',
+    'certificate_fee', 'customs_fee', 'insurance', 'domestic_total', 'bank_fee', 'total_cost',
+    'suggested_price',
+]
+
+
+# ==================== 读取订单 ====================
+def _read_xlsx_chunks(path, chunk_size):
+    """用 openpyxl 只读模式逐行读取，内存占用与文件大小无关"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows)]
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_orders(path, chunk_size=CHUNK_SIZE):
+    """按块读取订单文件，逐块返回 DataFrame"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        chunks = _read_xlsx_chunks(path, chunk_size)
+    else:
+        text_columns = {'product_code': str, '商品编号': str, 'hs_code': str, 'HS编码': str}
+        chunks = pd.read_csv(path, chunksize=chunk_size, dtype=text_columns)
+    for chunk in chunks:
+        yield chunk.rename(columns=lambda c: ORDER_COLUMNS.get(str(c).strip(), str(c).strip()))
+
+
+# ==================== 计算 ====================
+def _column(chunk, name, default):
+    if name in chunk:
+        return chunk[name].where(chunk[name].notna(), default)
+    return pd.Series(default, index=chunk.index)
+
+
+def _rate(chunk, name, tariff_rows, default):
+    """税率取值顺序：订单文件中填写的值 > 税率表按HS编码查到的值 > 默认值"""
+    value = pd.to_numeric(_column(chunk, name, np.nan), errors='coerce')
+    if tariff_rows is not None:
+        value = value.fillna(tariff_rows[name])
+    return value.fillna(default).to_numpy()
+
+
+def _inspection(chunk, tariff_rows):
+    inspection = _column(chunk, 'inspection_type', np.nan)
+    if tariff_rows is not None:
+        inspection = inspection.fillna(tariff_rows['inspection_type'])
+    return inspection.fillna('无').astype(str).to_numpy()
+
+
+def _exchange_rate(chunk, fx, default):
+    """汇率取值顺序：订单文件中填写的汇率 > 报价日期当天有效的汇率 > 默认值"""
+    value = pd.to_numeric(_column(chunk, 'exchange_rate', np.nan), errors='coerce')
+    if fx is not None and len(fx) and 'quote_date' in chunk:
+        pairs = _column(chunk, 'exchange_pair', DEFAULT_EXCHANGE_PAIR).astype(str)
+        as_of = pd.Series(fx.rates(pairs, chunk['quote_date'], np.nan), index=chunk.index)
+        value = value.fillna(as_of)
+    return value.fillna(default).to_numpy()
+
+
+def quote_chunk(chunk, products, freight_data, defaults, tariff=None, fx=None, fee_rules=None):
+    """计算一块订单，返回结果 DataFrame（原始列 + 预算列）
+
+    tariff 为 hs_tariff.TariffTable 时，未填写增值税率/退税率/检验检疫的行按HS编码（订单列或商品表）查表；
+    fx 为 fx_store.FxStore 时，未填写汇率且有报价日期的行取报价日期当天有效的汇率；
+    fee_rules 为 fee_rules.FeeSchedule，与页面使用同一套费用规则，按各行的贸易术语、支付方式、检验检疫和运输要求匹配。
+    """
+    chunk = chunk.reset_index(drop=True)
+    codes = chunk['product_code'].astype(str).str.strip()
+    specs = products.reindex(codes.to_numpy())
+    found = specs['single_volume'].notna()
+    tariff_rows = None
+    if tariff is not None and len(tariff):
+        hs_codes = _column(chunk, 'hs_code', '').astype(str).str.strip()
+        hs_codes = hs_codes.where(hs_codes != '', specs['hs_code'].fillna('').to_numpy())
+        tariff_rows = tariff.lookup_many(hs_codes.to_numpy())
+    specs = specs.fillna(0.0)
+
+    quantity = pd.to_numeric(chunk['quantity'], errors='coerce').fillna(0.0).to_numpy()
+    purchase_price = pd.to_numeric(chunk['purchase_price'], errors='coerce').fillna(0.0).to_numpy()
+    transport_note = _column(chunk, 'transport_note', '普通').astype(str).to_numpy()
+
+    totals = compute_totals(quantity, specs['units_per_package'].to_numpy(), specs['single_gross'].to_numpy(),
+                            specs['single_net'].to_numpy(), specs['single_volume'].to_numpy())
+
+    # 普柜和冻柜分别求解装箱方案
+    freight = np.zeros(len(chunk))
+    mix = np.empty(len(chunk), dtype=object)
+    frozen = np.isin(transport_note, FROZEN_NOTES)
+    for mask, note in ((~frozen, '普通'), (frozen, '冷冻')):
+        if mask.any():
+            solved = solve_containers_batch(totals['total_volume'][mask], totals['total_gross'][mask], freight_data, note)
+            freight[mask] = solved['freight']
+            lcl_volume = solved['lcl_fraction'] * totals['total_volume'][mask]
+            mix[mask] = [describe_mix(solved['names'], counts, lcl) for counts, lcl in zip(solved['counts'], lcl_volume)]
+
+    used = {
+        'vat_rate': _rate(chunk, 'vat_rate', tariff_rows, defaults['vat_rate']),
+        'export_rebate_rate': _rate(chunk, 'export_rebate_rate', tariff_rows, defaults['export_rebate_rate']),
+        'exchange_rate': _exchange_rate(chunk, fx, defaults['exchange_rate']),
+        'trade_term': _column(chunk, 'trade_term', 'FOB').astype(str).str.strip().to_numpy(),
+        'payment': _column(chunk, 'payment', 'T/T').astype(str).str.strip().to_numpy(),
+        'inspection_type': _inspection(chunk, tariff_rows),
+    }
+    budget = compute_budget(
+        quantity, purchase_price, used['vat_rate'], used['export_rebate_rate'], used['exchange_rate'],
+        pd.to_numeric(_column(chunk, 'expected_profit_rate', np.nan), errors='coerce')
+        .fillna(defaults['expected_profit_rate']).to_numpy(),
+        totals['total_volume'], freight, trade_term=used['trade_term'], payment=used['payment'],
+        inspection_type=used['inspection_type'], transport_note=transport_note, fee_rules=fee_rules,
+    )
+
+    # 未填写的税率、汇率等列填入实际使用的值，结果文件可以直接用于导出预算表
+    result = chunk.copy()
+    for name, values in used.items():
+        result[name] = values
+    result['total_packages'] = totals['total_packages']
+    result['total_gross'] = totals['total_gross']
+    result['total_volume'] = totals['total_volume']
+    result['container_mix'] = mix
+    result['freight_usd'] = freight
+    for name in BUDGET_COLUMNS:
+        result[name] = np.round(budget[name], 2)
+    error = np.where(~found.to_numpy(), '未找到商品', np.where((quantity <= 0) | (purchase_price <= 0), '数量或单价无效', ''))
+    result['error'] = error
+    result.loc[error != '', BUDGET_COLUMNS] = np.nan
+    return result
+
+
+# ==================== 写出结果 ====================
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.header_written = False
+
+    def write(self, df):
+        df.to_csv(self.file, header=not self.header_written, index=False)
+        self.header_written = True
+
+    def write_text(self, columns, text):
+        """写入工作进程已经格式化好的 CSV 行（不含表头）"""
+        if not self.header_written:
+            pd.DataFrame(columns=columns).to_csv(self.file, index=False)
+            self.header_written = True
+        self.file.write(text)
+
+    def close(self):
+        self.file.close()
+
+
+class _XlsxWriter:
+    """openpyxl 只写模式，逐行写入磁盘"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('报价结果')
+        self.header_written = False
+
+    def write(self, df):
+        if not self.header_written:
+            self.sheet.append(list(df.columns))
+            self.header_written = True
+        for row in df.itertuples(index=False, name=None):
+            self.sheet.append([None if isinstance(v, float) and np.isnan(v) else v for v in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+def open_writer(path):
+    return _XlsxWriter(path) if path.lower().endswith('.xlsx') else _CsvWriter(path)
+
+
+def load_products(data_path):
+    """读取商品规格表、HS编码税率表、运费单价、汇率表和费用规则，找不到数据文件时使用示例商品"""
+    try:
+        reference = load_reference_data(data_path, kinds=['product', 'hs', 'freight', 'exchange', 'fee'])
+    except FileNotFoundError:
+        print(f"未找到 {data_path}，使用示例数据", file=sys.stderr)
+        return product_specs_table([SAMPLE_PRODUCT]), None, None, FxStore(), None
+    tariff = TariffTable(reference['hs'])
+    if tariff.skipped:
+        print(f"HS编码税率表中 {len(tariff.skipped)} 个编码位数不是10/8/6/4位，已忽略：{'、'.join(tariff.skipped)}",
+              file=sys.stderr)
+    return (product_specs_table(reference['product']), tariff,
+            reference['freight'], FxStore(reference['exchange']), reference['fee'])
+
+
+# ==================== 多进程 ====================
+# 工作进程内的基础数据，由 _init_worker 在进程启动时设置一次，之后每个任务只传订单块
+_worker_tables = {}
+
+
+def _init_worker(products, freight_data, defaults, tariff, fx, fee_rules):
+    _worker_tables.update(products=products, freight_data=freight_data, defaults=defaults, tariff=tariff, fx=fx,
+                          fee_rules=fee_rules)
+
+
+def _quote_task(chunk, as_csv):
+    """在工作进程中计算一块订单；写 CSV 时在工作进程中格式化，主进程只负责按顺序写出"""
+    result = quote_chunk(chunk, **_worker_tables)
+    if as_csv:
+        return list(result.columns), result.to_csv(header=False, index=False)
+    return result
+
+
+def _check_columns(chunk):
+    missing = [name for name in REQUIRED_COLUMNS if name not in chunk]
+    if missing:
+        raise ValueError(f"订单文件缺少列: {', '.join(missing)}")
+
+
+def _run_parallel(chunks, writer, tables, workers):
+    """订单块分发到进程池，结果按原顺序写出；返回处理的行数"""
+    as_csv = isinstance(writer, _CsvWriter)
+    pending, count = deque(), 0
+
+    def write_next():
+        result = pending.popleft().result()
+        if as_csv:
+            writer.write_text(*result)
+        else:
+            writer.write(result)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=tables) as executor:
+        for chunk in chunks:
+            _check_columns(chunk)
+            pending.append(executor.submit(_quote_task, chunk, as_csv))
+            count += len(chunk)
+            if len(pending) >= workers * TASKS_PER_WORKER:
+                write_next()
+        while pending:
+            write_next()
+    return count
+
+
+def run(orders_path, output_path, data_path=DEFAULT_DATA_PATH, defaults=None, chunk_size=CHUNK_SIZE, workers=1):
+    """批量报价主流程，返回处理的订单行数
+
+    workers 大于 1 时按块分发到多个进程并行计算（0 或 None 表示CPU核心数），基础数据每个进程只传一次，
+    结果与单进程完全相同且顺序不变。
+    """
+    products, tariff, freight_data, fx, fee_rules = load_products(data_path)
+    defaults = {
+        'vat_rate': 13.0, 'export_rebate_rate': 13.0, 'expected_profit_rate': 15.0,
+        'exchange_rate': fx.rate(),
+        **(defaults or {}),
+    }
+    workers = workers or os.cpu_count() or 1
+
+    writer = open_writer(output_path)
+    count = 0
+    try:
+        chunks = read_orders(orders_path, chunk_size)
+        if workers > 1:
+            return _run_parallel(chunks, writer, (products, freight_data, defaults, tariff, fx, fee_rules), workers)
+        for chunk in chunks:
+            _check_columns(chunk)
+            writer.write(quote_chunk(chunk, products, freight_data, defaults, tariff, fx, fee_rules))
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量计算出口预算和建议报价")
+    parser.add_argument('orders', help="订单文件 (.csv / .xlsx)")
+    parser.add_argument('-o', '--output', required=True, help="结果文件 (.csv / .xlsx)")
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help="基础数据工作簿 Data.xlsx")
+    parser.add_argument('--vat-rate', type=float, default=13.0, help="默认增值税率%%")
+    parser.add_argument('--rebate-rate', type=float, default=13.0, help="默认退税率%%")
+    parser.add_argument('--profit-rate', type=float, default=15.0, help="默认预期利润率%%")
+    parser.add_argument('--exchange-rate', type=float, help="没有报价日期的订单使用的汇率，不填则取汇率表最新值")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="每块读取的订单行数")
+    parser.add_argument('--workers', type=int, default=1, help="并行计算的进程数，0 表示CPU核心数，默认 1（单进程）")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.orders):
+        parser.error(f"找不到订单文件 {args.orders}")
+
+    defaults = {'vat_rate': args.vat_rate, 'export_rebate_rate': args.rebate_rate,
+                'expected_profit_rate': args.profit_rate}
+    if args.exchange_rate is not None:
+        defaults['exchange_rate'] = args.exchange_rate
+    try:
+        count = run(args.orders, args.output, args.data, defaults, args.chunk_size, args.workers)
+    except ValueError as e:
+        # 订单文件缺列、费用规则表有误等
+        parser.exit(1, f"{e}\n")
+    print(f"已完成 {count} 行订单报价 -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
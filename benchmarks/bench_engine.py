@@ -0,0 +1,52 @@
+"""计算引擎基准：货物总量、装箱运费、建议报价与第四步费用、反算利润率，分别在 1 / 1万 / 100万 笔订单上计时"""
+import numpy as np
+
+from budget_engine import compute_totals, compute_budget
+from container_solver import solve_containers_batch
+
+SIZES = [1, 10_000, 1_000_000]
+SEED = 20240501
+
+
+def make_orders(size, seed=SEED):
+    """生成 size 笔随机订单：50种商品规格，数量 1~1000，单价 50~5000"""
+    rng = np.random.default_rng(seed)
+    sku = rng.integers(0, 50, size)
+    units = np.array([1, 2, 4, 6, 10])[sku % 5].astype(float)
+    gross = np.linspace(5.0, 300.0, 50)[sku]
+    net = gross * 0.8
+    volume = np.linspace(0.02, 2.6, 50)[sku]
+    return {
+        'quantity': rng.integers(1, 1001, size).astype(float),
+        'purchase_price': rng.uniform(50.0, 5000.0, size).round(2),
+        'units_per_package': units, 'single_gross': gross, 'single_net': net, 'single_volume': volume,
+        'vat_rate': np.full(size, 13.0), 'export_rebate_rate': np.where(sku % 3 == 0, 9.0, 13.0),
+        'trade_term': np.array(['FOB', 'CIF', 'EXW', 'DDP'])[sku % 4],
+        'payment': np.array(['T/T', 'L/C', 'D/P', 'T/T+LC'])[sku % 4],
+        'test_price': rng.uniform(50.0, 6000.0, size).round(2),
+    }
+
+
+def _totals(orders):
+    return compute_totals(orders['quantity'], orders['units_per_package'], orders['single_gross'],
+                          orders['single_net'], orders['single_volume'])
+
+
+def cases(size):
+    """返回 [(用例名, 无参可调用对象)]，准备数据的时间不计入"""
+    orders = make_orders(size)
+    totals = _totals(orders)
+    freight = solve_containers_batch(totals['total_volume'], totals['total_gross'])['freight']
+
+    def budget(test_price=None):
+        return compute_budget(
+            orders['quantity'], orders['purchase_price'], orders['vat_rate'], orders['export_rebate_rate'],
+            1.368, 15.0, totals['total_volume'], freight, trade_term=orders['trade_term'],
+            payment=orders['payment'], inspection_type='无', test_price=test_price)
+
+    return [
+        (f'engine.totals[{size}]', lambda: _totals(orders)),
+        (f'engine.freight[{size}]', lambda: solve_containers_batch(totals['total_volume'], totals['total_gross'])),
+        (f'engine.budget[{size}]', budget),
+        (f'engine.reverse_profit[{size}]', lambda: budget(orders['test_price'])),
+    ]
@@ -0,0 +1,92 @@
+"""页面基准：用 Streamlit AppTest 运行 export-budget.py，测量常见操作触发的整页重跑耗时
+
+先用示例数据生成临时 Data.xlsx 并完成“抓取数据 → 填写数量单价 → 计算运费 → 计算报价”，
+之后每个用例只计量一次交互（改滑块、点计算运费、改测试报价）后的重跑时间。
+"""
+import os
+import tempfile
+
+import pandas as pd
+
+from data_loader import PRODUCT_COLUMNS, SAMPLE_PRODUCT, SHEETS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'export-budget.py')
+TIMEOUT = 120
+
+
+def make_workbook(path, products=2000):
+    """写一个包含全部工作表的 Data.xlsx：示例商品复制 products 份"""
+    headers = {field: header for header, field in PRODUCT_COLUMNS.items()}
+    rows = [{headers[k]: v for k, v in SAMPLE_PRODUCT.items()}]
+    rows += [{**rows[0], '商品编号': f'P{1000 + i}', '商品名称': f'测试商品{i}'} for i in range(products - 1)]
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame(rows).to_excel(writer, sheet_name=SHEETS['product'], index=False)
+        pd.DataFrame([{'HS编码': '8476810000', '监管条件': '无', '检验检疫': '无', '法定单位': '台(SET)',
+                       '优惠税率%': 50, '增值税%': 13, '出口税率%': 0, '退税率%': 13}]).to_excel(
+            writer, sheet_name=SHEETS['hs'], index=False)
+        pd.DataFrame([("20'GP", 1452), ("40'GP", 2613), ("40'HC", 3135)], columns=['项目', '单价']).to_excel(
+            writer, sheet_name=SHEETS['freight'], index=False)
+        pd.DataFrame([('importer_name', '罗伯茨世界贸易有限公司')], columns=['字段', '值']).to_excel(
+            writer, sheet_name=SHEETS['customer'], index=False)
+        pd.DataFrame([('USD/CAD', 1.368, '2026-01-01')], columns=['货币对', '汇率', '日期']).to_excel(
+            writer, sheet_name=SHEETS['exchange'], index=False)
+
+
+def _button(at, label):
+    for button in at.button:
+        if label in button.label:
+            return button
+    raise KeyError(label)
+
+
+def _check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at
+
+
+class PageSession:
+    """一个已经完成报价计算的页面会话"""
+
+    def __init__(self, workdir):
+        from streamlit.testing.v1 import AppTest
+
+        data_path = os.path.join(workdir, 'Data.xlsx')
+        make_workbook(data_path)
+        os.environ['EXPORT_BUDGET_DB'] = os.path.join(workdir, 'Quotes.db')
+        self.at = _check(AppTest.from_file(APP, default_timeout=TIMEOUT).run())
+        self.at.text_input(key='data_path').input(data_path).run()
+        _check(_button(self.at, '抓取数据').click().run())
+        self.at.number_input(key='quantity_input').set_value(100.0).run()
+        self.at.number_input(key='purchase_price_input').set_value(3000.0).run()
+        _check(_button(self.at, '计算运费').click().run())
+        _check(_button(self.at, '计算报价').click().run())
+        self.profit_rate = 15
+        self.test_price = 2000.0
+
+    def rerun(self):
+        _check(self.at.run())
+
+    def slider(self):
+        self.profit_rate = 16 if self.profit_rate == 15 else 15
+        _check(self.at.slider(key='expected_profit_rate').set_value(self.profit_rate).run())
+
+    def calc_freight(self):
+        _check(_button(self.at, '计算运费').click().run())
+
+    def test_price_input(self):
+        self.test_price += 5.0
+        _check(self.at.number_input(key='test_price_input').set_value(self.test_price).run())
+
+
+def cases():
+    """返回 [(用例名, 无参可调用对象)]；会话初始化的时间不计入"""
+    workdir = tempfile.mkdtemp(prefix='export-budget-bench-')
+    session = PageSession(workdir)
+    return [
+        ('page.rerun', session.rerun),
+        ('page.profit_slider', session.slider),
+        ('page.calc_freight', session.calc_freight),
+        ('page.test_price', session.test_price_input),
+    ]
@@ -0,0 +1,112 @@
+"""运行基准并与保存的基线比较，耗时超过基线一定比例的用例标记为退化
+
+用法（在仓库根目录）：
+    python benchmarks/run.py                     # 全部用例，与 benchmarks/baseline.json 比较
+    python benchmarks/run.py --only engine       # 只跑计算引擎
+    python benchmarks/run.py --update-baseline   # 用本次结果覆盖基线
+有退化时退出码为 1。基线与机器有关，换机器后应先更新基线。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+# 变慢不足 0.5ms 的不算退化，避免微秒级用例的计时抖动
+MIN_DELTA = 0.0005
+# 每个用例至少重复的次数和至少累计的时间（秒），取中位数
+MIN_REPEAT = 5
+MIN_TIME = 1.0
+MAX_REPEAT = 200
+
+
+def measure(func):
+    """重复调用 func，返回 {'median', 'min', 'repeat'}（秒）"""
+    func()  # 预热：导入、缓存和首次分配不计入
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < MIN_REPEAT or (time.perf_counter() - started < MIN_TIME and len(timings) < MAX_REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'median': statistics.median(timings), 'min': min(timings), 'repeat': len(timings)}
+
+
+def collect(only=None, sizes=None):
+    import bench_engine
+    import bench_page
+
+    groups = []
+    if only in (None, 'engine'):
+        for size in sizes or bench_engine.SIZES:
+            groups.append(lambda size=size: bench_engine.cases(size))
+    if only in (None, 'page'):
+        groups.append(bench_page.cases)
+
+    results = {}
+    for make_cases in groups:
+        for name, func in make_cases():
+            results[name] = measure(func)
+            print(f"{name:<36} {results[name]['median'] * 1000:>10.3f} ms  (x{results[name]['repeat']})", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """返回退化的用例 [(用例名, 基线秒, 本次秒, 变化比例)]"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        change = result['median'] / base['median'] - 1.0
+        if change > threshold and result['median'] - base['median'] > MIN_DELTA:
+            regressions.append((name, base['median'], result['median'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="出口预算表性能基准")
+    parser.add_argument('--only', choices=['engine', 'page'], help="只运行一类用例")
+    parser.add_argument('--sizes', type=int, nargs='+', help="计算引擎的订单笔数，默认 1 10000 1000000")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="判定退化的变慢比例，默认 0.25")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="基线文件")
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果覆盖基线")
+    args = parser.parse_args(argv)
+
+    results = collect(args.only, args.sizes)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline['machine'] = f"{platform.platform()} / Python {platform.python_version()}"
+        baseline.setdefault('results', {}).update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("没有基线文件，使用 --update-baseline 生成")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, base, now, change in regressions:
+        print(f"退化 {name}: {base * 1000:.3f} ms -> {now * 1000:.3f} ms (+{change:.0%})")
+    if not regressions:
+        print(f"未发现退化（阈值 +{args.threshold:.0%}，基线: {baseline.get('machine', '未知')}）")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""出口预算计算引擎：把页面中的货物总量、报价、第四步费用和反算利润率公式向量化，支持批量订单一次计算"""
+import numpy as np
+import pandas as pd
+
+from fee_rules import DEFAULT_FEE_SCHEDULE, DOMESTIC_FEES
+from quantity_parser import WEIGHT, VOLUME, COUNT, parse_weight, parse_volume, parse_units_per_package, parse_column
+
+# ==================== 常量 ====================
+TRADE_TERMS = ["EXW", "FCA", "FAS", "FOB", "CFR", "CIF", "CIP", "DAP", "DPU", "DDP"]
+PAYMENTS = ["T/T", "L/C", "D/P", "T/T+LC"]
+DEFAULT_FREIGHT = {
+    'lcl_w_normal': 73, 'lcl_m_normal': 88,
+    'c20_normal': 1452, 'c40_normal': 2613, 'c40hc_normal': 3135,
+    'lcl_w_frozen': 146, 'lcl_m_frozen': 189,
+    'c20_frozen': 2903, 'c40_frozen': 5225, 'c40rh_frozen': 6270
+}
+
+
+def safe_divide(numerator, denominator):
+    """分母为0时返回0，与页面中 `if x > 0 else 0.0` 的写法一致"""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator != 0, numerator / np.where(denominator != 0, denominator, 1.0), 0.0)
+
+
+# ==================== 商品规格 ====================
+def product_specs(product):
+    """从商品信息中提取每包装单位数、单件毛重(KGS)、净重(KGS)和体积(CBM)"""
+    return {
+        'units_per_package': parse_units_per_package(product.get('unit_conversion', '')),
+        'single_gross': parse_weight(product.get('gross_weight', '')),
+        'single_net': parse_weight(product.get('net_weight', '')),
+        'single_volume': parse_volume(product.get('volume', '')),
+    }
+
+
+def product_specs_table(products):
+    """整批商品的规格数值表，以商品编号为索引；按列批量解析"""
+    df = pd.DataFrame(list(products),
+                      columns=['product_code', 'unit_conversion', 'gross_weight', 'net_weight', 'volume', 'hs_code'])
+    df['product_code'] = df['product_code'].astype(str).str.strip()
+    df = df.drop_duplicates('product_code', keep='last').set_index('product_code')
+    return pd.DataFrame({
+        'units_per_package': parse_column(df['unit_conversion'], COUNT),
+        'single_gross': parse_column(df['gross_weight'], WEIGHT),
+        'single_net': parse_column(df['net_weight'], WEIGHT),
+        'single_volume': parse_column(df['volume'], VOLUME),
+        'hs_code': df['hs_code'].fillna('').astype(str).to_numpy(),
+    }, index=df.index)
+
+
+# ==================== 货物总量 ====================
+def compute_totals(quantity, units_per_package, single_gross, single_net, single_volume):
+    """计算总包装数、总毛重、总净重、总体积"""
+    quantity = np.asarray(quantity, dtype=float)
+    units_per_package = np.asarray(units_per_package, dtype=float)
+    total_packages = np.where(units_per_package > 0,
+                              np.ceil(safe_divide(quantity, units_per_package)),
+                              quantity)
+    return {
+        'total_packages': total_packages,
+        'total_gross': total_packages * np.asarray(single_gross, dtype=float),
+        'total_net': total_packages * np.asarray(single_net, dtype=float),
+        'total_volume': total_packages * np.asarray(single_volume, dtype=float),
+    }
+
+
+# ==================== 预算 ====================
+# compute_budget 和 budget_graph 的各节点共用这些公式，参数可以是标量或等长数组
+def calc_purchase_total(purchase_price, quantity):
+    return purchase_price * quantity
+
+
+def calc_rebate(purchase_total, vat_rate, export_rebate_rate):
+    """退税额 = 含税价 ÷ (1+增值税率) × 退税率，税率为百分数"""
+    return purchase_total / (1.0 + vat_rate / 100.0) * (export_rebate_rate / 100.0)
+
+
+def calc_freight_cny(best_freight, exchange_rate):
+    return best_freight * exchange_rate
+
+
+def calc_quote_cost(purchase_total, rebate, freight_cny):
+    """计算报价用的成本：采购-退税+运费"""
+    return purchase_total - rebate + freight_cny
+
+
+def calc_suggested_price(quote_cost, expected_profit_rate, quantity, exchange_rate):
+    """建议报价(USD/单位)：成本加利润率后按数量和汇率折算"""
+    return safe_divide(quote_cost * (1.0 + expected_profit_rate / 100.0), quantity * exchange_rate)
+
+
+def calc_total_cost(purchase_total, rebate, fees, exchange_rate, freight_cny):
+    """第四步总成本：采购-退税+国内费用+银行费用+运费"""
+    return purchase_total - rebate + fees['domestic_total'] + fees['bank_fee'] * exchange_rate + freight_cny
+
+
+def calc_reverse_cost(purchase_total, rebate, fees, freight_cny):
+    """反算利润率的成本：页面只计入内陆运费、货代杂费和报关费"""
+    return purchase_total - rebate + fees['inland_fee'] + fees['forwarder_fee'] + fees['customs_fee'] + freight_cny
+
+
+def calc_revenue(test_price, quantity, exchange_rate):
+    return test_price * quantity * exchange_rate
+
+
+def calc_profit_margin(profit, purchase_total):
+    """利润率 = 利润 ÷ 采购成本"""
+    return safe_divide(profit, purchase_total)
+
+
+def shipment_fees(purchase_total, total_volume, exchange_rate, trade_term="FOB", payment="T/T", inspection_type="无",
+                  transport_note="普通", fee_rules=None):
+    """一票货的第四步国内费用和银行费用，参数可以是标量或等长数组
+
+    这些费用按票收取（有最低收费），多商品订单应以整票的采购额和体积计算一次。银行费用为USD，其余为人民币。
+    fee_rules 为 fee_rules.FeeSchedule（如 Data.xlsx 中“费用规则”表），默认使用原第四步的公式。
+    """
+    fees = (fee_rules or DEFAULT_FEE_SCHEDULE).evaluate(purchase_total, total_volume, exchange_rate, trade_term,
+                                                         payment, inspection_type, transport_note)
+    fees['domestic_total'] = sum(fees[name] for name in DOMESTIC_FEES)
+    fees['bank_fee'] = fees.pop('bank_fee')
+    return fees
+
+
+def compute_budget(quantity, purchase_price, vat_rate, export_rebate_rate, exchange_rate,
+                   expected_profit_rate, total_volume, best_freight,
+                   trade_term="FOB", payment="T/T", inspection_type="无", test_price=None,
+                   transport_note="普通", fee_rules=None):
+    """计算全部预算项目，所有参数都可以是标量或等长数组
+
+    税率和利润率按页面输入的百分数传入（如13表示13%），运费和银行费用为USD，其余金额为人民币。
+    返回字典，包含采购成本、退税、第四步各项费用、总成本、建议报价；
+    传入 test_price 时另外返回反算利润率的收入、成本、利润和利润率。第四步费用按 fee_rules 计算，见 shipment_fees。
+    """
+    quantity = np.asarray(quantity, dtype=float)
+    purchase_price = np.asarray(purchase_price, dtype=float)
+    vat_rate = np.asarray(vat_rate, dtype=float)
+    export_rebate_rate = np.asarray(export_rebate_rate, dtype=float)
+    exchange_rate = np.asarray(exchange_rate, dtype=float)
+    expected_profit_rate = np.asarray(expected_profit_rate, dtype=float)
+    total_volume = np.asarray(total_volume, dtype=float)
+    best_freight = np.asarray(best_freight, dtype=float)
+
+    # 采购成本与退税
+    purchase_total = calc_purchase_total(purchase_price, quantity)
+    rebate = calc_rebate(purchase_total, vat_rate, export_rebate_rate)
+    freight_cny = calc_freight_cny(best_freight, exchange_rate)
+
+    # 计算报价：采购-退税+运费，再加利润率
+    quote_cost = calc_quote_cost(purchase_total, rebate, freight_cny)
+    suggested_price = calc_suggested_price(quote_cost, expected_profit_rate, quantity, exchange_rate)
+
+    # 第四步：国内费用和银行费用
+    fees = shipment_fees(purchase_total, total_volume, exchange_rate, trade_term, payment, inspection_type,
+                         transport_note, fee_rules)
+
+    budget = {
+        'purchase_total': purchase_total,
+        'rebate': rebate,
+        'freight_cny': freight_cny,
+        'quote_cost': quote_cost,
+        'suggested_price': suggested_price,
+        **fees,
+        'total_cost': calc_total_cost(purchase_total, rebate, fees, exchange_rate, freight_cny),
+    }
+
+    # 反算利润率
+    if test_price is not None:
+        reverse_cost = calc_reverse_cost(purchase_total, rebate, fees, freight_cny)
+        revenue = calc_revenue(np.asarray(test_price, dtype=float), quantity, exchange_rate)
+        budget.update({
+            'reverse_cost': reverse_cost,
+            'revenue': revenue,
+            'profit': revenue - reverse_cost,
+            'profit_margin': calc_profit_margin(revenue - reverse_cost, purchase_total),
+        })
+
+    return budget
+
+
+def budget_scalar(budget):
+    """把单笔订单的计算结果转换为 float 字典，便于页面显示"""
+    return {key: float(value) for key, value in budget.items()}
@@ -0,0 +1,285 @@
+"""出口预算表导出为 Excel / PDF：当前报价单份导出，或把已保存方案、批量报价结果逐条流式写出
+
+Excel 用 openpyxl 只写模式，每个方案写一行汇总和若干行预算明细，写完即落盘，内存占用与方案数量无关；
+PDF 用 reportlab（见 requirements.txt，未安装时只能导出 Excel）每个方案一页，逐页压缩后保存，中文使用内置的 STSong-Light 字体。
+
+用法（在仓库根目录）：
+    python budget_export.py -o 2026-05.xlsx --db Quotes.db --from 2026-05-01 --to 2026-05-31
+    python budget_export.py -o quotes.pdf --batch quotes.csv --data "C:\\Basic Information\\Data.xlsx"
+"""
+import argparse
+import io
+import math
+import sys
+import tempfile
+
+from batch_quote import BUDGET_COLUMNS, read_orders
+from budget_table import COLUMNS, budget_rows, format_amount
+from data_loader import DEFAULT_DATA_PATH, load_reference_data
+from fee_rules import FeeSchedule
+from scenario_store import DEFAULT_DB_PATH, ScenarioStore
+
+# 汇总表的列：表头 -> 方案字段（inputs 或 budget 中的键）
+SUMMARY_FIELDS = {
+    '编号': 'id', '报价日期': 'quote_date', '客户': 'customer', '商品编号': 'product_code', '商品名称': 'product_name',
+    '贸易术语': 'trade_term', '支付方式': 'payment', '交易数量': 'quantity', '汇率': 'exchange_rate',
+    '建议报价(USD)': 'suggested_price', '总成本(¥)': 'total_cost',
+}
+DETAIL_KEYS = ['编号', '报价日期', '客户', '商品编号']
+AMOUNT_FORMATS = {'¥': '"¥"#,##0.00', '$': '"$"#,##0.00'}
+PDF_FONT = 'STSong-Light'
+
+
+def _value(quote, field):
+    if field == 'id':
+        return quote.get('id', '')
+    value = quote['budget'].get(field, quote['inputs'].get(field, ''))
+    return '' if value is None else value
+
+
+def quote_summary(quote):
+    """方案的汇总信息：表头 -> 值"""
+    return {label: _value(quote, field) for label, field in SUMMARY_FIELDS.items()}
+
+
+def _display(label, value):
+    """PDF 方案信息中的数值格式"""
+    if not isinstance(value, float):
+        return value
+    if label == '汇率':
+        return f"{value:.4f}"
+    return f"{value:,.0f}" if label == '交易数量' else f"{value:,.2f}"
+
+
+def quote_rows(quote, fee_rules=None):
+    """方案的预算表行（与页面第四步一致）；quote 为 {'inputs', 'budget'}，可带 'id'
+
+    费用规则只影响各项费用的名称和计算原理，金额取自方案中保存的预算结果。方案保存了计算时适用的规则
+    （inputs['fee_rules']）时按保存的规则；较早保存、没有该字段的方案和批量报价结果按 fee_rules。
+    """
+    inputs = quote['inputs']
+    if inputs.get('fee_rules') is not None:
+        fee_rules = FeeSchedule(inputs['fee_rules'])
+    return budget_rows(
+        quote['budget'], float(inputs.get('purchase_price', 0.0)), float(inputs.get('quantity', 0.0)),
+        float(inputs.get('vat_rate', 0.0)), float(inputs.get('export_rebate_rate', 0.0)),
+        float(inputs.get('total_volume', 0.0)), float(inputs.get('exchange_rate', 0.0)),
+        float(inputs.get('best_freight', 0.0)), str(inputs.get('container_type', '')), str(inputs.get('payment', '')),
+        str(inputs.get('trade_term') or 'FOB'), str(inputs.get('inspection_type') or '无'),
+        str(inputs.get('transport_note') or '普通'), fee_rules)
+
+
+def batch_quotes(path, chunk_size=5000):
+    """逐条读取 batch_quote.py 的结果文件，转换为方案字典；有错误的行跳过"""
+    number = 0
+    for chunk in read_orders(path, chunk_size):
+        for record in chunk.to_dict('records'):
+            number += 1
+            error = record.get('error')
+            if isinstance(error, str) and error:
+                continue
+            record = {key: (None if isinstance(value, float) and math.isnan(value) else value)
+                      for key, value in record.items()}
+            inputs = {**record, 'best_freight': record.get('freight_usd') or 0.0,
+                      'container_type': record.get('container_mix') or ''}
+            yield {'id': number, 'inputs': inputs, 'budget': {name: record.get(name) or 0.0 for name in BUDGET_COLUMNS}}
+
+
+# ==================== Excel ====================
+class XlsxBudgetWriter:
+    """openpyxl 只写模式：方案汇总 和 预算明细 两个工作表，逐行写入"""
+
+    def __init__(self, target, fee_rules=None):
+        from openpyxl import Workbook
+
+        self.target = target
+        self.fee_rules = fee_rules
+        self.workbook = Workbook(write_only=True)
+        self.summary = self.workbook.create_sheet('方案汇总')
+        self.detail = self.workbook.create_sheet('预算明细')
+        self.summary.append(list(SUMMARY_FIELDS))
+        self.detail.append(DETAIL_KEYS + COLUMNS[:3] + ['币种', COLUMNS[3]])
+        self.count = 0
+
+    def _amount(self, amount, currency):
+        from openpyxl.cell import WriteOnlyCell
+
+        cell = WriteOnlyCell(self.detail, value=round(float(amount), 2))
+        cell.number_format = AMOUNT_FORMATS[currency]
+        return cell
+
+    def add(self, quote):
+        summary = quote_summary(quote)
+        self.summary.append([round(value, 2) if isinstance(value, float) and label != '汇率' else value
+                             for label, value in summary.items()])
+        keys = [summary[label] for label in DETAIL_KEYS]
+        for label, sub, amount, currency, principle, _ in quote_rows(quote, self.fee_rules):
+            self.detail.append(keys + [label, sub, self._amount(amount, currency), currency, principle])
+        self.count += 1
+
+    def close(self):
+        self.workbook.save(self.target)
+
+
+# ==================== PDF ====================
+def pdf_available():
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PdfBudgetWriter:
+    """reportlab 画布，每个方案一页：标题、方案信息和预算表"""
+
+    PAGE_MARGIN = 36
+    ROW_HEIGHT = 20
+    COLUMN_WIDTHS = [80, 110, 100, 233]
+    FILLS = {'subtotal': (0.914, 0.925, 0.937), 'total': (0.165, 0.322, 0.596)}
+
+    def __init__(self, target, fee_rules=None):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        from reportlab.pdfgen import canvas
+
+        if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(UnicodeCIDFont(PDF_FONT))
+        self.string_width = pdfmetrics.stringWidth
+        self.width, self.height = A4
+        self.canvas = canvas.Canvas(target, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle('出口预算表')
+        self.fee_rules = fee_rules
+        self.count = 0
+
+    def _clip(self, text, width, size):
+        """超出单元格宽度的文字截断并加省略号"""
+        text = str(text)
+        if self.string_width(text, PDF_FONT, size) <= width:
+            return text
+        while text and self.string_width(text + '…', PDF_FONT, size) > width:
+            text = text[:-1]
+        return text + '…'
+
+    def add(self, quote):
+        c, left = self.canvas, self.PAGE_MARGIN
+        y = self.height - self.PAGE_MARGIN - 10
+        c.setFont(PDF_FONT, 16)
+        c.drawString(left, y, '出口预算表')
+
+        # 方案信息，两列排列
+        c.setFont(PDF_FONT, 9)
+        items = [f"{label}：{_display(label, value)}" for label, value in quote_summary(quote).items()]
+        y -= 24
+        for i in range(0, len(items), 2):
+            for j, item in enumerate(items[i:i + 2]):
+                c.drawString(left + j * 262, y, self._clip(item, 255, 9))
+            y -= 14
+
+        # 预算表
+        y -= 10
+        table_width = sum(self.COLUMN_WIDTHS)
+        rows = [(*COLUMNS, 'header')] + [(label, sub, format_amount(amount, currency), principle, kind)
+                                         for label, sub, amount, currency, principle, kind
+                                         in quote_rows(quote, self.fee_rules)]
+        for *cells, kind in rows:
+            fill = self.FILLS.get('total' if kind == 'header' else kind)
+            if fill:
+                c.setFillColorRGB(*fill)
+                c.rect(left, y - self.ROW_HEIGHT, table_width, self.ROW_HEIGHT, stroke=0, fill=1)
+            c.setFillColorRGB(*((1, 1, 1) if kind in ('header', 'total') else (0, 0, 0)))
+            c.setStrokeColorRGB(0.8, 0.8, 0.8)
+            c.line(left, y - self.ROW_HEIGHT, left + table_width, y - self.ROW_HEIGHT)
+            x = left
+            for width, text in zip(self.COLUMN_WIDTHS, cells):
+                c.drawString(x + 4, y - 14, self._clip(text, width - 8, 9))
+                x += width
+            y -= self.ROW_HEIGHT
+        c.setFillColorRGB(0, 0, 0)
+        c.showPage()
+        self.count += 1
+
+    def close(self):
+        self.canvas.save()
+
+
+def open_writer(target, fmt, fee_rules=None):
+    """fmt 为 'xlsx' 或 'pdf'；target 为文件路径或可写的二进制文件对象"""
+    if fmt == 'pdf':
+        if not pdf_available():
+            raise RuntimeError("导出 PDF 需要安装 reportlab")
+        return PdfBudgetWriter(target, fee_rules)
+    if fmt == 'xlsx':
+        return XlsxBudgetWriter(target, fee_rules)
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def export_quotes(quotes, target, fmt, fee_rules=None):
+    """把方案逐个写入 target，返回导出的方案数"""
+    writer = open_writer(target, fmt, fee_rules)
+    for quote in quotes:
+        writer.add(quote)
+    writer.close()
+    return writer.count
+
+
+def export_bytes(quotes, fmt, fee_rules=None):
+    """导出到内存，返回文件内容（页面下载用）"""
+    buffer = io.BytesIO()
+    export_quotes(quotes, buffer, fmt, fee_rules)
+    return buffer.getvalue()
+
+
+def export_tempfile(quotes, fmt, fee_rules=None):
+    """逐个写入临时文件，返回已回到开头的文件对象，关闭后自动删除（页面批量下载用，不在内存中拼出整个文件）"""
+    target = tempfile.NamedTemporaryFile(suffix=f'.{fmt}')
+    try:
+        export_quotes(quotes, target, fmt, fee_rules)
+    except BaseException:
+        target.close()
+        raise
+    target.seek(0)
+    return target
+
+
+def load_fee_rules(data_path):
+    """读取数据工作簿中的费用规则，没有数据文件或没有该工作表时返回 None（使用默认公式）"""
+    try:
+        return load_reference_data(data_path, kinds=['fee'])['fee']
+    except FileNotFoundError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导出出口预算表（Excel / PDF）")
+    parser.add_argument('-o', '--output', required=True, help="导出文件 (.xlsx / .pdf)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--db', default=DEFAULT_DB_PATH, help="报价方案库（默认）")
+    source.add_argument('--batch', help="batch_quote.py 的结果文件 (.csv / .xlsx)")
+    parser.add_argument('--from', dest='date_from', help="报价日期起（含），YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="报价日期止（含），YYYY-MM-DD")
+    parser.add_argument('--customer', help="只导出该客户")
+    parser.add_argument('--product', dest='product_code', help="只导出该商品编号")
+    parser.add_argument('--trade-term', help="只导出该贸易术语")
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help="基础数据工作簿 Data.xlsx（读取费用规则）")
+    args = parser.parse_args(argv)
+
+    fmt = args.output.lower().rsplit('.', 1)[-1]
+    if fmt not in ('xlsx', 'pdf'):
+        parser.error("导出文件的扩展名应为 .xlsx 或 .pdf")
+    if args.batch:
+        quotes = batch_quotes(args.batch)
+    else:
+        quotes = ScenarioStore(args.db).iter_quotes(
+            customer=args.customer, product_code=args.product_code, trade_term=args.trade_term,
+            date_from=args.date_from, date_to=args.date_to)
+    try:
+        count = export_quotes(quotes, args.output, fmt, load_fee_rules(args.data))
+    except (RuntimeError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+    print(f"已导出 {count} 个方案 -> {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""单笔订单的预算计算图：每个派生字段声明自己的输入，按需计算并缓存结果
+
+页面每次重跑用 update 传入当前输入，只有值发生变化的输入才会把依赖它的节点标记为待重算；
+get 取值时只运行待重算的节点，ran 记录实际运行过的节点。公式与 budget_engine.compute_budget 共用，
+所以改测试报价只会重算收入、利润和利润率，不会重新解析重量体积或重新求解装箱。
+"""
+import operator
+
+import numpy as np
+
+from budget_engine import (budget_scalar, calc_freight_cny, calc_profit_margin, calc_purchase_total, calc_quote_cost,
+                           calc_rebate, calc_revenue, calc_reverse_cost, calc_suggested_price, calc_total_cost,
+                           compute_totals, shipment_fees)
+from container_solver import solve_containers
+from quantity_parser import parse_units_per_package, parse_volume, parse_weight
+
+
+def _pick(key):
+    def pick(values):
+        return values[key]
+    return pick
+
+
+def _totals(quantity, units_per_package, single_gross, single_net, single_volume):
+    return budget_scalar(compute_totals(quantity, units_per_package, single_gross, single_net, single_volume))
+
+
+# 节点名 -> (计算函数, 输入名列表)；输入名为外部输入或其他节点
+BUDGET_NODES = {
+    # 货物总量
+    'single_gross': (parse_weight, ['gross_weight']),
+    'single_net': (parse_weight, ['net_weight']),
+    'single_volume': (parse_volume, ['volume']),
+    'units_per_package': (parse_units_per_package, ['unit_conversion']),
+    'totals': (_totals, ['quantity', 'units_per_package', 'single_gross', 'single_net', 'single_volume']),
+    'total_volume': (_pick('total_volume'), ['totals']),
+    'total_gross': (_pick('total_gross'), ['totals']),
+    # 运费
+    'container_mix': (solve_containers, ['total_volume', 'total_gross', 'freight_data', 'transport_note',
+                                         'load_capacities']),
+    # 报价和预算表
+    'purchase_total': (calc_purchase_total, ['purchase_price', 'quantity']),
+    'rebate': (calc_rebate, ['purchase_total', 'vat_rate', 'export_rebate_rate']),
+    'freight_cny': (calc_freight_cny, ['best_freight', 'exchange_rate']),
+    'quote_cost': (calc_quote_cost, ['purchase_total', 'rebate', 'freight_cny']),
+    'suggested_price': (calc_suggested_price, ['quote_cost', 'expected_profit_rate', 'quantity', 'exchange_rate']),
+    'fees': (shipment_fees, ['purchase_total', 'total_volume', 'exchange_rate', 'trade_term', 'payment',
+                             'inspection_type', 'transport_note', 'fee_rules']),
+    'total_cost': (calc_total_cost, ['purchase_total', 'rebate', 'fees', 'exchange_rate', 'freight_cny']),
+    # 反算利润率
+    'reverse_cost': (calc_reverse_cost, ['purchase_total', 'rebate', 'fees', 'freight_cny']),
+    'revenue': (calc_revenue, ['test_price', 'quantity', 'exchange_rate']),
+    'profit': (operator.sub, ['revenue', 'reverse_cost']),
+    'profit_margin': (calc_profit_margin, ['profit', 'purchase_total']),
+}
+BUDGET_KEYS = ['purchase_total', 'rebate', 'freight_cny', 'quote_cost', 'suggested_price']
+REVERSE_KEYS = ['reverse_cost', 'revenue', 'profit', 'profit_margin']
+
+
+def _same(old, new):
+    """输入值是否未变化；数组按元素比较"""
+    if old is new:
+        return True
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return old is not None and new is not None and np.array_equal(old, new)
+    try:
+        return bool(old == new)
+    except (TypeError, ValueError):
+        return False
+
+
+class BudgetGraph:
+    """带缓存的计算图：输入变化时只让依赖它的节点失效，取值时按需重算"""
+
+    def __init__(self, nodes=BUDGET_NODES):
+        self.nodes = nodes
+        self.inputs = {}
+        self.values = {}
+        self.ran = []
+        # 输入名或节点名 -> 直接依赖它的节点
+        self.dependents = {}
+        for name, (_, args) in nodes.items():
+            for arg in args:
+                self.dependents.setdefault(arg, []).append(name)
+
+    def _invalidate(self, name):
+        # 已缓存节点的上游一定也已缓存，所以遇到未缓存的节点即可停止
+        for dependent in self.dependents.get(name, ()):
+            if dependent in self.values:
+                del self.values[dependent]
+                self._invalidate(dependent)
+
+    def update(self, **inputs):
+        """设置输入，返回值发生变化的输入名"""
+        changed = []
+        for name, value in inputs.items():
+            if name in self.nodes:
+                raise KeyError(f"{name} 是计算节点，不能作为输入")
+            if name in self.inputs and _same(self.inputs[name], value):
+                continue
+            self.inputs[name] = value
+            self._invalidate(name)
+            changed.append(name)
+        return changed
+
+    def get(self, name):
+        """取输入或节点的值，节点未缓存时先计算它的输入"""
+        if name in self.inputs:
+            return self.inputs[name]
+        if name in self.values:
+            return self.values[name]
+        if name not in self.nodes:
+            raise KeyError(f"缺少输入: {name}")
+        func, args = self.nodes[name]
+        value = func(*[self.get(arg) for arg in args])
+        self.values[name] = value
+        self.ran.append(name)
+        return value
+
+    def reset_log(self):
+        self.ran = []
+
+    def budget(self):
+        """与 compute_budget（不含测试报价）相同键的 float 字典"""
+        values = {name: self.get(name) for name in BUDGET_KEYS}
+        return budget_scalar({**values, **self.get('fees'), 'total_cost': self.get('total_cost')})
+
+    def reverse(self):
+        """反算利润率的四个结果，需先设置 test_price"""
+        return budget_scalar({name: self.get(name) for name in REVERSE_KEYS})
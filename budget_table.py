@@ -0,0 +1,86 @@
+"""出口预算表：把计算结果整理成表格行，一次渲染为完整 HTML 片段，并可导出 CSV（Excel/PDF 见 budget_export）"""
+import csv
+import html
+import io
+from functools import lru_cache
+
+from fee_rules import DEFAULT_FEE_SCHEDULE, FEE_LABELS
+
+COLUMNS = ['项目', '费用项目', '金额', '计算原理']
+
+ROW_STYLES = {
+    '': '',
+    'subtotal': ' style="background-color: #e9ecef;"',
+    'total': ' style="background-color: #2a5298; color: white; font-weight: bold;"',
+}
+
+
+def budget_rows(budget, purchase_price, quantity, vat_rate, export_rebate_rate, total_volume,
+                exchange_rate, best_freight, container_desc, payment, trade_term="FOB", inspection_type="无",
+                transport_note="普通", fee_rules=None):
+    """第四步预算表的所有行，每行为 (项目, 费用项目, 金额, 币种, 计算原理, 行类型)，金额为数值，币种为 ¥ 或 $
+
+    budget 为 budget_engine.compute_budget 的单笔结果（float 字典）。各项费用的名称和计算原理取自计算时
+    适用的费用规则（fee_rules，默认为原第四步公式）。返回元组，可直接作为缓存键。
+    """
+    schedule = fee_rules or DEFAULT_FEE_SCHEDULE
+
+    def fee_row(label, fee, currency='¥'):
+        rule = schedule.matching(fee, trade_term, payment, inspection_type, transport_note)
+        if rule is None:
+            return (label, FEE_LABELS[fee], budget[fee], currency, '', '')
+        return (label, rule.label, budget[fee], currency, rule.describe(total_volume, exchange_rate), '')
+
+    rows = [
+        ('1.采购成本', '含税购入价', budget['purchase_total'], '¥', f"{purchase_price:.0f} × {int(quantity)}", ''),
+        ('2.退税收入', '退税额', budget['rebate'], '¥', f"含税价÷(1+{vat_rate:.0f}%)×{export_rebate_rate:.0f}%", ''),
+        fee_row('3.国内费用', 'inland_fee'),
+        ('', '国际运费', budget['freight_cny'], '¥', f"{container_desc} (${best_freight:,.2f} × {exchange_rate:.3f})", ''),
+        fee_row('', 'forwarder_fee'),
+    ]
+    for fee in ['inspection_fee', 'certificate_fee', 'customs_fee', 'insurance']:
+        if budget[fee] > 0:
+            rows.append(fee_row('', fee))
+    rows.append(('', '国内费用合计', budget['domestic_total'], '¥', '各项相加', 'subtotal'))
+    if budget['bank_fee'] > 0:
+        rows.append(fee_row('4.银行费用', 'bank_fee', '$'))
+    rows.append(('总成本', '=1-2+3+4', budget['total_cost'], '¥', '采购-退税+国内+银行+运费', 'total'))
+    return tuple(rows)
+
+
+def format_amount(amount, currency):
+    return f"{currency}{amount:,.2f}"
+
+
+@lru_cache(maxsize=256)
+def render_html(rows):
+    """整张预算表渲染为一个 HTML 片段（表头和各行都包在 excel-table 中）"""
+    parts = [
+        '<div class="excel-table">',
+        '<div class="excel-header"><div>项目</div><div>费用项目</div><div>金额</div><div>计算原理</div></div>',
+    ]
+    for label, sub, amount, currency, principle, kind in rows:
+        label, sub, amount, principle = (html.escape(str(v)) for v in (label, sub, format_amount(amount, currency), principle))
+        if kind == 'subtotal':
+            sub, amount = f'<strong>{sub}</strong>', f'<strong>{amount}</strong>'
+        principle_style = ' style="color: white;"' if kind == 'total' else ''
+        parts.append(
+            f'<div class="excel-row"{ROW_STYLES[kind]}>'
+            f'<div class="excel-label">{label}</div>'
+            f'<div class="excel-sub">{sub}</div>'
+            f'<div class="excel-amount">{amount}</div>'
+            f'<div class="excel-principle"{principle_style}>{principle}</div>'
+            '</div>')
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=256)
+def to_csv(rows):
+    """预算表导出为 CSV（UTF-8 BOM，Excel 可直接打开）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    writer.writerows((label, sub, format_amount(amount, currency), principle)
+                     for label, sub, amount, currency, principle, _ in rows)
+    return buffer.getvalue().encode('utf-8-sig')
@@ -0,0 +1,177 @@
+"""最低运费装箱方案：在运费单价表的20'/40'/40'HC柜和拼箱(LCL)之间选择总运费最低的组合，同时满足体积和载重限制"""
+from functools import lru_cache
+
+import numpy as np
+
+from budget_engine import DEFAULT_FREIGHT
+
+# (柜型, 运费单价键, 可用体积CBM, 最大载重KGS)
+CONTAINER_SPECS = {
+    'normal': [
+        ("20'GP", 'c20_normal', 33.0, 21700.0),
+        ("40'GP", 'c40_normal', 67.0, 26500.0),
+        ("40'HC", 'c40hc_normal', 76.0, 26500.0),
+    ],
+    'frozen': [
+        ("20'RF", 'c20_frozen', 28.0, 27400.0),
+        ("40'RF", 'c40_frozen', 59.0, 27700.0),
+        ("40'RH", 'c40rh_frozen', 67.0, 29000.0),
+    ],
+}
+# 拼箱单价键：(按重量USD/吨, 按体积USD/CBM)，按W/M取大者计费
+LCL_KEYS = {
+    'normal': ('lcl_w_normal', 'lcl_m_normal'),
+    'frozen': ('lcl_w_frozen', 'lcl_m_frozen'),
+}
+FROZEN_NOTES = ["冷藏", "冷冻"]
+
+# 每种柜型精确枚举的最大柜数；连续松弛最优解中某柜型超过 MAX_EXACT_COUNT - BULK_RESERVE 柜时，
+# 各柜型先装入松弛解减去 BULK_RESERVE 的整柜，再在其上精确枚举 0~MAX_EXACT_COUNT 柜
+MAX_EXACT_COUNT = 12
+BULK_RESERVE = 6
+BATCH_CHUNK = 1024
+
+
+def container_class(transport_note):
+    """运输要求 -> 'normal' / 'frozen'"""
+    return 'frozen' if transport_note in FROZEN_NOTES else 'normal'
+
+
+@lru_cache(maxsize=None)
+def _combinations(n_types, limit):
+    """所有柜数组合，形状 (组合数, 柜型数)"""
+    grids = np.meshgrid(*[np.arange(limit + 1)] * n_types, indexing='ij')
+    return np.stack([g.ravel() for g in grids], axis=1).astype(float)
+
+
+def _tables(freight_data, kind):
+    freight_data = freight_data or DEFAULT_FREIGHT
+    specs = CONTAINER_SPECS[kind]
+    names = [spec[0] for spec in specs]
+    prices = np.array([float(freight_data.get(spec[1], DEFAULT_FREIGHT[spec[1]])) for spec in specs])
+    volumes = np.array([spec[2] for spec in specs])
+    payloads = np.array([spec[3] for spec in specs])
+    lcl_w_key, lcl_m_key = LCL_KEYS[kind]
+    lcl = (float(freight_data.get(lcl_w_key, DEFAULT_FREIGHT[lcl_w_key])),
+           float(freight_data.get(lcl_m_key, DEFAULT_FREIGHT[lcl_m_key])))
+    return names, prices, volumes, payloads, lcl
+
+
+def _solve_chunk(volume, weight, preload, prices, volumes, payloads, lcl):
+    """对一批订单精确枚举，返回 (各柜型数量, 拼箱比例, 总运费)
+
+    preload 为每笔订单已预先装入的各柜型数量（大订单的整柜部分），与枚举的柜数合并计算容量和运费。
+    """
+    combos = _combinations(len(prices), MAX_EXACT_COUNT)
+    cap_volume = combos @ volumes
+    cap_weight = combos @ payloads
+    # 有效体积或载重为 0 的柜型（如托盘装不进该柜型）不可用，含这种柜型的组合不参与比较
+    cost = np.where((combos[:, ~_usable(volumes, payloads)] > 0).any(axis=1), np.inf, combos @ prices)
+
+    v = volume[:, None]
+    w = weight[:, None]
+    # 扣除预装整柜后剩余的体积和重量
+    rest_v = v - (preload @ volumes)[:, None]
+    rest_w = w - (preload @ payloads)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        short_v = np.where(v > 0, (rest_v - cap_volume) / v, 0.0)
+        short_w = np.where(w > 0, (rest_w - cap_weight) / w, 0.0)
+    lcl_fraction = np.clip(np.maximum(short_v, short_w), 0.0, 1.0)
+    lcl_full = np.maximum(weight / 1000.0 * lcl[0], volume * lcl[1])
+    total = cost + lcl_fraction * lcl_full[:, None]
+
+    best = np.argmin(total, axis=1)
+    rows = np.arange(len(volume))
+    return combos[best] + preload, lcl_fraction[rows, best], total[rows, best] + preload @ prices
+
+
+def _usable(volumes, payloads):
+    return (volumes > 0) & (payloads > 0)
+
+
+def _relaxed_counts(volume, weight, prices, volumes, payloads):
+    """不计拼箱、柜数可取小数时的最低运费柜数，形状 (订单数, 柜型数)
+
+    两个约束（体积、载重）的线性规划最优解在顶点上：只用一种柜型，或两种柜型同时恰好装满体积和载重。
+    不可用的柜型不参与；没有可用柜型时全部为 0（只能拼箱）。
+    """
+    n_types = len(prices)
+    usable = np.flatnonzero(_usable(volumes, payloads))
+    if len(usable) == 0:
+        return np.zeros((len(volume), n_types))
+    candidates = []
+    for i in usable:
+        counts = np.zeros((len(volume), n_types))
+        counts[:, i] = np.maximum(volume / volumes[i], weight / payloads[i])
+        candidates.append(counts)
+    for i in usable:
+        for j in usable[usable > i]:
+            det = volumes[i] * payloads[j] - volumes[j] * payloads[i]
+            if det == 0:
+                continue
+            counts = np.zeros((len(volume), n_types))
+            counts[:, i] = (volume * payloads[j] - volumes[j] * weight) / det
+            counts[:, j] = (volumes[i] * weight - volume * payloads[i]) / det
+            # 解出负柜数的顶点不可行
+            counts[(counts < 0).any(axis=1)] = np.inf
+            candidates.append(counts)
+    candidates = np.stack(candidates, axis=1)
+    cost = np.where(np.isfinite(candidates), candidates, 0.0) @ prices
+    cost[~np.isfinite(candidates).all(axis=2)] = np.inf
+    return candidates[np.arange(len(volume)), np.argmin(cost, axis=1)]
+
+
+def solve_containers_batch(total_volume, total_gross, freight_data=None, transport_note="普通", capacities=None):
+    """批量求解最低运费装箱方案
+
+    total_volume、total_gross 为等长数组（CBM、KGS），返回字典：counts (订单数, 柜型数)、lcl_fraction、freight (USD)、names。
+    capacities 为各柜型的有效体积（CBM），用于替代 CONTAINER_SPECS 中的可用体积，如托盘装柜规划的结果。
+    """
+    kind = container_class(transport_note)
+    names, prices, volumes, payloads, lcl = _tables(freight_data, kind)
+    if capacities is not None:
+        volumes = np.asarray(capacities, dtype=float)
+    volume = np.atleast_1d(np.asarray(total_volume, dtype=float))
+    weight = np.broadcast_to(np.asarray(total_gross, dtype=float), volume.shape).astype(float)
+
+    # 订单簿中相同的(体积, 毛重)只求解一次
+    pairs, inverse = np.unique(np.stack([volume, weight], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    volume, weight = pairs[:, 0], pairs[:, 1]
+
+    # 大订单：先装入连续松弛最优解附近的整柜，只在其上下 BULK_RESERVE 柜的范围内精确枚举
+    relaxed = _relaxed_counts(volume, weight, prices, volumes, payloads)
+    oversized = (relaxed.max(axis=1) + BULK_RESERVE > MAX_EXACT_COUNT)[:, None]
+    preload = np.where(oversized, np.maximum(np.floor(relaxed) - BULK_RESERVE, 0.0), 0.0)
+
+    counts = np.zeros((len(volume), len(prices)))
+    lcl_fraction = np.zeros(len(volume))
+    freight = np.zeros(len(volume))
+    for start in range(0, len(volume), BATCH_CHUNK):
+        part = slice(start, start + BATCH_CHUNK)
+        counts[part], lcl_fraction[part], freight[part] = _solve_chunk(
+            volume[part], weight[part], preload[part], prices, volumes, payloads, lcl)
+
+    return {'counts': counts[inverse], 'lcl_fraction': lcl_fraction[inverse], 'freight': freight[inverse], 'names': names}
+
+
+def describe_mix(names, counts, lcl_volume=0.0):
+    """装箱方案文字说明，如 1个40'HC + 1个20'GP + 拼箱3.20CBM"""
+    parts = [f"{int(count)}个{name}" for name, count in zip(names, counts) if count > 0]
+    if lcl_volume > 0:
+        parts.append(f"拼箱{lcl_volume:.2f}CBM")
+    return " + ".join(parts) if parts else "无"
+
+
+def solve_containers(total_volume, total_gross, freight_data=None, transport_note="普通", capacities=None):
+    """单笔订单最低运费装箱方案"""
+    result = solve_containers_batch([total_volume], [total_gross], freight_data, transport_note, capacities)
+    counts = result['counts'][0]
+    lcl_cbm = float(result['lcl_fraction'][0]) * float(total_volume)
+    return {
+        'counts': {name: int(count) for name, count in zip(result['names'], counts)},
+        'containers': int(counts.sum()),
+        'lcl_volume': lcl_cbm,
+        'freight': float(result['freight'][0]),
+        'description': describe_mix(result['names'], counts, lcl_cbm),
+    }
@@ -0,0 +1,278 @@
+"""基础数据读取：从 Data.xlsx 读取商品、HS编码、运费、客户、汇率和费用规则表，按文件路径+修改时间+大小缓存
+
+需要重新读取的工作表在线程池中并发读取，先读完的表先回调，进度按各表的数据量计算。
+"""
+import os
+import posixpath
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from budget_engine import DEFAULT_FREIGHT
+from fee_rules import FEE_RULE_COLUMNS, FeeSchedule
+
+DEFAULT_DATA_PATH = os.environ.get("EXPORT_BUDGET_DATA", r"C:\Basic Information\Data.xlsx")
+
+# 数据类别 -> 工作表名称
+SHEETS = {
+    'product': '商品信息',
+    'hs': 'HS编码',
+    'freight': '运费单价',
+    'customer': '客户信息',
+    'exchange': '汇率',
+    'fee': '费用规则',
+}
+# 可以没有的工作表，缺少时解析结果为 None（费用规则使用默认公式）
+OPTIONAL_SHEETS = ['fee']
+
+# 工作表表头 -> 程序字段名（表头也可以直接使用字段名）
+PRODUCT_COLUMNS = {
+    '商品编号': 'product_code', '商品名称': 'product_name', '英文名称': 'product_name_en',
+    '货物类型': 'product_type', '规格型号(中文)': 'model_cn', '规格型号(英文)': 'model_en',
+    '销售单位': 'sales_unit', '包装单位': 'package_unit', '单位换算': 'unit_conversion',
+    '毛重': 'gross_weight', '净重': 'net_weight', '体积': 'volume', '运输说明': 'transport_desc',
+    'HS编码': 'hs_code',
+}
+HS_COLUMNS = {
+    'HS编码': 'hs_code', '监管条件': 'customs_condition', '检验检疫': 'inspection_type',
+    '法定单位': 'legal_unit', '优惠税率%': 'pref_tax_rate', '增值税%': 'vat_rate',
+    '出口税率%': 'export_tax_rate', '退税率%': 'export_rebate_rate',
+}
+HS_RATE_FIELDS = ['pref_tax_rate', 'vat_rate', 'export_tax_rate', 'export_rebate_rate']
+FREIGHT_LABELS = {
+    'LCL(W)': 'lcl_w_normal', 'LCL(M)': 'lcl_m_normal',
+    "20'GP": 'c20_normal', "40'GP": 'c40_normal', "40'HC": 'c40hc_normal',
+    'LCL(W)冻': 'lcl_w_frozen', 'LCL(M)冻': 'lcl_m_frozen',
+    "20'RF": 'c20_frozen', "40'RF": 'c40_frozen', "40'RH": 'c40rh_frozen',
+}
+EXCHANGE_COLUMNS = {'货币对': 'pair', '汇率': 'rate', '日期': 'date'}
+
+# 读取失败时使用的示例数据（即原页面中写死的数据）
+SAMPLE_PRODUCT = {
+    'product_code': 'P010',
+    'product_name': '自动售货机',
+    'product_name_en': 'Vending machine',
+    'product_type': '机器、机械器具、电气设备及其零件',
+    'model_cn': '型号：MF-782',
+    'model_en': 'Model:mf-782',
+    'sales_unit': '台(SET)',
+    'package_unit': '托盘(PALLET)',
+    'unit_conversion': '1 SET/PALLET',
+    'gross_weight': '280.00KGS/托盘',
+    'net_weight': '220.00KGS/托盘',
+    'volume': '2.55CBM/托盘',
+    'transport_desc': '无'
+}
+# 客户信息表缺少的字段使用的默认值（即原页面中写死的数据）
+DEFAULT_CUSTOMER = {
+    'exporter_name': '平尼克国际贸易公司',
+    'exporter_name_short': '平尼克国际',
+    'exporter_name_en': 'Pinic International Trading',
+    'exporter_address': '菲律宾马尼拉宾农多马德里街513号',
+    'exporter_address_en': '513 Madrid Street Binondomanila,Philippines',
+    'exporter_contact': '阿卜杜勒贾里勒',
+    'exporter_contact_en': 'Abdul Jaleel',
+    'exporter_tel': '82-266-2402192',
+    'exporter_email': '19859639@yahoo.com',
+    'exporter_postal': '260335',
+    'exporter_org_code': '702104723',
+    'exporter_social_code': '921002127021047238',
+    'exporter_customs_code': '2100151282',
+    'exporter_inspection_code': '3100212576',
+    'importer_name': '罗伯茨世界贸易有限公司',
+    'importer_name_en': 'Roberts World Traders Inc.',
+    'importer_address': '加拿大不列颠哥伦比亚维多利亚白桦新月街4号',
+    'importer_address_en': '4 Aspen Crescent, Victoria, British Columbia, Canada',
+    'importer_contact': '艾伦·博尔赫斯',
+    'importer_contact_en': 'Alan Borges',
+    'importer_tel': '82-775-6178091',
+    'importer_email': '17548933@yahoo.com',
+    'importer_postal': '314640',
+    'importer_org_code': '560088060',
+    'importer_inspection_code': '2910087056',
+    'importer_customs_code': '2660935964',
+}
+DEFAULT_EXCHANGE_PAIR = 'USD/CAD'
+DEFAULT_EXCHANGE_RATE = 1.368
+
+# 并发读取工作表的最大线程数
+MAX_WORKERS = len(SHEETS)
+_XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+# (路径, 工作表) -> (文件签名, 解析结果)，进程内所有会话共享
+_sheet_cache = {}
+_cache_lock = threading.Lock()
+
+
+def file_signature(path):
+    """文件签名：修改时间(纳秒)和大小，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _rename(df, columns):
+    df = df.rename(columns=lambda c: columns.get(str(c).strip(), str(c).strip()))
+    return df.dropna(how='all')
+
+
+def _parse_product(df):
+    df = _rename(df, PRODUCT_COLUMNS).fillna('')
+    return [{key: str(value).strip() for key, value in row.items()} for row in df.to_dict('records')]
+
+
+def _parse_hs(df):
+    df = _rename(df, HS_COLUMNS)
+    df['hs_code'] = df['hs_code'].astype(str).str.replace(r'\D', '', regex=True)
+    for field in HS_RATE_FIELDS:
+        if field in df:
+            df[field] = pd.to_numeric(df[field], errors='coerce').fillna(0.0)
+    return df.fillna('').to_dict('records')
+
+
+def _parse_freight(df):
+    """运费表为两列：项目、单价"""
+    freight = dict(DEFAULT_FREIGHT)
+    for label, price in df.iloc[:, :2].dropna().itertuples(index=False):
+        key = FREIGHT_LABELS.get(str(label).strip(), str(label).strip())
+        if key in freight:
+            freight[key] = float(price)
+    return freight
+
+
+def _parse_customer(df):
+    """客户表为两列：字段、值"""
+    return {str(field).strip(): str(value).strip()
+            for field, value in df.iloc[:, :2].dropna(subset=[df.columns[0]]).fillna('').itertuples(index=False)}
+
+
+def _parse_exchange(df):
+    df = _rename(df, EXCHANGE_COLUMNS)
+    df['rate'] = pd.to_numeric(df['rate'], errors='coerce')
+    if 'date' in df:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return df.dropna(subset=['rate']).reset_index(drop=True)
+
+
+def _parse_fee(df):
+    """费用规则表每行一条规则，列见 fee_rules.FEE_RULE_COLUMNS，读取时即编译，规则有误时抛出 ValueError"""
+    return FeeSchedule(_rename(df, FEE_RULE_COLUMNS).to_dict('records'))
+
+
+PARSERS = {
+    'product': (_parse_product, str),
+    'hs': (_parse_hs, str),
+    'freight': (_parse_freight, None),
+    'customer': (_parse_customer, str),
+    'exchange': (_parse_exchange, None),
+    'fee': (_parse_fee, None),
+}
+
+
+def resolve_sources(sources):
+    """sources 可以是单个工作簿路径，也可以是 {数据类别: 路径} 字典"""
+    if sources is None:
+        sources = DEFAULT_DATA_PATH
+    if isinstance(sources, (str, os.PathLike)):
+        return {kind: os.fspath(sources) for kind in SHEETS}
+    return {kind: os.fspath(path) for kind, path in sources.items()}
+
+
+def sheet_sizes(path):
+    """工作簿中各工作表 XML 的大小（字节）：{工作表名称: 大小}，用于按数据量计算读取进度；无法解析时返回 {}"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+            rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+            targets = {rel.get('Id'): rel.get('Target') for rel in rels.findall('rel:Relationship', _XLSX_NS)}
+            sizes = {}
+            for sheet in workbook.findall('main:sheets/main:sheet', _XLSX_NS):
+                target = targets.get(sheet.get(_REL_ID), '')
+                member = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+                sizes[sheet.get('name')] = archive.getinfo(member).file_size
+            return sizes
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+        return {}
+
+
+def _weights(sources, kinds):
+    """各数据类别的进度权重：工作表数据量，取不到时按 1 计"""
+    sizes = {path: sheet_sizes(path) for path in {sources[kind] for kind in kinds}}
+    return {kind: max(sizes[sources[kind]].get(SHEETS[kind], 0), 1) for kind in kinds}
+
+
+def read_sheet(path, kind):
+    """读取并解析单张工作表（不走缓存）；可选工作表不存在时返回 None"""
+    parser, dtype = PARSERS[kind]
+    try:
+        df = pd.read_excel(path, sheet_name=SHEETS[kind], dtype=dtype)
+    except ValueError:
+        if kind in OPTIONAL_SHEETS:
+            return None
+        raise
+    return parser(df)
+
+
+def load_reference_data(sources=None, kinds=None, on_sheet_loaded=None):
+    """读取基础数据，只重新读取签名变化的工作表，变化的表在线程池中并发读取
+
+    kinds 为要读取的数据类别，默认全部；on_sheet_loaded(kind, from_cache, progress) 在每张表就绪后
+    （按完成顺序）在调用线程中回调，progress 为按工作表数据量计算的已完成比例 (0~1]，用于进度显示。
+    文件不存在时抛出 FileNotFoundError。
+    """
+    sources = resolve_sources(sources)
+    kinds = list(kinds or sources)
+    result = {}
+
+    stale = {}
+    for kind in kinds:
+        path = sources[kind]
+        signature = file_signature(path)
+        if signature is None:
+            raise FileNotFoundError(path)
+        with _cache_lock:
+            cached = _sheet_cache.get((path, kind))
+        if cached and cached[0] == signature:
+            result[kind] = cached[1]
+        else:
+            stale[kind] = signature
+
+    weights = _weights(sources, kinds) if on_sheet_loaded else dict.fromkeys(kinds, 1)
+    total, done = sum(weights.values()), 0
+    for kind in result:
+        done += weights[kind]
+        if on_sheet_loaded:
+            on_sheet_loaded(kind, True, done / total)
+    if not stale:
+        return result
+
+    # 每个线程单独打开工作簿（ExcelFile 不能跨线程共用），先读完的表先返回
+    with ThreadPoolExecutor(max_workers=min(len(stale), MAX_WORKERS)) as executor:
+        futures = {executor.submit(read_sheet, sources[kind], kind): kind for kind in stale}
+        for future in as_completed(futures):
+            kind = futures[future]
+            value = future.result()
+            with _cache_lock:
+                _sheet_cache[(sources[kind], kind)] = (stale[kind], value)
+            result[kind] = value
+            done += weights[kind]
+            if on_sheet_loaded:
+                on_sheet_loaded(kind, False, done / total)
+
+    return result
+
+
+def clear_cache():
+    """清空进程内缓存"""
+    with _cache_lock:
+        _sheet_cache.clear()
+
@@ -1,9 +1,28 @@
+import sqlite3
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime, timezone, timedelta
-import re
-import time
+from datetime import date, datetime, timezone, timedelta
+from data_loader import DEFAULT_DATA_PATH, DEFAULT_EXCHANGE_PAIR, DEFAULT_EXCHANGE_RATE, SHEETS
+from budget_engine import TRADE_TERMS, PAYMENTS, calc_reverse_cost, product_specs_table
+from budget_graph import BudgetGraph
+from quantity_parser import WEIGHT, VOLUME, COUNT, unit_mismatch
+from load_planner import effective_capacities, plan_load
+from inverse_solvers import break_even_price, price_for_margin, max_affordable_quantity
+from budget_table import budget_rows, render_html as render_budget_html, to_csv as budget_csv
+from budget_export import export_bytes, export_tempfile, pdf_available
+from fee_rules import DEFAULT_FEE_SCHEDULE
+from hs_tariff import DEFAULT_HS, RATE_FIELDS
+from order_lines import RESULT_LABELS as ORDER_LINE_LABELS, order_budget
+from reference_data import SAMPLE_REFERENCE, ReferenceData, current_reference, shared_reference
+from risk_simulation import (ORDER_FIELDS as RISK_ORDER_FIELDS, PERCENTILE_LABELS, annual_volatility, daily_returns,
+                             histogram_chart, margin_histogram, percentile_frame, read_history, risk_summary,
+                             simulate_margin)
+from scenario_store import LIST_LABELS, PAGE_SIZE, store_for
+from section_profiler import PROCESS_TIMINGS, SUMMARY_LABELS, RerunClock, SectionTimings, export_json, timed
+from sensitivity import (TERM_MATRIX_LABELS, profit_surface, heatmap_frame, break_even_frame, heatmap_chart,
+                         term_payment_matrix)
 
 # 设置北京时区
 beijing_tz = timezone(timedelta(hours=8))
@@ -12,6 +31,19 @@ def get_beijing_time():
     """获取当前北京时间"""
     return datetime.now(beijing_tz).strftime('%Y-%m-%d %H:%M:%S')
 
+# ==================== 分段计时 ====================
+def page_timings():
+    """本会话和全进程的分段耗时记录"""
+    if 'section_timings' not in st.session_state:
+        st.session_state.section_timings = SectionTimings()
+    return [st.session_state.section_timings, PROCESS_TIMINGS]
+
+def profiled(section):
+    """区域函数的计时装饰器"""
+    return timed(section, page_timings)
+
+rerun_clock = RerunClock(page_timings)
+
 # 页面配置
 st.set_page_config(
     page_title="出口预算表 - 技能大赛版",
@@ -216,6 +248,7 @@ st.markdown("""
 
 # 标题
 st.markdown('<div class="main-title">📊 出口预算表 - 全国职业院校技能大赛版</div>', unsafe_allow_html=True)
+rerun_clock.lap("样式和标题")
 
 # ==================== 初始化session state ====================
 if 'data_updated' not in st.session_state:
@@ -236,49 +269,42 @@ if 'total_cost' not in st.session_state:
     st.session_state.total_cost = 0.0
 if 'calculated' not in st.session_state:
     st.session_state.calculated = False
-if 'customer_data' not in st.session_state:
-    st.session_state.customer_data = {
-        'exporter_name': '平尼克国际贸易公司',
-        'exporter_name_short': '平尼克国际',
-        'exporter_name_en': 'Pinic International Trading',
-        'exporter_address': '菲律宾马尼拉宾农多马德里街513号',
-        'exporter_address_en': '513 Madrid Street Binondomanila,Philippines',
-        'exporter_contact': '阿卜杜勒贾里勒',
-        'exporter_contact_en': 'Abdul Jaleel',
-        'exporter_tel': '82-266-2402192',
-        'exporter_email': '19859639@yahoo.com',
-        'exporter_postal': '260335',
-        'exporter_org_code': '702104723',
-        'exporter_social_code': '921002127021047238',
-        'exporter_customs_code': '2100151282',
-        'exporter_inspection_code': '3100212576',
-        'importer_name': '罗伯茨世界贸易有限公司',
-        'importer_name_en': 'Roberts World Traders Inc.',
-        'importer_address': '加拿大不列颠哥伦比亚维多利亚白桦新月街4号',
-        'importer_address_en': '4 Aspen Crescent, Victoria, British Columbia, Canada',
-        'importer_contact': '艾伦·博尔赫斯',
-        'importer_contact_en': 'Alan Borges',
-        'importer_tel': '82-775-6178091',
-        'importer_email': '17548933@yahoo.com',
-        'importer_postal': '314640',
-        'importer_org_code': '560088060',
-        'importer_inspection_code': '2910087056',
-        'importer_customs_code': '2660935964'
-    }
+# 基础数据是进程内共享的只读快照，会话只保存引用；数据文件变化后换成新快照
+if 'reference' not in st.session_state:
+    st.session_state.reference = SAMPLE_REFERENCE
+else:
+    latest_reference = current_reference(st.session_state.reference)
+    if latest_reference is not st.session_state.reference:
+        st.session_state.reference = latest_reference
+        st.toast("数据文件已更新，已重新读取基础数据")
 if 'product_data' not in st.session_state:
     st.session_state.product_data = None
-if 'freight_data' not in st.session_state:
-    st.session_state.freight_data = None
+if 'hs_match' not in st.session_state:
+    st.session_state.hs_match = None
 if 'exchange_rate' not in st.session_state:
-    st.session_state.exchange_rate = 1.368
-if 'quantity' not in st.session_state:
-    st.session_state.quantity = 0.0
-if 'purchase_price' not in st.session_state:
-    st.session_state.purchase_price = 0.0
-if 'trade_term' not in st.session_state:
-    st.session_state.trade_term = "FOB"
-if 'payment' not in st.session_state:
-    st.session_state.payment = "T/T"
+    st.session_state.exchange_rate = DEFAULT_EXCHANGE_RATE
+if 'exchange_rate_input' not in st.session_state:
+    st.session_state.exchange_rate_input = DEFAULT_EXCHANGE_RATE
+if 'exchange_pair' not in st.session_state:
+    st.session_state.exchange_pair = DEFAULT_EXCHANGE_PAIR
+if 'quote_date' not in st.session_state:
+    st.session_state.quote_date = datetime.now(beijing_tz).date()
+if 'current_quote' not in st.session_state:
+    st.session_state.current_quote = None
+if 'budget_graph' not in st.session_state:
+    st.session_state.budget_graph = BudgetGraph()
+# 计算节点日志按整页重跑记录，片段单独重跑时追加
+st.session_state.budget_graph.reset_log()
+
+# 第二步各输入框的 key 和默认值
+TRADE_DEFAULTS = {
+    'quantity_input': 0.0, 'purchase_price_input': 0.0, 'account_balance': 1888000.0,
+    'trade_term_select': "FOB", 'payment_select': "T/T", 'expected_profit_rate': 15, 'transport_note': "普通",
+}
+for key, value in TRADE_DEFAULTS.items():
+    if key not in st.session_state:
+        st.session_state[key] = value
+rerun_clock.lap("会话初始化")
 
 # ==================== 清除数据的函数 ====================
 def clear_all_data():
@@ -291,76 +317,169 @@ def clear_all_data():
     st.session_state.suggested_price = 0.0
     st.session_state.total_cost = 0.0
     st.session_state.calculated = False
+    st.session_state.reference = SAMPLE_REFERENCE
+    st.session_state.fetch_notice = None
     st.session_state.product_data = None
-    st.session_state.freight_data = None
-    st.session_state.exchange_rate = 1.368
-    st.session_state.quantity = 0.0
-    st.session_state.purchase_price = 0.0
-    st.session_state.trade_term = "FOB"
-    st.session_state.payment = "T/T"
+    st.session_state.hs_match = None
+    st.session_state.exchange_rate = DEFAULT_EXCHANGE_RATE
+    st.session_state.exchange_rate_input = DEFAULT_EXCHANGE_RATE
+    st.session_state.current_quote = None
+    st.session_state.pop('order_lines', None)
+    for key in ['quantity_input', 'purchase_price_input', 'trade_term_select', 'payment_select']:
+        st.session_state[key] = TRADE_DEFAULTS[key]
 
-# ==================== 侧边栏 ====================
-with st.sidebar:
+# ==================== HS编码查找 ====================
+def apply_hs_code(code):
+    """按税率表最长前缀匹配填写HS编码信息行的其余七个字段"""
+    entry = st.session_state.reference.tariff.lookup(code)
+    st.session_state.hs_match = entry['hs_code'] if entry else None
+    if entry:
+        for field in ['customs_condition', 'inspection_type', 'legal_unit']:
+            st.session_state[field] = str(entry[field])
+        for field in RATE_FIELDS:
+            st.session_state[field] = float(entry[field])
+
+def on_hs_code_changed():
+    apply_hs_code(st.session_state.hs_code)
+
+# ==================== 商品选择 ====================
+# 第一步各输入框的 key 与商品字段的对应关系
+PRODUCT_FIELD_KEYS = {
+    'product_code': 'product_code_display', 'product_name': 'product_name_display',
+    'product_name_en': 'product_name_en_display', 'product_type': 'product_type_display',
+    'model_cn': 'model_cn_display', 'model_en': 'model_en_display', 'sales_unit': 'sales_unit_display',
+    'package_unit': 'package_unit_display', 'unit_conversion': 'unit_conversion_display',
+    'gross_weight': 'gross_weight_display', 'net_weight': 'net_weight_display',
+    'volume': 'volume_display', 'transport_desc': 'transport_desc_display',
+}
+
+def select_product(product):
+    """选中商品，并把商品字段填入第一步的输入框；商品带HS编码时一并填写HS编码信息"""
+    st.session_state.product_data = product
+    for field, key in PRODUCT_FIELD_KEYS.items():
+        st.session_state[key] = str((product or {}).get(field, ''))
+    if product and product.get('hs_code'):
+        st.session_state.hs_code = product['hs_code']
+    apply_hs_code(st.session_state.get('hs_code', DEFAULT_HS['hs_code']))
+
+def on_product_selected():
+    product = st.session_state.reference.catalog.get(st.session_state.product_select)
+    if product:
+        select_product(product)
+
+# ==================== 汇率查找 ====================
+def apply_exchange_rate():
+    """按货币对和报价日期，从汇率历史中取当天有效的汇率填入汇率输入框"""
+    store = st.session_state.reference.fx
+    if len(store):
+        st.session_state.exchange_rate_input = store.rate(
+            st.session_state.exchange_pair, st.session_state.quote_date, st.session_state.exchange_rate_input)
+
+# ==================== 载入已保存的报价方案 ====================
+def load_quote(quote):
+    """把保存的报价方案填回页面各输入框，并恢复运费和报价结果"""
+    inputs, budget = quote['inputs'], quote['budget']
+    product = st.session_state.reference.catalog.get(inputs.get('product_code', ''))
+    if product is None:
+        product = {field: inputs.get(field, '') for field in PRODUCT_FIELD_KEYS}
+        if not st.session_state.reference.from_file:
+            st.session_state.reference = ReferenceData([product])
+    select_product(product)
+
+    for field, value in DEFAULT_HS.items():
+        st.session_state[field] = type(value)(inputs.get(field, value))
+    st.session_state.hs_match = None
+    trade_fields = {'quantity_input': 'quantity', 'purchase_price_input': 'purchase_price',
+                    'account_balance': 'account_balance', 'trade_term_select': 'trade_term',
+                    'payment_select': 'payment', 'expected_profit_rate': 'expected_profit_rate',
+                    'transport_note': 'transport_note'}
+    for key, field in trade_fields.items():
+        if field in inputs:
+            st.session_state[key] = type(TRADE_DEFAULTS[key])(inputs[field])
+    st.session_state.exchange_pair = inputs.get('exchange_pair', DEFAULT_EXCHANGE_PAIR)
+    if inputs.get('quote_date'):
+        st.session_state.quote_date = date.fromisoformat(inputs['quote_date'])
+    st.session_state.exchange_rate = st.session_state.exchange_rate_input = float(inputs.get('exchange_rate', DEFAULT_EXCHANGE_RATE))
+
+    st.session_state.best_freight = float(inputs.get('best_freight', 0.0))
+    st.session_state.container_type = inputs.get('container_type', '')
+    st.session_state.containers_needed = inputs.get('containers_needed', 0)
+    st.session_state.best_freight_cny = st.session_state.best_freight * st.session_state.exchange_rate
+    st.session_state.suggested_price = float(budget.get('suggested_price', 0.0))
+    st.session_state.total_cost = float(budget.get('quote_cost', 0.0))
+    st.session_state.calculated = st.session_state.best_freight > 0
+    st.session_state.data_updated = True
+
+def load_saved_quote(store, quote_id):
+    quote = store.load(quote_id)
+    if quote:
+        load_quote(quote)
+
+# ==================== 侧边栏：数据抓取控制 ====================
+@st.fragment
+@profiled("数据抓取")
+def data_controls():
+    """数据抓取控制：按钮只重新运行本区域，数据真正变化后才刷新整页"""
     st.markdown("## 📁 数据抓取控制")
+    data_path = st.text_input("数据文件", value=DEFAULT_DATA_PATH, key="data_path")
     
     col_btn1, col_btn2 = st.columns(2)
     with col_btn1:
         if st.button("🚀 抓取数据", use_container_width=True):
             progress_bar = st.progress(0)
             status_text = st.empty()
-            
-            steps = [
-                "正在连接Power Automate Desktop...",
-                "正在打开Excel文件 C:\\Basic Information\\Data.xlsx...",
-                "正在读取商品信息表...",
-                "正在读取HS编码表...",
-                "正在读取运费单价表...",
-                "正在读取客户信息表...",
-                "正在读取汇率表...",
-                "数据抓取完成！"
-            ]
-            
-            for i, step in enumerate(steps):
-                status_text.text(f"⏳ {step}")
-                progress_bar.progress((i + 1) * 100 // len(steps))
-                time.sleep(0.5)
-            
+            loaded_sheets = []
+
+            def on_sheet_loaded(kind, from_cache, progress):
+                # 各表并发读取，按完成顺序回调；进度按数据量计算
+                loaded_sheets.append(SHEETS[kind] + ('（未变化）' if from_cache else ''))
+                status_text.text(f"⏳ 已读取 {len(loaded_sheets)}/{len(SHEETS)}：{'、'.join(loaded_sheets)}")
+                progress_bar.progress(progress)
+
+            try:
+                reference = shared_reference(data_path, on_sheet_loaded=on_sheet_loaded)
+                st.session_state.fetch_notice = None
+            except FileNotFoundError:
+                reference = SAMPLE_REFERENCE
+                st.session_state.fetch_notice = f"未找到 {data_path}，使用示例数据"
+            except ValueError as e:
+                # 如费用规则表填写有误：保留原有数据
+                progress_bar.empty()
+                status_text.empty()
+                st.error(f"数据文件有误，未更新：{e}")
+                return
+
             st.session_state.data_updated = True
             st.session_state.last_update_time = get_beijing_time()
-            st.session_state.product_data = {
-                'product_code': 'P010',
-                'product_name': '自动售货机',
-                'product_name_en': 'Vending machine',
-                'product_type': '机器、机械器具、电气设备及其零件',
-                'model_cn': '型号：MF-782',
-                'model_en': 'Model:mf-782',
-                'sales_unit': '台(SET)',
-                'package_unit': '托盘(PALLET)',
-                'unit_conversion': '1 SET/PALLET',
-                'gross_weight': '280.00KGS/托盘',
-                'net_weight': '220.00KGS/托盘',
-                'volume': '2.55CBM/托盘',
-                'transport_desc': '无'
-            }
-            st.session_state.freight_data = {
-                'lcl_w_normal': 73, 'lcl_m_normal': 88,
-                'c20_normal': 1452, 'c40_normal': 2613, 'c40hc_normal': 3135,
-                'lcl_w_frozen': 146, 'lcl_m_frozen': 189,
-                'c20_frozen': 2903, 'c40_frozen': 5225, 'c40rh_frozen': 6270
-            }
-            st.session_state.exchange_rate = 1.368
+            st.session_state.reference = reference
+            select_product(reference.products[0] if reference.products else None)
+            if reference.from_file:
+                apply_exchange_rate()
+            else:
+                st.session_state.exchange_rate_input = DEFAULT_EXCHANGE_RATE
             
-            progress_bar.empty()
-            status_text.empty()
-            st.markdown('<p class="success-small">✅ 抓取成功！</p>', unsafe_allow_html=True)
+            # 基础数据变化影响整页，刷新全部内容
+            st.rerun()
     
     with col_btn2:
         if st.button("🧹 清除数据", use_container_width=True):
             clear_all_data()
             st.rerun()
     
+    if st.session_state.get('fetch_notice'):
+        st.warning(st.session_state.fetch_notice)
+    elif st.session_state.get('last_update_time'):
+        st.markdown('<p class="success-small">✅ 抓取成功！</p>', unsafe_allow_html=True)
+    skipped_codes = st.session_state.reference.tariff.skipped
+    if skipped_codes:
+        shown = '、'.join(skipped_codes[:10]) + (f" 等{len(skipped_codes)}个" if len(skipped_codes) > 10 else '')
+        st.warning(f"HS编码税率表中以下编码位数不是10/8/6/4位，已忽略：{shown}")
     if st.session_state.get('last_update_time'):
         st.caption(f"最后更新: {st.session_state.last_update_time}")
+
+# ==================== 侧边栏 ====================
+with st.sidebar:
+    data_controls()
     
     st.markdown("---")
     
@@ -379,16 +498,7 @@ with st.sidebar:
     # ==================== 物流信息（运费单价表-并列表格）====================
     st.markdown("## 📦 运费单价表")
     
-    # 安全获取物流数据
-    if st.session_state.freight_data:
-        freight_data = st.session_state.freight_data
-    else:
-        freight_data = {
-            'lcl_w_normal': 73, 'lcl_m_normal': 88,
-            'c20_normal': 1452, 'c40_normal': 2613, 'c40hc_normal': 3135,
-            'lcl_w_frozen': 146, 'lcl_m_frozen': 189,
-            'c20_frozen': 2903, 'c40_frozen': 5225, 'c40rh_frozen': 6270
-        }
+    freight_data = st.session_state.reference.freight
     
     # 并列表格显示
     col_freight1, col_freight2 = st.columns(2)
@@ -418,35 +528,37 @@ with st.sidebar:
         </table>
         """
         st.markdown(freight_table2, unsafe_allow_html=True)
+rerun_clock.lap("侧边栏")
 
 # ==================== 公司信息（左右两列紧凑显示）====================
 st.markdown('<div class="company-section">', unsafe_allow_html=True)
+customer = st.session_state.reference.customer
 
 # 出口商信息（左侧）
 st.markdown("**🏭 出口商信息**")
 st.markdown(f"""
 <div class="company-row">
-    <div class="company-item"><span class="company-label">公司全称：</span><span class="company-value">{st.session_state.customer_data["exporter_name"]}</span></div>
-    <div class="company-item"><span class="company-label">公司简称：</span><span class="company-value">{st.session_state.customer_data["exporter_name_short"]}</span></div>
-    <div class="company-item"><span class="company-label">英文名称：</span><span class="company-value">{st.session_state.customer_data["exporter_name_en"]}</span></div>
+    <div class="company-item"><span class="company-label">公司全称：</span><span class="company-value">{customer["exporter_name"]}</span></div>
+    <div class="company-item"><span class="company-label">公司简称：</span><span class="company-value">{customer["exporter_name_short"]}</span></div>
+    <div class="company-item"><span class="company-label">英文名称：</span><span class="company-value">{customer["exporter_name_en"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">公司地址：</span><span class="company-value">{st.session_state.customer_data["exporter_address"]}</span></div>
-    <div class="company-item"><span class="company-label">地址英文：</span><span class="company-value">{st.session_state.customer_data["exporter_address_en"]}</span></div>
+    <div class="company-item"><span class="company-label">公司地址：</span><span class="company-value">{customer["exporter_address"]}</span></div>
+    <div class="company-item"><span class="company-label">地址英文：</span><span class="company-value">{customer["exporter_address_en"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">企业法人：</span><span class="company-value">{st.session_state.customer_data["exporter_contact"]} ({st.session_state.customer_data["exporter_contact_en"]})</span></div>
-    <div class="company-item"><span class="company-label">电话/传真：</span><span class="company-value">{st.session_state.customer_data["exporter_tel"]}</span></div>
-    <div class="company-item"><span class="company-label">电子邮件：</span><span class="company-value">{st.session_state.customer_data["exporter_email"]}</span></div>
+    <div class="company-item"><span class="company-label">企业法人：</span><span class="company-value">{customer["exporter_contact"]} ({customer["exporter_contact_en"]})</span></div>
+    <div class="company-item"><span class="company-label">电话/传真：</span><span class="company-value">{customer["exporter_tel"]}</span></div>
+    <div class="company-item"><span class="company-label">电子邮件：</span><span class="company-value">{customer["exporter_email"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">邮政编码：</span><span class="company-value">{st.session_state.customer_data["exporter_postal"]}</span></div>
-    <div class="company-item"><span class="company-label">组织机构代码：</span><span class="company-value">{st.session_state.customer_data["exporter_org_code"]}</span></div>
-    <div class="company-item"><span class="company-label">社会信用代码：</span><span class="company-value">{st.session_state.customer_data["exporter_social_code"]}</span></div>
+    <div class="company-item"><span class="company-label">邮政编码：</span><span class="company-value">{customer["exporter_postal"]}</span></div>
+    <div class="company-item"><span class="company-label">组织机构代码：</span><span class="company-value">{customer["exporter_org_code"]}</span></div>
+    <div class="company-item"><span class="company-label">社会信用代码：</span><span class="company-value">{customer["exporter_social_code"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">海关代码：</span><span class="company-value">{st.session_state.customer_data["exporter_customs_code"]}</span></div>
-    <div class="company-item"><span class="company-label">报检登记号：</span><span class="company-value">{st.session_state.customer_data["exporter_inspection_code"]}</span></div>
+    <div class="company-item"><span class="company-label">海关代码：</span><span class="company-value">{customer["exporter_customs_code"]}</span></div>
+    <div class="company-item"><span class="company-label">报检登记号：</span><span class="company-value">{customer["exporter_inspection_code"]}</span></div>
 </div>
 """, unsafe_allow_html=True)
 
@@ -456,178 +568,277 @@ st.markdown("<hr style='margin: 10px 0; border-top: 1px dashed #2a5298;'>", unsa
 st.markdown("**🌍 进口商信息**")
 st.markdown(f"""
 <div class="company-row">
-    <div class="company-item"><span class="company-label">公司名称：</span><span class="company-value">{st.session_state.customer_data["importer_name"]}</span></div>
-    <div class="company-item"><span class="company-label">英文名称：</span><span class="company-value">{st.session_state.customer_data["importer_name_en"]}</span></div>
+    <div class="company-item"><span class="company-label">公司名称：</span><span class="company-value">{customer["importer_name"]}</span></div>
+    <div class="company-item"><span class="company-label">英文名称：</span><span class="company-value">{customer["importer_name_en"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">公司地址：</span><span class="company-value">{st.session_state.customer_data["importer_address"]}</span></div>
-    <div class="company-item"><span class="company-label">地址英文：</span><span class="company-value">{st.session_state.customer_data["importer_address_en"]}</span></div>
+    <div class="company-item"><span class="company-label">公司地址：</span><span class="company-value">{customer["importer_address"]}</span></div>
+    <div class="company-item"><span class="company-label">地址英文：</span><span class="company-value">{customer["importer_address_en"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">联系人：</span><span class="company-value">{st.session_state.customer_data["importer_contact"]} ({st.session_state.customer_data["importer_contact_en"]})</span></div>
-    <div class="company-item"><span class="company-label">电话：</span><span class="company-value">{st.session_state.customer_data["importer_tel"]}</span></div>
-    <div class="company-item"><span class="company-label">邮箱：</span><span class="company-value">{st.session_state.customer_data["importer_email"]}</span></div>
+    <div class="company-item"><span class="company-label">联系人：</span><span class="company-value">{customer["importer_contact"]} ({customer["importer_contact_en"]})</span></div>
+    <div class="company-item"><span class="company-label">电话：</span><span class="company-value">{customer["importer_tel"]}</span></div>
+    <div class="company-item"><span class="company-label">邮箱：</span><span class="company-value">{customer["importer_email"]}</span></div>
 </div>
 <div class="company-row">
-    <div class="company-item"><span class="company-label">邮政编码：</span><span class="company-value">{st.session_state.customer_data["importer_postal"]}</span></div>
-    <div class="company-item"><span class="company-label">组织机构代码：</span><span class="company-value">{st.session_state.customer_data["importer_org_code"]}</span></div>
-    <div class="company-item"><span class="company-label">报检登记号：</span><span class="company-value">{st.session_state.customer_data["importer_inspection_code"]}</span></div>
-    <div class="company-item"><span class="company-label">海关代码：</span><span class="company-value">{st.session_state.customer_data["importer_customs_code"]}</span></div>
+    <div class="company-item"><span class="company-label">邮政编码：</span><span class="company-value">{customer["importer_postal"]}</span></div>
+    <div class="company-item"><span class="company-label">组织机构代码：</span><span class="company-value">{customer["importer_org_code"]}</span></div>
+    <div class="company-item"><span class="company-label">报检登记号：</span><span class="company-value">{customer["importer_inspection_code"]}</span></div>
+    <div class="company-item"><span class="company-label">海关代码：</span><span class="company-value">{customer["importer_customs_code"]}</span></div>
 </div>
 """, unsafe_allow_html=True)
 
 st.markdown('</div>', unsafe_allow_html=True)
+rerun_clock.lap("公司信息")
 
-# ==================== HS信息（带抬头）====================
-st.markdown('<div class="section-title">🏷️ HS编码信息</div>', unsafe_allow_html=True)
-
-st.markdown('<div class="hs-row">', unsafe_allow_html=True)
-
-# 第一行：抬头
-col_hs_header1, col_hs_header2, col_hs_header3, col_hs_header4, col_hs_header5, col_hs_header6, col_hs_header7, col_hs_header8 = st.columns(8)
-with col_hs_header1:
-    st.markdown('<div class="hs-header">HS编码</div>', unsafe_allow_html=True)
-with col_hs_header2:
-    st.markdown('<div class="hs-header">监管条件</div>', unsafe_allow_html=True)
-with col_hs_header3:
-    st.markdown('<div class="hs-header">检验检疫</div>', unsafe_allow_html=True)
-with col_hs_header4:
-    st.markdown('<div class="hs-header">法定单位</div>', unsafe_allow_html=True)
-with col_hs_header5:
-    st.markdown('<div class="hs-header">优惠税率%</div>', unsafe_allow_html=True)
-with col_hs_header6:
-    st.markdown('<div class="hs-header">增值税%</div>', unsafe_allow_html=True)
-with col_hs_header7:
-    st.markdown('<div class="hs-header">出口税率%</div>', unsafe_allow_html=True)
-with col_hs_header8:
-    st.markdown('<div class="hs-header">退税率%</div>', unsafe_allow_html=True)
-
-# 第二行：输入框
-col_hs1, col_hs2, col_hs3, col_hs4, col_hs5, col_hs6, col_hs7, col_hs8 = st.columns(8)
-with col_hs1:
-    hs_code = st.text_input("##", value="8476810000", key="hs_code", label_visibility="collapsed")
-with col_hs2:
-    customs_condition = st.text_input("##", value="无", key="customs_condition", label_visibility="collapsed")
-with col_hs3:
-    inspection_type = st.text_input("##", value="无", key="inspection_type", label_visibility="collapsed")
-with col_hs4:
-    legal_unit = st.text_input("##", value="台(SET)", key="legal_unit", label_visibility="collapsed")
-with col_hs5:
-    pref_tax_rate = st.number_input("##", value=50.0, key="pref_tax_rate", label_visibility="collapsed", step=1.0)
-with col_hs6:
-    vat_rate = st.number_input("##", value=13.0, key="vat_rate", label_visibility="collapsed", step=1.0)
-with col_hs7:
-    export_tax_rate = st.number_input("##", value=0.0, key="export_tax_rate", label_visibility="collapsed", step=1.0)
-with col_hs8:
-    export_rebate_rate = st.number_input("##", value=13.0, key="export_rebate_rate", label_visibility="collapsed", step=1.0)
+# ==================== 报价工作区 ====================
+# HS编码、产品、交易信息和计算结果互相依赖，放在同一个 fragment 中：
+# 修改其中任何输入只重新运行工作区，不再重新注入样式、公司信息和运费单价表。
+# 测试报价、敏感性分析和反向求解只依赖自身输入，单独作为嵌套 fragment。
 
-st.markdown('</div>', unsafe_allow_html=True)
+@profiled("HS编码信息")
+def hs_section():
+    """HS编码信息行，返回八个字段"""
+    st.markdown('<div class="section-title">🏷️ HS编码信息</div>', unsafe_allow_html=True)
 
-# ==================== 产品信息 ====================
-st.markdown("""
-<div class="step-container">
-    <div class="step-header">
-        <span class="step-badge">第一步</span>
-        <span class="step-title">产品信息</span>
+    for field, value in DEFAULT_HS.items():
+        if field not in st.session_state:
+            st.session_state[field] = value
+
+    st.markdown('<div class="hs-row">', unsafe_allow_html=True)
+
+    # 第一行：抬头
+    col_hs_header1, col_hs_header2, col_hs_header3, col_hs_header4, col_hs_header5, col_hs_header6, col_hs_header7, col_hs_header8 = st.columns(8)
+    with col_hs_header1:
+        st.markdown('<div class="hs-header">HS编码</div>', unsafe_allow_html=True)
+    with col_hs_header2:
+        st.markdown('<div class="hs-header">监管条件</div>', unsafe_allow_html=True)
+    with col_hs_header3:
+        st.markdown('<div class="hs-header">检验检疫</div>', unsafe_allow_html=True)
+    with col_hs_header4:
+        st.markdown('<div class="hs-header">法定单位</div>', unsafe_allow_html=True)
+    with col_hs_header5:
+        st.markdown('<div class="hs-header">优惠税率%</div>', unsafe_allow_html=True)
+    with col_hs_header6:
+        st.markdown('<div class="hs-header">增值税%</div>', unsafe_allow_html=True)
+    with col_hs_header7:
+        st.markdown('<div class="hs-header">出口税率%</div>', unsafe_allow_html=True)
+    with col_hs_header8:
+        st.markdown('<div class="hs-header">退税率%</div>', unsafe_allow_html=True)
+
+    # 第二行：输入框
+    col_hs1, col_hs2, col_hs3, col_hs4, col_hs5, col_hs6, col_hs7, col_hs8 = st.columns(8)
+    with col_hs1:
+        hs_code = st.text_input("##", key="hs_code", label_visibility="collapsed", on_change=on_hs_code_changed)
+    with col_hs2:
+        customs_condition = st.text_input("##", key="customs_condition", label_visibility="collapsed")
+    with col_hs3:
+        inspection_type = st.text_input("##", key="inspection_type", label_visibility="collapsed")
+    with col_hs4:
+        legal_unit = st.text_input("##", key="legal_unit", label_visibility="collapsed")
+    with col_hs5:
+        pref_tax_rate = st.number_input("##", key="pref_tax_rate", label_visibility="collapsed", step=1.0)
+    with col_hs6:
+        vat_rate = st.number_input("##", key="vat_rate", label_visibility="collapsed", step=1.0)
+    with col_hs7:
+        export_tax_rate = st.number_input("##", key="export_tax_rate", label_visibility="collapsed", step=1.0)
+    with col_hs8:
+        export_rebate_rate = st.number_input("##", key="export_rebate_rate", label_visibility="collapsed", step=1.0)
+
+    if st.session_state.hs_match:
+        st.caption(f"已按税率表 {st.session_state.hs_match} 自动填写，可手工修改")
+    elif len(st.session_state.reference.tariff):
+        st.caption("税率表中未找到该编码，请手工填写")
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    return {
+        'hs_code': hs_code, 'customs_condition': customs_condition, 'inspection_type': inspection_type,
+        'legal_unit': legal_unit, 'pref_tax_rate': pref_tax_rate, 'vat_rate': vat_rate,
+        'export_tax_rate': export_tax_rate, 'export_rebate_rate': export_rebate_rate,
+    }
+
+
+@profiled("商品信息")
+def product_section():
+    """第一步：产品信息，未抓取数据时返回 None"""
+    st.markdown("""
+    <div class="step-container">
+        <div class="step-header">
+            <span class="step-badge">第一步</span>
+            <span class="step-title">产品信息</span>
+        </div>
     </div>
-</div>
-""", unsafe_allow_html=True)
+    """, unsafe_allow_html=True)
+
+    if not (st.session_state.data_updated and st.session_state.product_data):
+        st.markdown("""
+        <div class="empty-state">
+            ⏳ 请点击侧边栏的"抓取数据"按钮获取产品信息
+        </div>
+        """, unsafe_allow_html=True)
+        return None
+
+    product_data = st.session_state.product_data
+    for field, key in PRODUCT_FIELD_KEYS.items():
+        if key not in st.session_state:
+            st.session_state[key] = str(product_data.get(field, ''))
+
+    # 商品搜索：按编号、中英文名称或HS编码的前缀/子串查找
+    catalog = st.session_state.reference.catalog
+    col_search1, col_search2 = st.columns([1, 2])
+    with col_search1:
+        query = st.text_input("🔍 搜索商品", placeholder="编号 / 中英文名称 / HS编码", key="product_query")
+    matches = catalog.search(query, limit=50)
+    options = [p['product_code'] for p in matches]
+    current_code = str(product_data.get('product_code', ''))
+    if current_code not in options:
+        options.insert(0, current_code)
+    with col_search2:
+        st.selectbox(f"选择商品（共{len(catalog)}个）", options, index=options.index(current_code),
+                     format_func=lambda code: f"{code}  {(catalog.get(code) or product_data).get('product_name', '')}",
+                     key="product_select", on_change=on_product_selected)
 
-if st.session_state.data_updated and st.session_state.product_data:
     col_prod1, col_prod2 = st.columns(2)
 
     with col_prod1:
-        product_code = st.text_input("商品编号", value=st.session_state.product_data.get('product_code', ''), key="product_code_display")
-        product_name = st.text_input("商品名称", value=st.session_state.product_data.get('product_name', ''), key="product_name_display")
-        product_name_en = st.text_input("英文名称", value=st.session_state.product_data.get('product_name_en', ''), key="product_name_en_display")
-        product_type = st.text_input("货物类型", value=st.session_state.product_data.get('product_type', ''), key="product_type_display")
-        model_cn = st.text_input("规格型号(中文)", value=st.session_state.product_data.get('model_cn', ''), key="model_cn_display")
-        model_en = st.text_input("规格型号(英文)", value=st.session_state.product_data.get('model_en', ''), key="model_en_display")
+        product_code = st.text_input("商品编号", key="product_code_display")
+        product_name = st.text_input("商品名称", key="product_name_display")
+        product_name_en = st.text_input("英文名称", key="product_name_en_display")
+        product_type = st.text_input("货物类型", key="product_type_display")
+        model_cn = st.text_input("规格型号(中文)", key="model_cn_display")
+        model_en = st.text_input("规格型号(英文)", key="model_en_display")
 
     with col_prod2:
-        sales_unit = st.text_input("销售单位", value=st.session_state.product_data.get('sales_unit', ''), key="sales_unit_display")
-        package_unit = st.text_input("包装单位", value=st.session_state.product_data.get('package_unit', ''), key="package_unit_display")
-        unit_conversion = st.text_input("单位换算", value=st.session_state.product_data.get('unit_conversion', ''), key="unit_conversion_display")
-        gross_weight = st.text_input("毛重", value=st.session_state.product_data.get('gross_weight', ''), key="gross_weight_display")
-        net_weight = st.text_input("净重", value=st.session_state.product_data.get('net_weight', ''), key="net_weight_display")
-        volume = st.text_input("体积", value=st.session_state.product_data.get('volume', ''), key="volume_display")
-        transport_desc = st.text_input("运输说明", value=st.session_state.product_data.get('transport_desc', ''), key="transport_desc_display")
-else:
+        sales_unit = st.text_input("销售单位", key="sales_unit_display")
+        package_unit = st.text_input("包装单位", key="package_unit_display")
+        unit_conversion = st.text_input("单位换算", key="unit_conversion_display")
+        gross_weight = st.text_input("毛重", key="gross_weight_display")
+        net_weight = st.text_input("净重", key="net_weight_display")
+        volume = st.text_input("体积", key="volume_display")
+        transport_desc = st.text_input("运输说明", key="transport_desc_display")
+
+    return {
+        'product_code': product_code, 'product_name': product_name, 'product_name_en': product_name_en,
+        'product_type': product_type, 'model_cn': model_cn, 'model_en': model_en,
+        'sales_unit': sales_unit, 'package_unit': package_unit, 'unit_conversion': unit_conversion,
+        'gross_weight': gross_weight, 'net_weight': net_weight, 'volume': volume, 'transport_desc': transport_desc,
+    }
+
+
+@profiled("交易信息")
+def trade_section():
+    """第二步：交易信息"""
     st.markdown("""
-    <div class="empty-state">
-        ⏳ 请点击侧边栏的"抓取数据"按钮获取产品信息
+    <div class="step-container">
+        <div class="step-header">
+            <span class="step-badge">第二步</span>
+            <span class="step-title">交易信息</span>
+        </div>
     </div>
     """, unsafe_allow_html=True)
 
-# ==================== 交易信息 ====================
-st.markdown("""
-<div class="step-container">
-    <div class="step-header">
-        <span class="step-badge">第二步</span>
-        <span class="step-title">交易信息</span>
-    </div>
-</div>
-""", unsafe_allow_html=True)
+    col_trade1, col_trade2, col_trade3 = st.columns(3)
 
-col_trade1, col_trade2, col_trade3 = st.columns(3)
+    with col_trade1:
+        quantity = st.number_input("交易数量", step=1.0, key="quantity_input")
+        purchase_price = st.number_input("采购单价", step=100.0, format="%.2f", key="purchase_price_input")
+
+    with col_trade2:
+        account_balance = st.number_input("账户余额", step=1000.0, format="%.2f", key="account_balance")
+        col_fx1, col_fx2 = st.columns(2)
+        with col_fx1:
+            pairs = st.session_state.reference.fx.pairs or [DEFAULT_EXCHANGE_PAIR]
+            if st.session_state.exchange_pair not in pairs:
+                pairs = [st.session_state.exchange_pair] + pairs
+            exchange_pair = st.selectbox("货币对", pairs, key="exchange_pair", on_change=apply_exchange_rate)
+        with col_fx2:
+            quote_date = st.date_input("报价日期", key="quote_date", on_change=apply_exchange_rate)
+        exchange_rate_input = st.number_input(f"{exchange_pair}汇率", step=0.001, format="%.3f", key="exchange_rate_input")
+
+    with col_trade3:
+        trade_term = st.selectbox("贸易术语", TRADE_TERMS, key="trade_term_select")
+        payment = st.selectbox("支付方式", PAYMENTS, key="payment_select")
+        expected_profit_rate = st.slider("预期利润率%", 0, 50, key="expected_profit_rate")
+        transport_note = st.selectbox("运输要求", ["普通", "冷藏", "冷冻"], key="transport_note")
+
+    # 更新session state中的汇率
+    st.session_state.exchange_rate = float(exchange_rate_input)
+
+    return {
+        'quantity': quantity, 'purchase_price': purchase_price, 'account_balance': account_balance,
+        'trade_term': trade_term, 'payment': payment, 'expected_profit_rate': expected_profit_rate,
+        'transport_note': transport_note, 'exchange_pair': exchange_pair, 'quote_date': quote_date,
+        'exchange_rate': float(exchange_rate_input),
+    }
 
-with col_trade1:
-    quantity_val = float(st.session_state.quantity) if st.session_state.quantity > 0 else 0.0
-    purchase_price_val = float(st.session_state.purchase_price) if st.session_state.purchase_price > 0 else 0.0
-    
-    quantity = st.number_input("交易数量", value=quantity_val, step=1.0, key="quantity_input")
-    purchase_price = st.number_input("采购单价", value=purchase_price_val, step=100.0, format="%.2f", key="purchase_price_input")
-
-with col_trade2:
-    account_balance = st.number_input("账户余额", value=1888000.0, step=1000.0, format="%.2f", key="account_balance")
-    exchange_rate_input = st.number_input("USD/CAD汇率", value=float(st.session_state.exchange_rate), step=0.001, format="%.3f", key="exchange_rate_input")
-
-with col_trade3:
-    trade_term = st.selectbox("贸易术语", ["EXW", "FCA", "FAS", "FOB", "CFR", "CIF", "CIP", "DAP", "DPU", "DDP"], 
-                             index=3 if st.session_state.trade_term == "FOB" else 0, key="trade_term_select")
-    payment = st.selectbox("支付方式", ["T/T", "L/C", "D/P", "T/T+LC"], 
-                          index=0 if st.session_state.payment == "T/T" else 1, key="payment_select")
-    expected_profit_rate = st.slider("预期利润率%", 0, 50, 15, key="expected_profit_rate")
-    transport_note = st.selectbox("运输要求", ["普通", "冷藏", "冷冻"], key="transport_note")
-
-# 更新session state中的交易信息
-st.session_state.quantity = float(quantity)
-st.session_state.purchase_price = float(purchase_price)
-st.session_state.trade_term = trade_term
-st.session_state.payment = payment
-st.session_state.exchange_rate = float(exchange_rate_input)
 
 # ==================== 提取数值用于计算 ====================
-def extract_number(text):
-    try:
-        numbers = re.findall(r"[-+]?\d*\.\d+|\d+", str(text))
-        return float(numbers[0]) if numbers else 0.0
-    except:
-        return 0.0
-
-# 获取运费单价的值
-if st.session_state.freight_data:
-    container_20_normal = st.session_state.freight_data.get('c20_normal', 1452)
-    container_20_frozen = st.session_state.freight_data.get('c20_frozen', 2903)
-else:
-    container_20_normal = 1452
-    container_20_frozen = 2903
-
-# 只有有数据时才计算
-if st.session_state.data_updated and st.session_state.product_data and quantity > 0 and purchase_price > 0:
-    single_gross = extract_number(gross_weight)
-    single_net = extract_number(net_weight)
-    single_volume = extract_number(volume)
-    units_per_package = extract_number(unit_conversion)
-
-    if units_per_package > 0:
-        total_packages = np.ceil(quantity / units_per_package)
-    else:
-        total_packages = quantity
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_profit_surface(test_prices, exchange_rates, quantities, specs, purchase_price, vat_rate,
+                          export_rebate_rate, freight_data, transport_note, trade_term, capacities=None, fee_rules=None):
+    """缓存利润敏感性曲面，只有网格、订单参数或费用规则变化时才重新计算"""
+    return profit_surface(test_prices, exchange_rates, quantities, specs, purchase_price, vat_rate,
+                          export_rebate_rate, freight_data, transport_note, trade_term, capacities, fee_rules)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_risk_simulation(order, exchange_rate, best_freight, test_price, horizon_days, freight_volatility,
+                           fx_volatility, correlation, freight_returns, fx_returns, draws, fee_rules=None):
+    """缓存风险模拟的汇总、直方图分箱和分位表，页面其他输入变化时不重新抽样"""
+    simulation = simulate_margin(order, exchange_rate, best_freight, test_price, horizon_days, freight_volatility,
+                                 fx_volatility, correlation, freight_returns, fx_returns, draws, fee_rules=fee_rules)
+    summary = risk_summary(simulation, order['expected_profit_rate'] / 100.0)
+    return summary, margin_histogram(simulation), percentile_frame(simulation)
 
-    total_gross = total_packages * single_gross
-    total_net = total_packages * single_net
-    total_volume = total_packages * single_volume
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_term_matrix(quantity, purchase_price, vat_rate, export_rebate_rate, exchange_rate, expected_profit_rate,
+                       total_volume, best_freight, test_price, inspection_type, transport_note, fee_rules=None):
+    """缓存 贸易术语 × 支付方式 矩阵，只有订单参数、测试报价或费用规则变化时才重新计算"""
+    return term_payment_matrix(quantity, purchase_price, vat_rate, export_rebate_rate, exchange_rate,
+                               expected_profit_rate, total_volume, best_freight, test_price, inspection_type,
+                               transport_note, fee_rules)
+
+
+def calc_budget(order, test_price=None):
+    """用当前页面输入更新计算图并取预算结果，只重算输入变化影响到的字段；总体积取自 cargo_section 的计算结果"""
+    graph = st.session_state.budget_graph
+    graph.update(quantity=order['quantity'], purchase_price=order['purchase_price'], vat_rate=order['vat_rate'],
+                 export_rebate_rate=order['export_rebate_rate'], exchange_rate=st.session_state.exchange_rate,
+                 expected_profit_rate=order['expected_profit_rate'], best_freight=st.session_state.best_freight,
+                 trade_term=order['trade_term'], payment=order['payment'], inspection_type=order['inspection_type'],
+                 transport_note=order['transport_note'], fee_rules=st.session_state.reference.fee_rules)
+    if test_price is None:
+        return graph.budget()
+    graph.update(test_price=test_price)
+    return {**graph.budget(), **graph.reverse()}
+
+
+@profiled("货物总量")
+def cargo_section(order):
+    """货物总量计算，把单件规格和总量写回 order"""
+    graph = st.session_state.budget_graph
+    graph.update(gross_weight=order['gross_weight'], net_weight=order['net_weight'], volume=order['volume'],
+                 unit_conversion=order['unit_conversion'], quantity=order['quantity'])
+    single_gross = graph.get('single_gross')
+    single_net = graph.get('single_net')
+    single_volume = graph.get('single_volume')
+    units_per_package = graph.get('units_per_package')
+    quantity = order['quantity']
+
+    mismatched = [f"{label}（{unit}）" for label, text, kind in (
+        ('毛重', order['gross_weight'], WEIGHT), ('净重', order['net_weight'], WEIGHT),
+        ('体积', order['volume'], VOLUME), ('单位换算', order['unit_conversion'], COUNT))
+        if (unit := unit_mismatch(text, kind))]
+    if mismatched:
+        st.warning(f"以下字段单位无法识别为对应类别，已按0计算：{'、'.join(mismatched)}")
+
+    totals = graph.get('totals')
+    total_packages = totals['total_packages']
+    order['specs'] = {'units_per_package': units_per_package, 'single_gross': single_gross,
+                      'single_net': single_net, 'single_volume': single_volume}
+    order.update(totals)
 
     # ==================== 货物总量计算 ====================
     st.markdown("### 📦 货物总量计算")
@@ -636,16 +847,54 @@ if st.session_state.data_updated and st.session_state.product_data and quantity
         st.metric("总包装数", f"{int(total_packages)}个")
         st.caption(f"公式: ⌈{quantity} ÷ {units_per_package:.0f}⌉")
     with col_m2:
-        st.metric("总毛重", f"{total_gross:,.0f} KGS")
+        st.metric("总毛重", f"{totals['total_gross']:,.0f} KGS")
         st.caption(f"公式: {int(total_packages)} × {single_gross:.0f}")
     with col_m3:
-        st.metric("总净重", f"{total_net:,.0f} KGS")
+        st.metric("总净重", f"{totals['total_net']:,.0f} KGS")
         st.caption(f"公式: {int(total_packages)} × {single_net:.0f}")
     with col_m4:
-        st.metric("总体积", f"{total_volume:.2f} CBM")
+        st.metric("总体积", f"{totals['total_volume']:.2f} CBM")
         st.caption(f"公式: {int(total_packages)} × {single_volume:.2f}")
 
-    # ==================== 计算运费和报价 ====================
+
+@profiled("托盘装柜规划")
+def load_plan_section(order):
+    """托盘装柜规划：按托盘尺寸、堆叠层数和重量计算各柜型每柜托盘数，启用后装箱求解按托盘数计算柜数"""
+    specs = order['specs']
+    with st.expander("🧱 托盘装柜规划"):
+        use_plan = st.checkbox("按托盘尺寸装柜（不勾选时按体积和载重估算）", key="use_load_plan")
+        col_p1, col_p2, col_p3, col_p4 = st.columns(4)
+        with col_p1:
+            pallet_length = st.number_input("托盘长(cm)", min_value=1.0, value=120.0, step=1.0, key="pallet_length")
+        with col_p2:
+            pallet_width = st.number_input("托盘宽(cm)", min_value=1.0, value=100.0, step=1.0, key="pallet_width")
+        with col_p3:
+            # 默认高度按单件体积和 120×100cm 底面积反推
+            default_height = round(specs['single_volume'] / 1.2 * 100.0, 1)
+            pallet_height = st.number_input("托盘高(cm)", min_value=1.0, value=max(default_height, 1.0), step=1.0,
+                                            key="pallet_height")
+        with col_p4:
+            max_layers = st.number_input("最多堆叠层数", min_value=1, max_value=10, value=1, step=1, key="pallet_layers",
+                                         help="1 表示不可堆叠")
+
+        plans = plan_load(pallet_length / 100.0, pallet_width / 100.0, pallet_height / 100.0,
+                          specs['single_gross'], max_layers, order['transport_note'])
+        st.dataframe(pd.DataFrame(plans).rename(columns={
+            'name': '柜型', 'per_layer': '每层托盘', 'layers': '层数', 'by_space': '按空间',
+            'by_weight': '按载重', 'pallets': '每柜托盘'}), hide_index=True, use_container_width=True)
+        if all(plan['pallets'] == 0 for plan in plans):
+            st.warning("托盘尺寸超出所有柜型的内部尺寸，无法整柜装载，第三步仍按体积和载重估算")
+        elif use_plan:
+            st.caption(f"共 {int(order['total_packages'])} 托，第三步计算运费时按上表每柜托盘数选择柜型")
+
+    # 托盘装不进任何柜型时不用装柜规划，第三步按各柜型的可用体积计算
+    if use_plan and any(plan['pallets'] > 0 for plan in plans):
+        order['load_capacities'] = effective_capacities(plans, specs['single_volume'])
+
+
+@profiled("运费和报价")
+def freight_quote_section(order):
+    """第三步：计算运费和报价"""
     st.markdown("""
     <div class="step-container">
         <div class="step-header">
@@ -659,233 +908,425 @@ if st.session_state.data_updated and st.session_state.product_data and quantity
 
     with col_calc1:
         if st.button("🚢 计算运费", use_container_width=True):
-            containers_needed = np.ceil(total_volume / 33.0)
-            if transport_note in ["冷藏", "冷冻"]:
-                st.session_state.best_freight = float(containers_needed * container_20_frozen)
-                st.session_state.container_type = "20'冻柜"
-            else:
-                st.session_state.best_freight = float(containers_needed * container_20_normal)
-                st.session_state.container_type = "20'普柜"
-            st.session_state.containers_needed = int(containers_needed)
+            graph = st.session_state.budget_graph
+            graph.update(freight_data=st.session_state.reference.freight, transport_note=order['transport_note'],
+                         load_capacities=order.get('load_capacities'))
+            container_mix = graph.get('container_mix')
+            st.session_state.best_freight = container_mix['freight']
+            st.session_state.container_type = container_mix['description']
+            st.session_state.containers_needed = container_mix['containers']
             st.session_state.best_freight_cny = st.session_state.best_freight * st.session_state.exchange_rate
             st.session_state.calculated = True
-            st.success(f"需要 {int(containers_needed)}个 {st.session_state.container_type}，运费 ${st.session_state.best_freight:,.2f} (¥{st.session_state.best_freight_cny:,.2f})")
+            st.success(f"需要 {st.session_state.container_type}，运费 ${st.session_state.best_freight:,.2f} (¥{st.session_state.best_freight_cny:,.2f})")
 
     with col_calc2:
         if st.button("💰 计算报价", use_container_width=True):
             if st.session_state.best_freight > 0:
-                purchase_total = purchase_price * quantity
-                rebate = purchase_total / (1.0 + vat_rate/100.0) * (export_rebate_rate/100.0)
-                total_cost = purchase_total - rebate + (st.session_state.best_freight * st.session_state.exchange_rate)
-                st.session_state.suggested_price = (total_cost * (1.0 + expected_profit_rate/100.0)) / quantity / st.session_state.exchange_rate
-                st.session_state.total_cost = total_cost
+                budget = calc_budget(order)
+                st.session_state.suggested_price = budget['suggested_price']
+                st.session_state.total_cost = budget['quote_cost']
                 st.success(f"建议报价: ${st.session_state.suggested_price:.2f}/台")
             else:
                 st.warning("请先计算运费")
 
-    # ==================== 出口预算表 ====================
-    if st.session_state.calculated and st.session_state.suggested_price > 0:
-        st.markdown("""
-        <div class="step-container">
-            <div class="step-header">
-                <span class="step-badge">第四步</span>
-                <span class="step-title">出口预算表</span>
-            </div>
+
+# 单份导出时写入方案信息的订单字段
+EXPORT_INPUT_KEYS = ['quote_date', 'product_code', 'product_name', 'trade_term', 'payment', 'quantity',
+                     'purchase_price', 'vat_rate', 'export_rebate_rate', 'total_volume', 'inspection_type',
+                     'transport_note']
+EXPORT_MIME = {'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'pdf': 'application/pdf'}
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_export(quote, fmt, fee_rules=None):
+    """当前报价导出为 Excel/PDF，输入不变时不重复生成"""
+    return export_bytes([quote], fmt, fee_rules)
+
+
+@profiled("预算表")
+def budget_table_section(order):
+    """第四步：出口预算表，返回预算计算结果"""
+    st.markdown("""
+    <div class="step-container">
+        <div class="step-header">
+            <span class="step-badge">第四步</span>
+            <span class="step-title">出口预算表</span>
         </div>
-        """, unsafe_allow_html=True)
+    </div>
+    """, unsafe_allow_html=True)
+
+    # 计算各项费用
+    budget = calc_budget(order)
+    fee_rules = st.session_state.reference.fee_rules
 
-        # 计算各项费用
-        purchase_total = purchase_price * quantity
-        rebate = purchase_total / (1.0 + vat_rate/100.0) * (export_rebate_rate/100.0)
-        inland_fee = max(50.0, total_volume * 10.0) * st.session_state.exchange_rate
-        forwarder_fee = max(70.0, total_volume * 2.5) * st.session_state.exchange_rate
-        inspection_fee = 30.0 * st.session_state.exchange_rate if "B" in str(inspection_type) else 0.0
-        certificate_fee = 100.0 * st.session_state.exchange_rate if "B" in str(inspection_type) else 0.0
-        customs_fee = 30.0 * st.session_state.exchange_rate if trade_term != "EXW" else 0.0
-        insurance = purchase_total * 1.1 * 0.005 if trade_term in ["CIF", "CIP", "DAP", "DPU", "DDP"] else 0.0
-
-        if payment in ["D/P", "D/A"]:
-            bank_fee = max(15.0, min(285.0, purchase_total * 0.001)) + 45.0
-        elif "L/C" in payment:
-            bank_fee = max(15.0, purchase_total * 0.00125) + 75.0
+    # 创建预算表（整表一次渲染）
+    budget_table_rows = budget_rows(budget, order['purchase_price'], order['quantity'], order['vat_rate'],
+                                    order['export_rebate_rate'], order['total_volume'],
+                                    st.session_state.exchange_rate, st.session_state.best_freight,
+                                    st.session_state.container_type, order['payment'], order['trade_term'],
+                                    order['inspection_type'], order['transport_note'], fee_rules)
+    st.markdown(render_budget_html(budget_table_rows), unsafe_allow_html=True)
+    quote = {'inputs': {**{key: order[key] for key in EXPORT_INPUT_KEYS}, 'exchange_rate': st.session_state.exchange_rate,
+                        'best_freight': st.session_state.best_freight,
+                        'container_type': st.session_state.container_type,
+                        'customer': st.session_state.reference.customer.get('importer_name', '')},
+             'budget': budget}
+    col_e1, col_e2, col_e3 = st.columns(3)
+    with col_e1:
+        st.download_button("⬇️ 导出预算表 CSV", budget_csv(budget_table_rows), file_name="出口预算表.csv",
+                           mime="text/csv", key="budget_csv", use_container_width=True)
+    with col_e2:
+        st.download_button("⬇️ 导出预算表 Excel", cached_export(quote, 'xlsx', fee_rules), file_name="出口预算表.xlsx",
+                           mime=EXPORT_MIME['xlsx'], key="budget_xlsx", use_container_width=True)
+    with col_e3:
+        if pdf_available():
+            st.download_button("⬇️ 导出预算表 PDF", cached_export(quote, 'pdf', fee_rules), file_name="出口预算表.pdf",
+                               mime=EXPORT_MIME['pdf'], key="budget_pdf", use_container_width=True)
         else:
-            bank_fee = 0.0
+            st.caption("安装 reportlab 后可导出 PDF")
 
-        domestic_total = inland_fee + forwarder_fee + inspection_fee + certificate_fee + customs_fee + insurance
+    with st.expander("📐 第四步费用规则"):
+        source = "默认公式" if fee_rules is DEFAULT_FEE_SCHEDULE else f"数据文件的“{SHEETS['fee']}”工作表"
+        st.dataframe(pd.DataFrame(fee_rules.table()), hide_index=True, use_container_width=True)
+        st.caption(f"当前使用{source}；同一费用取第一条满足条件的规则，修改数据文件后重新抓取即可生效")
+    return budget
 
-        # 创建预算表
-        st.markdown("""
-        <div class="excel-table">
-            <div class="excel-header">
-                <div>项目</div>
-                <div>费用项目</div>
-                <div>金额</div>
-                <div>计算原理</div>
-            </div>
-        """, unsafe_allow_html=True)
 
-        # 1. 采购成本
-        st.markdown(f"""
-        <div class="excel-row">
-            <div class="excel-label">1.采购成本</div>
-            <div class="excel-sub">含税购入价</div>
-            <div class="excel-amount">¥{purchase_total:,.2f}</div>
-            <div class="excel-principle">{purchase_price:.0f} × {int(quantity)}</div>
-        </div>
-        """, unsafe_allow_html=True)
+def history_returns(label, key, fx_history=None):
+    """波动率来源：手工指定或历史序列，返回 (年化波动率, 历史日收益或 None)"""
+    sources = ["指定波动率", "历史文件"] + (["已加载汇率表"] if fx_history is not None else [])
+    source = st.radio(f"{label}波动来源", sources, horizontal=True, key=f"{key}_source")
+    if source == "指定波动率":
+        volatility = st.number_input(f"{label}年化波动率%", min_value=0.0, max_value=300.0,
+                                     value=30.0 if key == "risk_freight" else 8.0, step=1.0, key=f"{key}_volatility")
+        return volatility / 100.0, None
 
-        # 2. 退税收入
-        st.markdown(f"""
-        <div class="excel-row">
-            <div class="excel-label">2.退税收入</div>
-            <div class="excel-sub">退税额</div>
-            <div class="excel-amount">¥{rebate:,.2f}</div>
-            <div class="excel-principle">含税价÷(1+{vat_rate:.0f}%)×{export_rebate_rate:.0f}%</div>
-        </div>
-        """, unsafe_allow_html=True)
+    history = fx_history
+    if source == "历史文件":
+        uploaded = st.file_uploader(f"{label}历史（CSV/Excel：日期 + 数值）", type=["csv", "xlsx"], key=f"{key}_file")
+        if uploaded is None:
+            return 0.0, None
+        try:
+            history = read_history(uploaded)
+        except ValueError as e:
+            st.warning(str(e))
+            return 0.0, None
+    returns = daily_returns(history['date'], history['value'])
+    if len(returns) < 2:
+        st.warning(f"{label}历史少于3个不同日期，按波动率0计算")
+        return 0.0, None
+    volatility = annual_volatility(returns)
+    st.caption(f"{len(returns) + 1} 个观测，年化波动率 {volatility:.1%}")
+    return volatility, returns
 
-        # 3. 国内费用
-        st.markdown(f"""
-        <div class="excel-row">
-            <div class="excel-label">3.国内费用</div>
-            <div class="excel-sub">出口内陆运费</div>
-            <div class="excel-amount">¥{inland_fee:,.2f}</div>
-            <div class="excel-principle">MAX(50, {total_volume:.1f}×10)×{st.session_state.exchange_rate:.3f}</div>
-        </div>
-        """, unsafe_allow_html=True)
 
-        st.markdown(f"""
-        <div class="excel-row">
-            <div class="excel-label"></div>
-            <div class="excel-sub">国际运费</div>
-            <div class="excel-amount">¥{st.session_state.best_freight_cny:,.2f}</div>
-            <div class="excel-principle">{st.session_state.containers_needed}个{st.session_state.container_type} (${st.session_state.best_freight:,.2f} × {st.session_state.exchange_rate:.3f})</div>
-        </div>
-        """, unsafe_allow_html=True)
+def risk_simulation_panel(order, test_price):
+    """按当前报价模拟出运时的运费和汇率，显示利润分位和未达到目标利润率的概率"""
+    fx_history = st.session_state.reference.fx.history(st.session_state.exchange_pair)
+    fx_history = fx_history.rename(columns={'rate': 'value'}) if fx_history['date'].nunique() > 2 else None
 
-        st.markdown(f"""
-        <div class="excel-row">
-            <div class="excel-label"></div>
-            <div class="excel-sub">出口货代杂费</div>
-            <div class="excel-amount">¥{forwarder_fee:,.2f}</div>
-            <div class="excel-principle">MAX(70, {total_volume:.1f}×2.5)×{st.session_state.exchange_rate:.3f}</div>
-        </div>
-        """, unsafe_allow_html=True)
+    col_k1, col_k2, col_k3 = st.columns(3)
+    with col_k1:
+        horizon_days = st.number_input("距出运天数", min_value=1, max_value=365, value=60, step=1, key="risk_horizon")
+    with col_k2:
+        draws = st.select_slider("模拟次数", [10_000, 20_000, 50_000, 100_000], value=50_000,
+                                 format_func=lambda n: f"{n:,}", key="risk_draws")
+    with col_k3:
+        correlation = st.slider("运费与汇率相关系数", -1.0, 1.0, 0.0, 0.05, key="risk_correlation")
+    col_v1, col_v2 = st.columns(2)
+    with col_v1:
+        freight_volatility, freight_returns = history_returns("运费", "risk_freight")
+    with col_v2:
+        fx_volatility, fx_returns = history_returns("汇率", "risk_fx", fx_history)
 
-        if inspection_fee > 0:
-            st.markdown(f"""
-            <div class="excel-row">
-                <div class="excel-label"></div>
-                <div class="excel-sub">出口商检费</div>
-                <div class="excel-amount">¥{inspection_fee:,.2f}</div>
-                <div class="excel-principle">检验检疫类别含B时收取</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        if certificate_fee > 0:
-            st.markdown(f"""
-            <div class="excel-row">
-                <div class="excel-label"></div>
-                <div class="excel-sub">检验检疫证书费</div>
-                <div class="excel-amount">¥{certificate_fee:,.2f}</div>
-                <div class="excel-principle">检验检疫类别含B时收取</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        if customs_fee > 0:
-            st.markdown(f"""
-            <div class="excel-row">
-                <div class="excel-label"></div>
-                <div class="excel-sub">出口报关费</div>
-                <div class="excel-amount">¥{customs_fee:,.2f}</div>
-                <div class="excel-principle">30×{st.session_state.exchange_rate:.3f}</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        if insurance > 0:
-            st.markdown(f"""
-            <div class="excel-row">
-                <div class="excel-label"></div>
-                <div class="excel-sub">保险费</div>
-                <div class="excel-amount">¥{insurance:,.2f}</div>
-                <div class="excel-principle">采购成本×110%×0.5%</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        # 国内费用合计
-        st.markdown(f"""
-        <div class="excel-row" style="background-color: #e9ecef;">
-            <div class="excel-label"></div>
-            <div class="excel-sub"><strong>国内费用合计</strong></div>
-            <div class="excel-amount"><strong>¥{domestic_total:,.2f}</strong></div>
-            <div class="excel-principle">各项相加</div>
-        </div>
-        """, unsafe_allow_html=True)
+    # 只传模拟用到的订单字段，产品名称、报价日期等变化不会让缓存失效
+    inputs = {key: order[key] for key in RISK_ORDER_FIELDS}
+    summary, histogram, percentiles = cached_risk_simulation(
+        inputs, st.session_state.exchange_rate, st.session_state.best_freight, test_price, horizon_days,
+        freight_volatility, fx_volatility, correlation, freight_returns, fx_returns, draws,
+        fee_rules=st.session_state.reference.fee_rules)
+    target = order['expected_profit_rate'] / 100.0
 
-        # 4. 银行费用
-        if payment in ["D/P", "D/A"] or "L/C" in payment:
-            fee_type = '托收费用' if payment in ['D/P','D/A'] else '信用证费用'
-            st.markdown(f"""
-            <div class="excel-row">
-                <div class="excel-label">4.银行费用</div>
-                <div class="excel-sub">{fee_type}</div>
-                <div class="excel-amount">${bank_fee:,.2f}</div>
-                <div class="excel-principle">根据支付方式</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        # 总成本
-        total_cost_final = purchase_total - rebate + domestic_total + (bank_fee * st.session_state.exchange_rate) + (st.session_state.best_freight * st.session_state.exchange_rate)
-
-        st.markdown(f"""
-        <div class="excel-row" style="background-color: #2a5298; color: white; font-weight: bold;">
-            <div class="excel-label">总成本</div>
-            <div class="excel-sub">=1-2+3+4</div>
-            <div class="excel-amount">¥{total_cost_final:,.2f}</div>
-            <div class="excel-principle" style="color: white;">采购-退税+国内+银行+运费</div>
-        </div>
-        """, unsafe_allow_html=True)
+    col_q1, col_q2, col_q3 = st.columns(3)
+    with col_q1:
+        st.metric("未达目标利润率概率", f"{summary['miss_probability']:.1%}")
+        st.caption(f"目标: {target:.1%}")
+    with col_q2:
+        st.metric("亏损概率", f"{summary['loss_probability']:.1%}")
+    with col_q3:
+        st.metric("期望利润", f"¥{summary['expected_profit']:,.2f}")
+        st.caption(f"期望利润率 {summary['expected_margin']:.1%}")
+    st.altair_chart(histogram_chart(histogram, target), use_container_width=True)
+    st.dataframe(percentiles.rename(columns=PERCENTILE_LABELS).style.format(
+        {'运费(USD)': '{:,.2f}', '汇率': '{:.4f}', '利润(¥)': '{:,.2f}', '利润率': '{:.1%}'}),
+        hide_index=True, use_container_width=True)
+    st.caption(f"测试报价 ${test_price:,.2f}/台固定，运费和汇率到出运时按对数正态（或历史经验分布）波动，期望值不变；"
+               "红色为低于目标利润率的部分")
 
-        st.markdown("</div>", unsafe_allow_html=True)
 
-        # ==================== 反算利润率 ====================
-        st.markdown("### 📈 反算利润率")
+def term_matrix_panel(order, test_price):
+    """全部 贸易术语 × 支付方式 组合一次计算，最低总成本的组合高亮"""
+    matrix = cached_term_matrix(
+        order['quantity'], order['purchase_price'], order['vat_rate'], order['export_rebate_rate'],
+        st.session_state.exchange_rate, order['expected_profit_rate'], order['total_volume'],
+        st.session_state.best_freight, test_price, order['inspection_type'], order['transport_note'],
+        st.session_state.reference.fee_rules)
+    cheapest = matrix['total_cost'] <= matrix['total_cost'].min() + 0.005
+    current = (matrix['trade_term'] == order['trade_term']) & (matrix['payment'] == order['payment'])
 
-        test_price = st.number_input("输入测试报价 (USD/台)", 
-                                    value=float(st.session_state.suggested_price) if st.session_state.suggested_price > 0 else 100.0, 
-                                    step=5.0, format="%.2f", key="test_price_input")
+    def highlight(row):
+        if cheapest[row.name]:
+            return ['background-color: #d4edda; font-weight: bold'] * len(row)
+        return ['background-color: #fff3cd'] * len(row) if current[row.name] else [''] * len(row)
 
-        if test_price > 0:
-            purchase_total = purchase_price * quantity
-            rebate = purchase_total / (1.0 + vat_rate/100.0) * (export_rebate_rate/100.0)
-            inland_fee = max(50.0, total_volume * 10.0) * st.session_state.exchange_rate
-            forwarder_fee = max(70.0, total_volume * 2.5) * st.session_state.exchange_rate
-            customs_fee = 30.0 * st.session_state.exchange_rate if trade_term != "EXW" else 0.0
-            total_cost = purchase_total - rebate + inland_fee + forwarder_fee + customs_fee + (st.session_state.best_freight * st.session_state.exchange_rate)
-            
-            revenue = test_price * quantity * st.session_state.exchange_rate
-            profit = revenue - total_cost
-            profit_margin = profit / purchase_total if purchase_total > 0 else 0.0
-            
-            col_r1, col_r2, col_r3 = st.columns(3)
-            with col_r1:
-                st.metric("总收入", f"¥{revenue:,.2f}")
-                st.caption(f"{test_price:.2f} × {int(quantity)} × {st.session_state.exchange_rate:.3f}")
-            with col_r2:
-                st.metric("预期利润", f"¥{profit:,.2f}")
-                st.caption(f"{revenue:,.2f} - {total_cost:,.2f}")
-            with col_r3:
-                target = expected_profit_rate / 100.0
-                delta = "✅ 达到目标" if profit_margin >= target else "❌ 低于目标"
-                st.metric("实际利润率", f"{profit_margin:.1%}", delta=delta)
-                st.caption(f"目标: {target:.1%}")
+    formats = {TERM_MATRIX_LABELS[name]: '{:,.2f}' for name in
+               ['insurance', 'customs_fee', 'bank_fee', 'total_cost', 'suggested_price', 'profit']}
+    styled = matrix.rename(columns=TERM_MATRIX_LABELS).style.apply(highlight, axis=1).format(
+        {**formats, TERM_MATRIX_LABELS['profit_margin']: '{:.1%}'})
+    st.dataframe(styled, hide_index=True, use_container_width=True, height=400)
+    best = matrix[cheapest]
+    st.caption(f"绿色为总成本最低的组合（{'、'.join(best['trade_term'] + ' + ' + best['payment'])}，"
+               f"¥{best['total_cost'].iloc[0]:,.2f}），黄色为当前选择；建议报价按总成本加期望利润率"
+               f"{order['expected_profit_rate']}%反算，利润按测试报价 ${test_price:,.2f}/台计算")
 
-else:
-    st.markdown("""
-    <div class="empty-state">
-        ⏳ 请先点击侧边栏的"抓取数据"按钮获取产品信息，然后填写交易数量及采购单价进行计算
-    </div>
-    """, unsafe_allow_html=True)
+
+def inverse_solver_panel(order, budget):
+    """盈亏平衡报价、目标利润率报价和余额可承受的最大数量
+
+    报价按与反算利润率相同的成本口径（reverse_cost）反解，输入盈亏平衡报价时反算利润率的利润为 0；
+    余额可承受数量按第四步总成本判断。
+    """
+    quantity, exchange_rate = order['quantity'], st.session_state.exchange_rate
+    target_margin = st.number_input("目标利润率%", value=float(order['expected_profit_rate']), step=1.0,
+                                    key="target_margin")
+    solver_order = {**order, 'exchange_rate': exchange_rate, 'freight_data': st.session_state.reference.freight,
+                    'fee_rules': st.session_state.reference.fee_rules}
+    max_quantity, max_budget = max_affordable_quantity(order['account_balance'], solver_order)
+    costs = {**budget, 'reverse_cost': calc_reverse_cost(budget['purchase_total'], budget['rebate'], budget,
+                                                         budget['freight_cny'])}
+    break_even = float(break_even_price(costs, quantity, exchange_rate, 'reverse_cost'))
+    margin_price = float(price_for_margin(costs, quantity, exchange_rate, target_margin / 100.0, 'reverse_cost'))
+
+    col_i1, col_i2, col_i3 = st.columns(3)
+    with col_i1:
+        st.metric("盈亏平衡报价", f"${break_even:,.2f}/台")
+        st.caption("反算成本 ÷ (数量 × 汇率)，成本口径与反算利润率相同")
+    with col_i2:
+        st.metric(f"利润率{target_margin:.1f}%报价", f"${margin_price:,.2f}/台")
+        st.caption("(反算成本 + 利润率 × 采购成本) ÷ (数量 × 汇率)")
+    with col_i3:
+        st.metric("余额可承受最大数量", f"{max_quantity:,}台")
+        if max_budget:
+            st.caption(f"总成本 ¥{max_budget['total_cost']:,.2f} ≤ 余额 ¥{order['account_balance']:,.2f}")
+        else:
+            st.caption("余额不足以完成1台的总成本")
+
+
+@st.fragment
+@profiled("反算利润率")
+def reverse_profit_section(order, budget):
+    """反算利润率、敏感性分析和反向求解：修改测试报价等输入只重新运行本区域"""
+    quantity = order['quantity']
+    expected_profit_rate = order['expected_profit_rate']
+
+    # ==================== 反算利润率 ====================
+    st.markdown("### 📈 反算利润率")
+
+    test_price = st.number_input("输入测试报价 (USD/台)", 
+                                value=float(st.session_state.suggested_price) if st.session_state.suggested_price > 0 else 100.0, 
+                                step=5.0, format="%.2f", key="test_price_input")
+
+    if test_price > 0:
+        reverse = calc_budget(order, test_price)
+        total_cost = reverse['reverse_cost']
+        revenue = reverse['revenue']
+        profit = reverse['profit']
+        profit_margin = reverse['profit_margin']
+        
+        col_r1, col_r2, col_r3 = st.columns(3)
+        with col_r1:
+            st.metric("总收入", f"¥{revenue:,.2f}")
+            st.caption(f"{test_price:.2f} × {int(quantity)} × {st.session_state.exchange_rate:.3f}")
+        with col_r2:
+            st.metric("预期利润", f"¥{profit:,.2f}")
+            st.caption(f"{revenue:,.2f} - {total_cost:,.2f}")
+        with col_r3:
+            target = expected_profit_rate / 100.0
+            delta = "✅ 达到目标" if profit_margin >= target else "❌ 低于目标"
+            st.metric("实际利润率", f"{profit_margin:.1%}", delta=delta)
+            st.caption(f"目标: {target:.1%}")
+
+        # ==================== 利润敏感性分析 ====================
+        with st.expander("📊 利润敏感性分析（报价 × 汇率 × 数量）"):
+            col_s1, col_s2, col_s3 = st.columns(3)
+            with col_s1:
+                price_range = st.slider("报价浮动 ±%", 5, 80, 30, key="sens_price_range")
+            with col_s2:
+                rate_range = st.slider("汇率浮动 ±%", 1, 30, 10, key="sens_rate_range")
+            with col_s3:
+                grid_size = st.select_slider("网格密度", [50, 100, 200, 300], value=100, key="sens_grid_size")
+
+            sens_prices = np.linspace(test_price * (1 - price_range / 100.0), test_price * (1 + price_range / 100.0), grid_size)
+            sens_rates = np.linspace(st.session_state.exchange_rate * (1 - rate_range / 100.0),
+                                     st.session_state.exchange_rate * (1 + rate_range / 100.0), grid_size)
+            sens_quantities = np.union1d(np.round(np.linspace(max(1.0, quantity * 0.2), quantity * 2.0, 20)), [quantity])
+            # 运费单价快照是只读映射，缓存键使用普通字典
+            surface = cached_profit_surface(
+                sens_prices, sens_rates, sens_quantities, order['specs'],
+                order['purchase_price'], order['vat_rate'], order['export_rebate_rate'],
+                dict(st.session_state.reference.freight), order['transport_note'], order['trade_term'],
+                order.get('load_capacities'), st.session_state.reference.fee_rules)
+
+            sens_quantity = st.select_slider("交易数量", options=sens_quantities.tolist(), value=float(quantity),
+                                             format_func=lambda q: f"{q:,.0f}", key="sens_quantity")
+            quantity_index = int(np.searchsorted(sens_quantities, sens_quantity))
+            st.altair_chart(heatmap_chart(heatmap_frame(surface, sens_prices, sens_rates, quantity_index),
+                                          break_even_frame(surface, sens_rates, sens_quantities, quantity_index)),
+                            use_container_width=True)
+            st.caption("颜色为利润率（利润 ÷ 采购成本），虚线为盈亏平衡报价；运费按每个数量重新计算装箱方案")
+
+        # ==================== 运费/汇率风险模拟 ====================
+        # 只在展开时运行：收起时重跑本区域不抽样，也不生成图表和表格
+        risk_panel = st.expander("🎲 运费/汇率风险模拟（蒙特卡洛）", key="risk_panel", on_change="rerun")
+        if risk_panel.open:
+            with risk_panel:
+                if st.session_state.best_freight > 0:
+                    risk_simulation_panel(order, test_price)
+                else:
+                    st.info("请先在第三步计算运费")
+
+        # ==================== 贸易术语 × 支付方式 ====================
+        # 同上，收起时不计算矩阵、不生成带高亮的表格
+        term_panel = st.expander("🧮 贸易术语 × 支付方式 对比（全部组合）", key="term_matrix_panel", on_change="rerun")
+        if term_panel.open:
+            with term_panel:
+                term_matrix_panel(order, test_price)
+
+    # ==================== 反向求解 ====================
+    # 只在展开时运行：余额可承受数量要多轮试算装箱，收起时不计算
+    inverse_panel = st.expander("🎯 反向求解（盈亏平衡 / 目标利润率 / 余额可承受数量）", key="inverse_panel",
+                                on_change="rerun")
+    if inverse_panel.open:
+        with inverse_panel:
+            inverse_solver_panel(order, budget)
+
+
+# 多商品订单编辑表的列：表头 -> 字段名
+ORDER_LINE_EDITOR = {'商品编号': 'product_code', '交易数量': 'quantity', '采购单价': 'purchase_price',
+                     '增值税%': 'vat_rate', '退税率%': 'export_rebate_rate'}
+
+
+@profiled("多商品合并报价")
+def order_lines_section(hs, trade):
+    """多商品订单：各行合并装箱，整票运费和费用按体积/采购额分摊到各行"""
+    with st.expander("🧾 多商品合并报价"):
+        st.caption("每行一个商品；增值税率/退税率留空时按该商品的HS编码查税率表，查不到时使用HS编码信息行的税率")
+        if 'order_lines' not in st.session_state:
+            st.session_state.order_lines = pd.DataFrame(
+                [{'商品编号': str(st.session_state.product_data.get('product_code', '')),
+                  '交易数量': float(trade['quantity']), '采购单价': float(trade['purchase_price']),
+                  '增值税%': np.nan, '退税率%': np.nan}], columns=list(ORDER_LINE_EDITOR))
+        edited = st.data_editor(
+            st.session_state.order_lines, num_rows="dynamic", use_container_width=True, key="order_lines_editor",
+            column_config={
+                '商品编号': st.column_config.TextColumn(required=True),
+                '交易数量': st.column_config.NumberColumn(min_value=0, step=1),
+                '采购单价': st.column_config.NumberColumn(min_value=0, format="%.2f"),
+                '增值税%': st.column_config.NumberColumn(min_value=0, max_value=100),
+                '退税率%': st.column_config.NumberColumn(min_value=0, max_value=100),
+            })
+
+        lines = edited.rename(columns=ORDER_LINE_EDITOR)
+        lines['product_code'] = lines['product_code'].fillna('').astype(str).str.strip()
+        lines = lines[(lines['product_code'] != '') & (lines['quantity'].fillna(0) > 0)].reset_index(drop=True)
+        if len(lines) == 0:
+            st.info("请至少填写一行商品编号和交易数量")
+            return
+
+        catalog = st.session_state.reference.catalog
+        records = [catalog.get(code) for code in lines['product_code']]
+        missing = sorted({code for code, record in zip(lines['product_code'], records) if record is None})
+        if missing:
+            st.warning(f"未找到商品：{', '.join(missing)}，已忽略")
+        found = np.array([record is not None for record in records])
+        lines = lines[found].reset_index(drop=True)
+        records = [record for record in records if record is not None]
+        if len(lines) == 0:
+            return
+
+        specs = product_specs_table(records).reindex(lines['product_code'].to_numpy())
+        for column in ['units_per_package', 'single_gross', 'single_net', 'single_volume']:
+            lines[column] = specs[column].to_numpy()
+        lines['purchase_price'] = lines['purchase_price'].fillna(0.0)
+        tariff_rows = st.session_state.reference.tariff.lookup_many(specs['hs_code'].to_numpy())
+        for field in ['vat_rate', 'export_rebate_rate']:
+            lines[field] = pd.to_numeric(lines[field], errors='coerce').fillna(tariff_rows[field]).fillna(hs[field])
+        lines['inspection_type'] = tariff_rows['inspection_type'].fillna(hs['inspection_type']).to_numpy()
+
+        result = order_budget(lines, st.session_state.exchange_rate, trade['expected_profit_rate'],
+                              trade['trade_term'], trade['payment'], hs['inspection_type'],
+                              st.session_state.reference.freight, trade['transport_note'],
+                              st.session_state.reference.fee_rules)
+        total = result['total']
+        col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+        with col_m1:
+            st.metric("合并装箱", result['container']['description'])
+        with col_m2:
+            st.metric("整票体积/毛重", f"{total['total_volume']:.2f} CBM / {total['total_gross']:,.0f} KGS")
+        with col_m3:
+            st.metric("整票运费", f"${result['container']['freight']:,.2f}")
+        with col_m4:
+            st.metric("整票总成本", f"¥{total['total_cost']:,.2f}")
+
+        table = result['lines'].rename(columns=ORDER_LINE_LABELS)
+        st.dataframe(table.round(2), hide_index=True, use_container_width=True)
+        st.download_button("⬇️ 导出多商品报价 CSV", table.to_csv(index=False).encode('utf-8-sig'),
+                           file_name="多商品报价.csv", mime="text/csv", key="order_lines_csv")
+
+
+@st.fragment
+def pricing_workspace():
+    """报价工作区：HS编码、产品、交易信息、运费报价、预算表和反算利润率"""
+    hs = hs_section()
+    product = product_section()
+    trade = trade_section()
+    st.session_state.current_quote = None
+
+    # 只有有数据时才计算
+    if st.session_state.data_updated and product and trade['quantity'] > 0 and trade['purchase_price'] > 0:
+        order = {**hs, **product, **trade}
+        cargo_section(order)
+        load_plan_section(order)
+        freight_quote_section(order)
+
+        # ==================== 出口预算表 ====================
+        if st.session_state.calculated and st.session_state.suggested_price > 0:
+            budget = budget_table_section(order)
+            st.session_state.current_quote = {
+                'inputs': {**order, 'customer': st.session_state.reference.customer.get('importer_name', ''),
+                           'best_freight': st.session_state.best_freight,
+                           'container_type': st.session_state.container_type,
+                           'containers_needed': st.session_state.containers_needed,
+                           # 保存计算时适用的费用规则，之后换了规则表再导出，名称和计算原理仍与金额一致
+                           'fee_rules': st.session_state.reference.fee_rules.applied_records(
+                               order['trade_term'], order['payment'], order['inspection_type'],
+                               order['transport_note'])},
+                'budget': budget,
+            }
+            reverse_profit_section(order, budget)
+
+        order_lines_section(hs, trade)
+
+    else:
+        st.markdown("""
+        <div class="empty-state">
+            ⏳ 请先点击侧边栏的"抓取数据"按钮获取产品信息，然后填写交易数量及采购单价进行计算
+        </div>
+        """, unsafe_allow_html=True)
+
+
+pricing_workspace()
+rerun_clock.lap("报价工作区")
 
 # ==================== 底部信息 ====================
 st.markdown("---")
@@ -897,5 +1338,107 @@ st.markdown(f"""
 
 # 保存按钮
 if st.button("💾 保存当前数据", use_container_width=True):
-    st.success("✅ 数据已保存到会话中！")
-    st.balloons()
+    if st.session_state.current_quote:
+        try:
+            quote_id = store_for().save(**st.session_state.current_quote)
+            st.success(f"✅ 报价方案已保存（编号 {quote_id}）")
+            st.balloons()
+        except sqlite3.Error as e:
+            st.error(f"保存失败：{e}")
+    else:
+        st.warning("请先完成第三步计算报价，再保存")
+
+
+@st.fragment
+@profiled("已保存方案")
+def saved_quotes_section():
+    """已保存的报价方案：按客户/商品/贸易术语/日期筛选，分页浏览，载入或删除"""
+    with st.expander("📂 已保存的报价方案"):
+        try:
+            store = store_for()
+            customers, codes = store.distinct('customer'), store.distinct('product_code')
+        except sqlite3.Error as e:
+            st.error(f"无法打开报价方案库：{e}")
+            return
+
+        col_f1, col_f2, col_f3, col_f4, col_f5 = st.columns([2, 2, 1, 2, 1])
+        with col_f1:
+            customer = st.selectbox("客户", ["全部"] + customers, key="saved_customer")
+        with col_f2:
+            product_code = st.selectbox("商品编号", ["全部"] + codes, key="saved_product")
+        with col_f3:
+            trade_term = st.selectbox("贸易术语", ["全部"] + TRADE_TERMS, key="saved_trade_term")
+        with col_f4:
+            date_range = st.date_input("报价日期范围", value=(), key="saved_dates")
+        with col_f5:
+            page = st.number_input("页码", min_value=1, step=1, key="saved_page")
+
+        filters = {
+            'customer': None if customer == "全部" else customer,
+            'product_code': None if product_code == "全部" else product_code,
+            'trade_term': None if trade_term == "全部" else trade_term,
+            'date_from': date_range[0] if len(date_range) > 0 else None,
+            'date_to': date_range[1] if len(date_range) > 1 else None,
+        }
+        col_x1, col_x2 = st.columns([1, 3])
+        with col_x1:
+            export_format = st.radio("批量导出格式", ["xlsx", "pdf"] if pdf_available() else ["xlsx"], horizontal=True,
+                                     key="saved_export_format")
+        with col_x2:
+            fee_rules = st.session_state.reference.fee_rules
+
+            def saved_export():
+                # 点击下载时才执行：逐个读取方案写入临时文件，文件内容不保存在会话中
+                with export_tempfile(store.iter_quotes(**filters), export_format, fee_rules) as exported:
+                    return exported.read()
+
+            st.download_button(f"📤 导出筛选结果的全部方案（{export_format.upper()}）", saved_export,
+                               file_name=f"报价方案.{export_format}", mime=EXPORT_MIME[export_format],
+                               key="saved_export_download", use_container_width=True)
+
+        frame, total = store.list(page=page, **filters)
+        pages = max((total + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+        st.caption(f"共 {total} 条，第 {page}/{pages} 页，每页 {PAGE_SIZE} 条")
+        if len(frame) == 0:
+            return
+        st.dataframe(frame.rename(columns=LIST_LABELS), hide_index=True, use_container_width=True)
+
+        col_s1, col_s2, col_s3 = st.columns([3, 1, 1])
+        with col_s1:
+            quote_id = st.selectbox("选择方案", frame['id'].tolist(), key="saved_quote_id",
+                                    format_func=lambda i: "{} | {} | {} | {}".format(
+                                        *frame.loc[frame['id'] == i, ['id', 'quote_date', 'product_code', 'customer']].iloc[0]))
+        with col_s2:
+            # 在回调中填写各输入框（回调在输入框创建之前执行），再整页刷新
+            if st.button("📥 载入方案", use_container_width=True, on_click=load_saved_quote, args=(store, quote_id)):
+                st.rerun()
+        with col_s3:
+            if st.button("🗑️ 删除方案", use_container_width=True):
+                store.delete(quote_id)
+                st.rerun(scope="fragment")
+
+
+saved_quotes_section()
+rerun_clock.lap("底部信息")
+rerun_clock.total("整页重跑")
+
+
+# ==================== 性能调试面板 ====================
+with st.sidebar:
+    if st.checkbox("🛠️ 显示性能调试面板", key="show_profiler"):
+        session_timings = page_timings()[0]
+        st.markdown("**本会话各区域耗时**")
+        st.dataframe(pd.DataFrame(session_timings.summary()).rename(columns=SUMMARY_LABELS),
+                     hide_index=True, use_container_width=True)
+        st.markdown("**全进程各区域耗时**")
+        st.dataframe(pd.DataFrame(PROCESS_TIMINGS.summary()).rename(columns=SUMMARY_LABELS),
+                     hide_index=True, use_container_width=True)
+        st.caption("报价工作区为各区域合计；片段单独重跑时只记录该片段内的区域")
+        st.download_button("⬇️ 导出计时 JSON", export_json(session_timings), file_name="section_timings.json",
+                           mime="application/json", key="profiler_json")
+        ran = st.session_state.budget_graph.ran
+        st.markdown("**本轮重跑运行的计算节点**")
+        st.caption("、".join(ran) if ran else "无（输入未变化，全部使用缓存结果）")
+        if st.button("🧹 清空本会话计时", use_container_width=True):
+            session_timings.clear()
+            st.rerun()
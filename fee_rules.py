@@ -0,0 +1,327 @@
+"""第四步费用规则：国内费用和银行费用按规则表计算，规则表可在 Data.xlsx 的“费用规则”工作表中维护
+
+每条规则给出一项费用在什么条件下（贸易术语、支付方式、检验检疫、运输要求）如何计费：
+金额 = MIN(MAX(计费基数 × 费率, 最低), 最高) + 附加，再按币种折算；费率可以写成几个因子相乘（如 110%×0.5%）。
+同一费用有多条规则时取第一条满足条件的，
+都不满足时为 0。条件留空表示不限；多个取值用逗号分隔，可用 * 通配（如 *B* 表示含B），以 ! 开头表示取反。
+规则表读取后编译为 FeeSchedule，计算时每条规则是一组 NumPy 运算，单笔订单和批量订单使用同一套规则；
+单笔订单只计算每项费用适用的那一条规则。
+"""
+import math
+from fnmatch import fnmatchcase
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# 费用字段 -> 预算表中的名称；银行费用为USD，其余为人民币
+FEE_LABELS = {
+    'inland_fee': '出口内陆运费',
+    'forwarder_fee': '出口货代杂费',
+    'inspection_fee': '出口商检费',
+    'certificate_fee': '检验检疫证书费',
+    'customs_fee': '出口报关费',
+    'insurance': '保险费',
+    'bank_fee': '银行费用',
+}
+USD_FEES = ['bank_fee']
+DOMESTIC_FEES = ['inland_fee', 'forwarder_fee', 'inspection_fee', 'certificate_fee', 'customs_fee', 'insurance']
+
+# 条件字段 -> 规则表表头
+CONDITION_LABELS = {'trade_term': '贸易术语', 'payment': '支付方式', 'inspection_type': '检验检疫',
+                    'transport_note': '运输要求'}
+BASE_LABELS = {'fixed': '固定', 'volume': '体积', 'value': '货值'}
+CURRENCIES = {'USD': 'USD', '美元': 'USD', '$': 'USD', 'CNY': 'CNY', 'RMB': 'CNY', '人民币': 'CNY', '¥': 'CNY'}
+
+# 规则表表头 -> 字段名（表头也可以直接使用字段名）
+FEE_RULE_COLUMNS = {
+    '费用': 'fee', '名称': 'label', **{label: field for field, label in CONDITION_LABELS.items()},
+    '计费基数': 'base', '费率': 'rate', '最低': 'minimum', '最高': 'maximum', '附加': 'extra', '币种': 'currency',
+    '说明': 'note',
+}
+
+# 默认规则（即原第四步写死的公式）
+DEFAULT_FEE_RULES = [
+    {'fee': 'inland_fee', 'base': 'volume', 'rate': 10, 'minimum': 50, 'currency': 'USD'},
+    {'fee': 'forwarder_fee', 'base': 'volume', 'rate': 2.5, 'minimum': 70, 'currency': 'USD'},
+    {'fee': 'inspection_fee', 'inspection_type': '*B*', 'base': 'fixed', 'rate': 30, 'currency': 'USD',
+     'note': '检验检疫类别含B时收取'},
+    {'fee': 'certificate_fee', 'inspection_type': '*B*', 'base': 'fixed', 'rate': 100, 'currency': 'USD',
+     'note': '检验检疫类别含B时收取'},
+    {'fee': 'customs_fee', 'trade_term': '!EXW', 'base': 'fixed', 'rate': 30, 'currency': 'USD'},
+    {'fee': 'insurance', 'trade_term': 'CIF,CIP,DAP,DPU,DDP', 'base': 'value', 'rate': '110%×0.5%',
+     'currency': 'CNY'},
+    {'fee': 'bank_fee', 'label': '托收费用', 'payment': 'D/P,D/A', 'base': 'value', 'rate': 0.001,
+     'minimum': 15, 'maximum': 285, 'extra': 45, 'currency': 'USD', 'note': '根据支付方式'},
+    {'fee': 'bank_fee', 'label': '信用证费用', 'payment': '*L/C*', 'base': 'value', 'rate': 0.00125,
+     'minimum': 15, 'extra': 75, 'currency': 'USD', 'note': '根据支付方式'},
+]
+
+
+def _blank(value):
+    return value is None or (isinstance(value, float) and math.isnan(value)) or str(value).strip() == ''
+
+
+def _text(value):
+    return '' if _blank(value) else str(value).strip()
+
+
+def _number(value, default, row, column):
+    if _blank(value):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"费用规则第{row}条：{column}“{value}”不是数字") from None
+
+
+def _factors(value, row):
+    """费率 -> 依次相乘的因子元组；可写成 110%×0.5% 这样的乘积，按原顺序相乘以保证结果与手写公式一致"""
+    if _blank(value):
+        return (0.0,)
+    if not isinstance(value, str):
+        return (_number(value, 0.0, row, '费率'),)
+    factors = []
+    for part in value.replace('*', '×').split('×'):
+        part = part.strip()
+        percent = part.endswith('%')
+        number = _number(part.rstrip('%'), None, row, '费率')
+        if number is None:
+            raise ValueError(f"费用规则第{row}条：费率“{value}”格式有误")
+        factors.append(number / 100.0 if percent else number)
+    return tuple(factors)
+
+
+def _lookup(value, labels, row, column):
+    """字段名或中文名称 -> 字段名"""
+    text = _text(value)
+    for field, label in labels.items():
+        if text in (field, label):
+            return field
+    raise ValueError(f"费用规则第{row}条：无法识别的{column}“{text}”")
+
+
+def _condition(value):
+    """条件单元格 -> (是否取反, 取值模式元组)；留空返回 None"""
+    text = _text(value)
+    negate = text.startswith('!')
+    patterns = tuple(part.strip() for part in text.lstrip('!').replace('，', ',').split(',') if part.strip())
+    return (negate, patterns) if patterns else None
+
+
+@lru_cache(maxsize=4096)
+def _matches(condition, value):
+    """单个取值是否满足条件 (是否取反, 取值模式元组)"""
+    negate, patterns = condition
+    return any(fnmatchcase(value, pattern) for pattern in patterns) != negate
+
+
+def _plain_number(value):
+    return f"{value:g}"
+
+
+class FeeRule:
+    """编译后的一条规则"""
+
+    __slots__ = ('fee', 'label', 'conditions', 'base', 'rate', 'factors', 'minimum', 'maximum', 'extra', 'currency',
+                 'note')
+
+    def __init__(self, record, row=0):
+        self.fee = _lookup(record.get('fee'), FEE_LABELS, row, '费用')
+        self.label = _text(record.get('label')) or FEE_LABELS[self.fee]
+        self.conditions = tuple((field, condition) for field in CONDITION_LABELS
+                                if (condition := _condition(record.get(field))) is not None)
+        self.base = _lookup(_text(record.get('base')) or 'fixed', BASE_LABELS, row, '计费基数')
+        self.factors = _factors(record.get('rate'), row)
+        self.rate = _text(record.get('rate')) if len(self.factors) > 1 else self.factors[0]
+        self.minimum = _number(record.get('minimum'), None, row, '最低')
+        self.maximum = _number(record.get('maximum'), None, row, '最高')
+        self.extra = _number(record.get('extra'), 0.0, row, '附加')
+        currency = _text(record.get('currency')) or 'CNY'
+        if currency.upper() not in CURRENCIES:
+            raise ValueError(f"费用规则第{row}条：无法识别的币种“{currency}”")
+        self.currency = CURRENCIES[currency.upper()]
+        self.note = _text(record.get('note'))
+
+    def amount(self, bases, exchange_rate):
+        """按计费基数计算金额并折算为该费用的币种"""
+        amount = bases[self.base]
+        for factor in self.factors:
+            amount = amount * factor
+        if self.minimum is not None:
+            amount = np.maximum(self.minimum, amount)
+        if self.maximum is not None:
+            amount = np.minimum(self.maximum, amount)
+        if self.extra:
+            amount = amount + self.extra
+        fee_currency = 'USD' if self.fee in USD_FEES else 'CNY'
+        if self.currency == 'USD' and fee_currency == 'CNY':
+            return amount * exchange_rate
+        if self.currency == 'CNY' and fee_currency == 'USD':
+            return amount / exchange_rate
+        return amount
+
+    def record(self):
+        """还原为规则表的一行（字段名为键），可以重新编译为同样的规则"""
+        conditions = dict(self.conditions)
+        record = {'fee': self.fee, 'label': self.label}
+        for field in CONDITION_LABELS:
+            negate, patterns = conditions.get(field, (False, ()))
+            record[field] = ('!' if negate else '') + ','.join(patterns)
+        record.update({'base': self.base, 'rate': self.rate, 'minimum': self.minimum, 'maximum': self.maximum,
+                       'extra': self.extra, 'currency': self.currency, 'note': self.note})
+        return record
+
+    def describe(self, total_volume, exchange_rate):
+        """预算表中的计算原理：有说明时用说明，否则写出公式"""
+        if self.note:
+            return self.note
+        base = {'fixed': None, 'volume': f"{total_volume:.1f}", 'value': '采购成本'}[self.base]
+        rate = self.rate if isinstance(self.rate, str) else _plain_number(self.rate)
+        text = rate if base is None else f"{base}×{rate}"
+        if self.minimum is not None:
+            text = f"MAX({_plain_number(self.minimum)}, {text})"
+        if self.maximum is not None:
+            text = f"MIN({text}, {_plain_number(self.maximum)})"
+        if self.extra:
+            text = f"{text}+{_plain_number(self.extra)}"
+        fee_currency = 'USD' if self.fee in USD_FEES else 'CNY'
+        if self.currency != fee_currency:
+            text = f"{text}{'×' if self.currency == 'USD' else '÷'}{exchange_rate:.3f}"
+        return text
+
+
+class _Matcher:
+    """逐字段判断条件，返回标量或与该字段等长的布尔数组
+
+    标量取值直接查缓存；数组每个字段用 pd.factorize 去重一次，每个不同的取值只做一次模式匹配，再按位置展开。
+    空值按空字符串匹配。
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.codes = {}
+        self.masks = {}
+
+    def _codes(self, field):
+        """字段取值 -> (每个元素对应的去重序号, 去重后的取值)"""
+        if field not in self.codes:
+            values = self.values[field]
+            codes, uniques = pd.factorize(values.ravel())
+            # 空值的序号为 -1，对应去重取值末尾追加的空字符串
+            self.codes[field] = (codes.reshape(values.shape), [str(value) for value in uniques] + [''])
+        return self.codes[field]
+
+    def _mask(self, field, condition):
+        values = self.values[field]
+        if values.ndim == 0:
+            return _matches(condition, str(values.item()))
+        key = (field, condition)
+        if key not in self.masks:
+            codes, uniques = self._codes(field)
+            self.masks[key] = np.array([_matches(condition, value) for value in uniques], dtype=bool)[codes]
+        return self.masks[key]
+
+    def mask(self, conditions):
+        result = True
+        for field, condition in conditions:
+            result = result & self._mask(field, condition)
+        return result
+
+
+class FeeSchedule:
+    """编译后的费用规则表；按规则表还原，可以跨进程传递和作为缓存键"""
+
+    def __init__(self, records=DEFAULT_FEE_RULES):
+        self.rules = {fee: [] for fee in FEE_LABELS}
+        for row, record in enumerate(records, start=1):
+            rule = FeeRule(record, row)
+            self.rules[rule.fee].append(rule)
+        self._chosen_cache = {}
+
+    def evaluate(self, purchase_total, total_volume, exchange_rate, trade_term="FOB", payment="T/T",
+                 inspection_type="无", transport_note="普通"):
+        """计算各项费用，参数可以是标量或可广播的数组；返回 {费用字段: 金额}，金额均为广播后的形状"""
+        purchase_total = np.asarray(purchase_total, dtype=float)
+        total_volume = np.asarray(total_volume, dtype=float)
+        exchange_rate = np.asarray(exchange_rate, dtype=float)
+        values = {'trade_term': np.asarray(trade_term), 'payment': np.asarray(payment),
+                  'inspection_type': np.asarray(inspection_type), 'transport_note': np.asarray(transport_note)}
+        shape = np.broadcast_shapes(purchase_total.shape, total_volume.shape, exchange_rate.shape,
+                                    *[value.shape for value in values.values()])
+        bases = {'fixed': 1.0, 'volume': total_volume, 'value': purchase_total}
+        if all(value.size == 1 for value in values.values()):
+            # 单笔订单：每项费用只计算适用的那一条规则
+            fees = {}
+            for fee, rule in self._chosen(*[str(value.item()) for value in values.values()]).items():
+                amount = 0.0 if rule is None else rule.amount(bases, exchange_rate)
+                fees[fee] = np.broadcast_to(amount, shape).astype(float)
+            return fees
+        matcher = _Matcher(values)
+        fees = {}
+        for fee, rules in self.rules.items():
+            # 条件为标量时直接判断：不满足的规则跳过，满足的规则之后的规则不会被用到
+            masks, amounts, default = [], [], None
+            for rule in rules:
+                mask = matcher.mask(rule.conditions)
+                if np.ndim(mask) == 0:
+                    if mask:
+                        default = rule.amount(bases, exchange_rate)
+                        break
+                    continue
+                masks.append(mask)
+                amounts.append(rule.amount(bases, exchange_rate))
+            # 从后往前覆盖，前面的规则优先
+            amount = 0.0 if default is None else default
+            for mask, rule_amount in zip(reversed(masks), reversed(amounts)):
+                amount = np.where(mask, rule_amount, amount)
+            if np.shape(amount) != shape:
+                amount = np.broadcast_to(amount, shape).astype(float)
+            fees[fee] = amount
+        return fees
+
+    def _chosen(self, trade_term, payment, inspection_type, transport_note):
+        """一组条件取值下各项费用适用的规则（没有时为 None），按取值缓存"""
+        key = (trade_term, payment, inspection_type, transport_note)
+        chosen = self._chosen_cache.get(key)
+        if chosen is None:
+            chosen = {fee: self.matching(fee, *key) for fee in self.rules}
+            self._chosen_cache[key] = chosen
+        return chosen
+
+    def applied_records(self, trade_term="FOB", payment="T/T", inspection_type="无", transport_note="普通"):
+        """单笔订单实际适用的规则（每项费用至多一条），随报价方案保存；重新编译后对该订单给出同样的名称和原理"""
+        chosen = self._chosen(str(trade_term), str(payment), str(inspection_type), str(transport_note))
+        return [rule.record() for rule in chosen.values() if rule is not None]
+
+    def __reduce__(self):
+        return FeeSchedule, (self.records(),)
+
+    def records(self):
+        """全部规则，按费用排列"""
+        return [rule.record() for rules in self.rules.values() for rule in rules]
+
+    def table(self):
+        """全部规则（中文表头和取值），用于页面显示"""
+        headers = {field: label for label, field in FEE_RULE_COLUMNS.items()}
+        names = {**FEE_LABELS, **BASE_LABELS}
+        rows = []
+        for record in self.records():
+            # 费率可能是数值或 "110%×0.5%" 这样的连乘，统一显示为文本
+            rate = record['rate']
+            record.update(fee=names[record['fee']], base=names[record['base']],
+                          rate=rate if isinstance(rate, str) else _plain_number(rate))
+            rows.append({headers[field]: value for field, value in record.items()})
+        return rows
+
+    def matching(self, fee, trade_term="FOB", payment="T/T", inspection_type="无", transport_note="普通"):
+        """单笔订单该费用适用的规则，没有时返回 None"""
+        values = {'trade_term': trade_term, 'payment': payment, 'inspection_type': inspection_type,
+                  'transport_note': transport_note}
+        for rule in self.rules[fee]:
+            if all(_matches(condition, str(values[field])) for field, condition in rule.conditions):
+                return rule
+        return None
+
+
+DEFAULT_FEE_SCHEDULE = FeeSchedule()
@@ -0,0 +1,91 @@
+"""汇率历史：按货币对保存按日期排好序的汇率，支持按任意日期取当日有效汇率（as-of），可整批查询"""
+import numpy as np
+import pandas as pd
+
+from data_loader import DEFAULT_EXCHANGE_PAIR, DEFAULT_EXCHANGE_RATE
+
+# NaT 的整数表示；没有日期的汇率排在最前，视为最早生效
+_NAT = np.datetime64('NaT', 'ns').view('i8')
+
+
+def normalize_pair(pair):
+    return ''.join(str(pair or '').split()).upper()
+
+
+def _inverse(pair):
+    base, _, quote = pair.partition('/')
+    return f"{quote}/{base}" if quote else ''
+
+
+def _as_i8(dates):
+    """日期（字符串/date/datetime/Timestamp，可含空值）-> 纳秒整数数组，空值为 _NAT"""
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+    if getattr(dates.dt, 'tz', None) is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy('datetime64[ns]').view('i8')
+
+
+class FxStore:
+    """只读汇率历史，每个货币对为 (日期数组, 汇率数组)，查找用二分"""
+
+    def __init__(self, exchange=None):
+        self._series = {}
+        if exchange is None or len(exchange) == 0:
+            return
+        if 'pair' in exchange:
+            pairs = exchange['pair'].map(normalize_pair).to_numpy()
+        else:
+            pairs = np.full(len(exchange), DEFAULT_EXCHANGE_PAIR)
+        dates = _as_i8(exchange['date']) if 'date' in exchange else np.full(len(exchange), _NAT)
+        rates = pd.to_numeric(exchange['rate'], errors='coerce').to_numpy(dtype=float)
+        valid = ~np.isnan(rates)
+        for pair in np.unique(pairs[valid]):
+            mask = valid & (pairs == pair)
+            # 稳定排序：同一天有多条时取表中靠后的一条
+            order = np.argsort(dates[mask], kind='stable')
+            self._series[pair] = (dates[mask][order], rates[mask][order])
+
+    def __len__(self):
+        return len(self._series)
+
+    @property
+    def pairs(self):
+        return sorted(self._series)
+
+    def history(self, pair=DEFAULT_EXCHANGE_PAIR):
+        """货币对的全部历史，DataFrame(date, rate)，按日期升序"""
+        dates, rates = self._series.get(normalize_pair(pair), (np.array([], dtype='i8'), np.array([])))
+        return pd.DataFrame({'date': dates.view('datetime64[ns]'), 'rate': rates})
+
+    def _as_of(self, pair, when, default):
+        series, invert = self._series.get(pair), False
+        if series is None:
+            series, invert = self._series.get(_inverse(pair)), True
+        if series is None:
+            return np.full(len(when), default, dtype=float)
+        dates, rates = series
+        # 没有日期的查询取最新汇率
+        position = np.where(when == _NAT, len(dates) - 1, np.searchsorted(dates, when, side='right') - 1)
+        values = np.where(position >= 0, rates[np.maximum(position, 0)], np.nan)
+        if invert:
+            values = 1.0 / values
+        return np.where(np.isnan(values), default, values)
+
+    def rates(self, pairs, dates, default=DEFAULT_EXCHANGE_RATE):
+        """整批查询：每行取该货币对在该日期（含当天）之前最近一次的汇率；没有日期取最新，查不到时为 default
+
+        pairs 可以是单个货币对或与 dates 等长的数组。返回 float 数组。
+        """
+        when = _as_i8(dates)
+        if isinstance(pairs, str):
+            return self._as_of(normalize_pair(pairs), when, default)
+        codes, uniques = pd.factorize(pd.Series(pairs, dtype=object).fillna('').astype(str))
+        result = np.empty(len(when), dtype=float)
+        for index, pair in enumerate(uniques):
+            mask = codes == index
+            result[mask] = self._as_of(normalize_pair(pair), when[mask], default)
+        return result
+
+    def rate(self, pair=DEFAULT_EXCHANGE_PAIR, date=None, default=DEFAULT_EXCHANGE_RATE):
+        """单笔查询：货币对在 date 当天有效的汇率，date 为空时取最新汇率"""
+        return float(self.rates(pair, [date], default)[0])
@@ -0,0 +1,76 @@
+"""HS编码税率表：按 10/8/6/4 位最长前缀查找监管条件、检验检疫、法定单位和各项税率"""
+import numpy as np
+import pandas as pd
+
+# 查找时依次尝试的前缀长度，长的优先
+PREFIX_LENGTHS = (10, 8, 6, 4)
+HS_FIELDS = ['hs_code', 'customs_condition', 'inspection_type', 'legal_unit',
+             'pref_tax_rate', 'vat_rate', 'export_tax_rate', 'export_rebate_rate']
+RATE_FIELDS = ['pref_tax_rate', 'vat_rate', 'export_tax_rate', 'export_rebate_rate']
+
+# 没有税率表时 HS编码信息行的默认值（即原页面中写死的 8476810000）
+DEFAULT_HS = {
+    'hs_code': '8476810000',
+    'customs_condition': '无',
+    'inspection_type': '无',
+    'legal_unit': '台(SET)',
+    'pref_tax_rate': 50.0,
+    'vat_rate': 13.0,
+    'export_tax_rate': 0.0,
+    'export_rebate_rate': 13.0,
+}
+
+
+def normalize_code(code):
+    """只保留数字，超过10位的部分（如检验检疫附加码）不参与查找"""
+    return ''.join(ch for ch in str(code or '') if ch.isdigit())[:max(PREFIX_LENGTHS)]
+
+
+class TariffTable:
+    """只读税率表，以规范化的HS编码为键；查找最多尝试四次字典访问
+
+    位数不是 10/8/6/4 的编码永远不会被查到，读取时跳过并记在 skipped 中（原样保留），由页面提示。
+    """
+
+    def __init__(self, records):
+        self.entries = {}
+        skipped = []
+        for record in records:
+            code = normalize_code(record.get('hs_code'))
+            if len(code) not in PREFIX_LENGTHS:
+                if code:
+                    skipped.append(str(record.get('hs_code')))
+                continue
+            entry = {field: record.get(field, DEFAULT_HS[field]) for field in HS_FIELDS}
+            for field in RATE_FIELDS:
+                entry[field] = float(entry[field] or 0.0)
+            entry['hs_code'] = code
+            self.entries[code] = entry
+        self.skipped = tuple(skipped)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, code):
+        """最长前缀匹配，返回税率表中的一行（hs_code 为命中的前缀），找不到时返回 None"""
+        code = normalize_code(code)
+        for length in PREFIX_LENGTHS:
+            if len(code) >= length:
+                entry = self.entries.get(code[:length])
+                if entry is not None:
+                    return entry
+        return None
+
+    def lookup_many(self, codes):
+        """整列查找，返回与 codes 等长的 DataFrame（列为 HS_FIELDS，找不到的行为空）；每个不同的编码只查一次"""
+        keys, uniques = pd.factorize(pd.Series(codes, dtype=object).fillna('').astype(str))
+        found = [self.lookup(code) for code in uniques]
+        table = pd.DataFrame([entry or {} for entry in found], columns=HS_FIELDS)
+        if len(table) == 0:
+            return pd.DataFrame(index=range(len(keys)), columns=HS_FIELDS)
+        rows = table.iloc[np.where(keys >= 0, keys, 0)].reset_index(drop=True)
+        rows.loc[keys < 0] = np.nan
+        for field in RATE_FIELDS:
+            rows[field] = pd.to_numeric(rows[field])
+        return rows
+
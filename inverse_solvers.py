@@ -0,0 +1,81 @@
+"""反向求解：盈亏平衡报价、目标利润率报价，以及账户余额可承受的最大交易数量"""
+import numpy as np
+
+from budget_engine import compute_totals, compute_budget
+from container_solver import solve_containers_batch
+
+# 每轮同时试算的候选数量个数
+SEARCH_WIDTH = 64
+
+
+def price_for_margin(budget, quantity, exchange_rate, margin, cost_key='total_cost'):
+    """达到目标利润率所需报价(USD/单位)
+
+    利润率口径与页面一致：利润 ÷ 采购成本。成本与报价无关，因此可以直接反解：
+    报价 = (成本 + 利润率 × 采购成本) ÷ (数量 × 汇率)。cost_key 可选 'total_cost'(第四步总成本) 或 'reverse_cost'。
+    """
+    quantity = np.asarray(quantity, dtype=float)
+    exchange_rate = np.asarray(exchange_rate, dtype=float)
+    target = budget[cost_key] + np.asarray(margin, dtype=float) * budget['purchase_total']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(quantity * exchange_rate > 0, target / (quantity * exchange_rate), np.nan)
+
+
+def break_even_price(budget, quantity, exchange_rate, cost_key='total_cost'):
+    """利润为0的报价(USD/单位)"""
+    return price_for_margin(budget, quantity, exchange_rate, 0.0, cost_key)
+
+
+def budget_for_quantities(quantities, order):
+    """按不同交易数量重新计算货物总量、装箱运费和预算
+
+    order 为订单参数字典：specs、purchase_price、vat_rate、export_rebate_rate、exchange_rate，
+    可选 expected_profit_rate、trade_term、payment、inspection_type、freight_data、transport_note、load_capacities、
+    fee_rules。
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    specs = order['specs']
+    totals = compute_totals(quantities, specs['units_per_package'], specs['single_gross'],
+                            specs['single_net'], specs['single_volume'])
+    freight = solve_containers_batch(totals['total_volume'], totals['total_gross'],
+                                     order.get('freight_data'), order.get('transport_note', '普通'),
+                                     order.get('load_capacities'))['freight']
+    return compute_budget(
+        quantities, order['purchase_price'], order['vat_rate'], order['export_rebate_rate'],
+        order['exchange_rate'], order.get('expected_profit_rate', 0.0), totals['total_volume'], freight,
+        trade_term=order.get('trade_term', 'FOB'), payment=order.get('payment', 'T/T'),
+        inspection_type=order.get('inspection_type', '无'), transport_note=order.get('transport_note', '普通'),
+        fee_rules=order.get('fee_rules'))
+
+
+def max_affordable_quantity(account_balance, order, cost_key='total_cost'):
+    """总成本不超过账户余额的最大整数交易数量，返回 (数量, 该数量下的预算)
+
+    总成本随数量单调不减，但因包装取整、装箱柜数和 MAX() 费用下限呈阶梯状，
+    因此不做线性反解，而是在 [0, 上界] 内每轮并行试算 SEARCH_WIDTH 个候选数量逐步缩小区间。
+    上界取自只含采购成本减退税的线性部分，其余费用均非负。
+    """
+    unit_cost = order['purchase_price'] * (1.0 - order['export_rebate_rate'] / 100.0 / (1.0 + order['vat_rate'] / 100.0))
+    if account_balance <= 0 or unit_cost <= 0:
+        return 0, None
+    low, high = 0, int(np.floor(account_balance / unit_cost)) + 1
+
+    # 不变量：low 可承受（0 视为可承受），high 不可承受
+    while high - low > 1:
+        candidates = np.unique(np.linspace(low, high, SEARCH_WIDTH + 2).round().astype(int)[1:-1])
+        candidates = candidates[(candidates > low) & (candidates < high)]
+        if len(candidates) == 0:
+            candidates = np.arange(low + 1, high)
+        affordable = budget_for_quantities(candidates, order)[cost_key] <= account_balance
+        if affordable.all():
+            low = int(candidates[-1])
+        else:
+            first_bad = int(np.argmin(affordable))
+            high = int(candidates[first_bad])
+            if first_bad > 0:
+                low = int(candidates[first_bad - 1])
+
+    if low == 0:
+        return 0, None
+    budget = budget_for_quantities([low], order)
+    return low, {key: float(np.ravel(value)[0]) for key, value in budget.items()}
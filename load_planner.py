@@ -0,0 +1,70 @@
+"""托盘装柜规划：按托盘长宽高、可堆叠层数和重量，估算每种柜型能装多少托盘
+
+地面排布用两段式启发算法：柜内沿长度（或宽度）分成两段，两段中托盘方向相互垂直，枚举分段位置取最大值；
+再乘以高度方向可堆叠的层数，并受柜子最大载重限制。结果可换算成各柜型的有效体积交给装箱求解。
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from container_solver import CONTAINER_SPECS, container_class
+
+# 柜型 -> 内部尺寸 (长, 宽, 高)，单位米
+CONTAINER_INTERIORS = {
+    "20'GP": (5.898, 2.352, 2.393),
+    "40'GP": (12.032, 2.352, 2.393),
+    "40'HC": (12.032, 2.352, 2.698),
+    "20'RF": (5.450, 2.290, 2.260),
+    "40'RF": (11.580, 2.290, 2.250),
+    "40'RH": (11.580, 2.290, 2.550),
+}
+# 尺寸比较时的容差（米），避免 1.2*2 这类浮点误差少算一排
+EPSILON = 1e-6
+
+
+def _fit(space, size):
+    return int(np.floor(space / size + EPSILON)) if size > 0 else 0
+
+
+def _two_block(length, width, a, b):
+    """沿长度分两段：前段托盘 a 边沿柜长，后段转90度，返回最多能放的托盘数"""
+    best = 0
+    across_first, across_second = _fit(width, b), _fit(width, a)
+    for n in range(_fit(length, a) + 1):
+        rest = length - n * a
+        best = max(best, n * across_first + _fit(rest, b) * across_second)
+    return best
+
+
+@lru_cache(maxsize=1024)
+def floor_layout(length, width, pallet_length, pallet_width):
+    """柜底一层最多能放的托盘数（托盘可水平旋转90度）"""
+    return max(
+        _two_block(length, width, pallet_length, pallet_width),
+        _two_block(length, width, pallet_width, pallet_length),
+        _two_block(width, length, pallet_length, pallet_width),
+        _two_block(width, length, pallet_width, pallet_length),
+    )
+
+
+def plan_load(pallet_length, pallet_width, pallet_height, pallet_weight, max_layers=1, transport_note="普通"):
+    """每种柜型的装载能力
+
+    托盘尺寸单位为米、重量为KGS，max_layers 为最多堆叠层数（1表示不可堆叠）。
+    返回列表，每项为 {'name', 'per_layer', 'layers', 'by_space', 'by_weight', 'pallets'}，pallets 为每柜最多托盘数。
+    """
+    plans = []
+    for name, _, _, payload in CONTAINER_SPECS[container_class(transport_note)]:
+        length, width, height = CONTAINER_INTERIORS[name]
+        per_layer = floor_layout(length, width, round(pallet_length, 4), round(pallet_width, 4))
+        layers = min(max(int(max_layers), 1), _fit(height, pallet_height)) if pallet_height > 0 else 0
+        by_space = per_layer * layers
+        by_weight = int(payload // pallet_weight) if pallet_weight > 0 else by_space
+        plans.append({'name': name, 'per_layer': per_layer, 'layers': layers, 'by_space': by_space,
+                      'by_weight': by_weight, 'pallets': min(by_space, by_weight)})
+    return plans
+
+
+def effective_capacities(plans, pallet_volume):
+    """各柜型的有效体积（CBM）= 每柜托盘数 × 单托体积；装箱求解按此体积计算柜数"""
+    return np.array([plan['pallets'] * pallet_volume for plan in plans], dtype=float)
@@ -0,0 +1,117 @@
+"""多商品订单：各行货物合并为一票装箱，整票运费和按票收取的费用按比例分摊回各行
+
+每行有自己的商品规格、数量、采购单价、增值税率和退税率；计算全部向量化，与行数成线性关系，装箱只求解一次。
+"""
+import numpy as np
+import pandas as pd
+
+from budget_engine import (calc_purchase_total, calc_quote_cost, calc_rebate, calc_suggested_price, calc_total_cost,
+                           compute_totals, safe_divide, shipment_fees)
+from container_solver import solve_containers
+from fee_rules import DOMESTIC_FEES
+
+LINE_COLUMNS = ['product_code', 'quantity', 'purchase_price', 'vat_rate', 'export_rebate_rate',
+                'units_per_package', 'single_gross', 'single_net', 'single_volume']
+
+# 整票费用 -> 分摊依据：与体积相关的按各行体积，其余按各行采购额
+ALLOCATION_BASIS = {
+    'freight_cny': 'volume',
+    'inland_fee': 'volume',
+    'forwarder_fee': 'volume',
+    'inspection_fee': 'value',
+    'certificate_fee': 'value',
+    'customs_fee': 'value',
+    'insurance': 'value',
+    'bank_fee': 'value',
+}
+
+# 分摊结果的列顺序
+RESULT_COLUMNS = [
+    'product_code', 'quantity', 'total_packages', 'total_gross', 'total_volume', 'purchase_total', 'rebate',
+    'freight_cny', 'inland_fee', 'forwarder_fee', 'inspection_fee', 'certificate_fee', 'customs_fee',
+    'insurance', 'domestic_total', 'bank_fee', 'total_cost', 'unit_cost', 'suggested_price',
+]
+RESULT_LABELS = {
+    'product_code': '商品编号', 'quantity': '交易数量', 'total_packages': '包装数', 'total_gross': '毛重(KGS)',
+    'total_volume': '体积(CBM)', 'purchase_total': '采购成本', 'rebate': '退税额', 'freight_cny': '国际运费',
+    'inland_fee': '内陆运费', 'forwarder_fee': '货代杂费', 'inspection_fee': '商检费', 'certificate_fee': '证书费',
+    'customs_fee': '报关费', 'insurance': '保险费', 'domestic_total': '国内费用合计', 'bank_fee': '银行费用($)',
+    'total_cost': '总成本', 'unit_cost': '单位成本', 'suggested_price': '建议报价($)',
+}
+
+
+def _shares(weights, fallback):
+    """各行占比；权重合计为0时改用 fallback（仍为0时平均分摊）"""
+    for values in (weights, fallback, np.ones(len(weights))):
+        total = values.sum()
+        if total > 0:
+            return values / total
+    return np.zeros(len(weights))
+
+
+def order_budget(lines, exchange_rate, expected_profit_rate=15.0, trade_term="FOB", payment="T/T",
+                 inspection_type="无", freight_data=None, transport_note="普通", fee_rules=None):
+    """多商品订单预算
+
+    lines 为 DataFrame，列见 LINE_COLUMNS（规格为单包装的数值，可由 budget_engine.product_specs_table 得到）；
+    可另有 inspection_type 列，各行的检验检疫类别合并后按整票匹配费用规则（默认规则下任一行含B即整票收取商检费和证书费）。
+    返回 {'lines': 各行分摊后的预算 DataFrame, 'total': 整票合计 float 字典, 'container': 装箱方案}。
+    金额除 bank_fee(USD) 和 suggested_price(USD/销售单位) 外均为人民币。
+    """
+    quantity = lines['quantity'].to_numpy(dtype=float)
+    purchase_price = lines['purchase_price'].to_numpy(dtype=float)
+    vat_rate = lines['vat_rate'].to_numpy(dtype=float)
+    export_rebate_rate = lines['export_rebate_rate'].to_numpy(dtype=float)
+
+    totals = compute_totals(quantity, lines['units_per_package'].to_numpy(dtype=float),
+                            lines['single_gross'].to_numpy(dtype=float), lines['single_net'].to_numpy(dtype=float),
+                            lines['single_volume'].to_numpy(dtype=float))
+    purchase_total = calc_purchase_total(purchase_price, quantity)
+    rebate = calc_rebate(purchase_total, vat_rate, export_rebate_rate)
+
+    if 'inspection_type' in lines:
+        types = {str(inspection_type)} | set(lines['inspection_type'].astype(str))
+        inspection_type = '/'.join(sorted(types - {'', '无'})) or inspection_type
+
+    # 整票：合并体积和毛重求装箱方案，按整票采购额和体积计算一次费用
+    shipment_volume = float(totals['total_volume'].sum())
+    shipment_gross = float(totals['total_gross'].sum())
+    shipment_value = float(purchase_total.sum())
+    container = solve_containers(shipment_volume, shipment_gross, freight_data, transport_note)
+    fees = {key: float(value) for key, value in
+            shipment_fees(shipment_value, shipment_volume, exchange_rate, trade_term, payment, inspection_type,
+                          transport_note, fee_rules).items()}
+    fees['freight_cny'] = container['freight'] * exchange_rate
+
+    # 分摊回各行
+    shares = {
+        'volume': _shares(totals['total_volume'], totals['total_gross']),
+        'value': _shares(purchase_total, quantity),
+    }
+    allocated = {key: fees[key] * shares[basis] for key, basis in ALLOCATION_BASIS.items()}
+    domestic_total = sum(allocated[key] for key in DOMESTIC_FEES)
+    total_cost = calc_total_cost(purchase_total, rebate, {**allocated, 'domestic_total': domestic_total},
+                                 exchange_rate, allocated['freight_cny'])
+    # 建议报价与单品页面一致：采购-退税+运费，再加利润率
+    quote_cost = calc_quote_cost(purchase_total, rebate, allocated['freight_cny'])
+    suggested_price = calc_suggested_price(quote_cost, expected_profit_rate, quantity, exchange_rate)
+
+    result = pd.DataFrame({
+        'product_code': lines['product_code'].to_numpy(),
+        'quantity': quantity,
+        'total_packages': totals['total_packages'],
+        'total_gross': totals['total_gross'],
+        'total_volume': totals['total_volume'],
+        'purchase_total': purchase_total,
+        'rebate': rebate,
+        **allocated,
+        'domestic_total': domestic_total,
+        'total_cost': total_cost,
+        'unit_cost': safe_divide(total_cost, quantity),
+        'suggested_price': suggested_price,
+    })[RESULT_COLUMNS]
+
+    total = {key: float(result[key].sum()) for key in RESULT_COLUMNS if key not in
+             ('product_code', 'unit_cost', 'suggested_price')}
+    total['quote_cost'] = float(quote_cost.sum())
+    return {'lines': result, 'total': total, 'container': container}
@@ -0,0 +1,85 @@
+"""商品目录：按商品编号、中英文名称和HS编码建立索引，支持前缀和子串搜索"""
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+
+SEARCH_FIELDS = ['product_code', 'product_name', 'product_name_en', 'hs_code']
+
+
+def _normalize(text):
+    return ''.join(str(text or '').split()).lower()
+
+
+def _grams(text):
+    """单字和相邻双字，作为子串搜索的倒排索引键"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class ProductCatalog:
+    """只读商品目录，索引在构建时一次性生成"""
+
+    def __init__(self, products):
+        self.records = []
+        self.by_code = {}
+        for product in products:
+            code = str(product.get('product_code', '')).strip()
+            if not code:
+                continue
+            if code in self.by_code:
+                self.records[self.by_code[code]] = product
+            else:
+                self.by_code[code] = len(self.records)
+                self.records.append(product)
+
+        # 前缀索引：排好序的 (规范化字段值, 记录号)
+        self._sorted = []
+        # 子串索引：单字/双字 -> 记录号集合
+        self._grams = defaultdict(set)
+        self._texts = []
+        for index, product in enumerate(self.records):
+            texts = [_normalize(product.get(field, '')) for field in SEARCH_FIELDS]
+            texts = [text for text in texts if text]
+            self._texts.append(texts)
+            for text in texts:
+                self._sorted.append((text, index))
+                for gram in _grams(text):
+                    self._grams[gram].add(index)
+        self._sorted.sort()
+        self._keys = [key for key, _ in self._sorted]
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, code):
+        """按商品编号取商品，找不到时返回 None"""
+        index = self.by_code.get(str(code).strip())
+        return None if index is None else self.records[index]
+
+    def _prefix(self, query):
+        # 从二分位置按下标向后取，不复制剩余索引；键有序，遇到第一个不匹配的即可停止
+        for position in range(bisect_left(self._keys, query), len(self._sorted)):
+            key, index = self._sorted[position]
+            if not key.startswith(query):
+                break
+            yield index
+
+    def _substring(self, query):
+        grams = [query[i:i + 2] for i in range(len(query) - 1)] or [query]
+        postings = [self._grams.get(gram, set()) for gram in grams]
+        candidates = set.intersection(*sorted(postings, key=len)) if postings else set()
+        for index in sorted(candidates):
+            if any(query in text for text in self._texts[index]):
+                yield index
+
+    def search(self, query, limit=20):
+        """搜索商品：前缀匹配在前，子串匹配在后；查询为空时返回前 limit 个商品"""
+        query = _normalize(query)
+        if not query:
+            return self.records[:limit]
+        seen = OrderedDict()
+        for source in (self._prefix(query), self._substring(query)):
+            for index in source:
+                seen.setdefault(index, None)
+                if len(seen) >= limit:
+                    return [self.records[i] for i in seen]
+        return [self.records[i] for i in seen]
+
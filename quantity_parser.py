@@ -0,0 +1,119 @@
+"""带单位的数量解析：识别重量、体积和每包装数量，统一换算为 KGS / CBM / 单位每包装
+
+例如 "280.00KGS/托盘" -> 280.0 KGS，"617 LBS/CTN" -> 279.87 KGS，"90 CFT/PALLET" -> 2.55 CBM，
+"2 SETS/CTN" -> 2 单位每包装。单个字符串的结果会被缓存，整列解析时每个不同的字符串只解析一次。
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+WEIGHT = 'weight'
+VOLUME = 'volume'
+COUNT = 'count'
+# 带了单位但无法识别：按任何类别解析都返回0，由 unit_mismatch 报告
+UNKNOWN = 'unknown'
+
+# 单位 -> (类别, 换算系数)，换算到 KGS / CBM / 个
+UNITS = {
+    # 重量
+    'KG': (WEIGHT, 1.0), 'KGS': (WEIGHT, 1.0), 'KILO': (WEIGHT, 1.0), 'KILOS': (WEIGHT, 1.0),
+    'KILOGRAM': (WEIGHT, 1.0), 'KILOGRAMS': (WEIGHT, 1.0), '千克': (WEIGHT, 1.0), '公斤': (WEIGHT, 1.0),
+    'G': (WEIGHT, 0.001), 'GS': (WEIGHT, 0.001), 'GRAM': (WEIGHT, 0.001), 'GRAMS': (WEIGHT, 0.001), '克': (WEIGHT, 0.001),
+    'LB': (WEIGHT, 0.45359237), 'LBS': (WEIGHT, 0.45359237), 'POUND': (WEIGHT, 0.45359237),
+    'POUNDS': (WEIGHT, 0.45359237), '磅': (WEIGHT, 0.45359237),
+    'T': (WEIGHT, 1000.0), 'MT': (WEIGHT, 1000.0), 'TON': (WEIGHT, 1000.0), 'TONS': (WEIGHT, 1000.0),
+    'TONNE': (WEIGHT, 1000.0), 'TONNES': (WEIGHT, 1000.0), '吨': (WEIGHT, 1000.0),
+    # 体积
+    'CBM': (VOLUME, 1.0), 'M3': (VOLUME, 1.0), 'M³': (VOLUME, 1.0), '立方米': (VOLUME, 1.0), '立方': (VOLUME, 1.0),
+    'CFT': (VOLUME, 0.028316846592), 'CUFT': (VOLUME, 0.028316846592), 'FT3': (VOLUME, 0.028316846592),
+    'FT³': (VOLUME, 0.028316846592), '立方英尺': (VOLUME, 0.028316846592),
+    'L': (VOLUME, 0.001), 'LTR': (VOLUME, 0.001), 'LITER': (VOLUME, 0.001), 'LITRE': (VOLUME, 0.001), '升': (VOLUME, 0.001),
+    # 件数
+    'SET': (COUNT, 1.0), 'SETS': (COUNT, 1.0), 'PC': (COUNT, 1.0), 'PCS': (COUNT, 1.0), 'PIECE': (COUNT, 1.0),
+    'PIECES': (COUNT, 1.0), 'UNIT': (COUNT, 1.0), 'UNITS': (COUNT, 1.0), 'PR': (COUNT, 1.0), 'PRS': (COUNT, 1.0),
+    'PAIR': (COUNT, 1.0), 'PAIRS': (COUNT, 1.0), 'DOZ': (COUNT, 12.0), 'DOZEN': (COUNT, 12.0),
+    '台': (COUNT, 1.0), '套': (COUNT, 1.0), '件': (COUNT, 1.0), '个': (COUNT, 1.0), '只': (COUNT, 1.0),
+    '双': (COUNT, 1.0), '打': (COUNT, 12.0),
+}
+
+_QUANTITY_RE = re.compile(
+    r"(?P<number>[-+]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|[-+]?\.\d+)\s*(?P<unit>[A-Za-z³]+\d?|[一-鿿]+)?")
+_PER_RE = re.compile(r"[/每]")
+_CJK_RE = re.compile(r"[一-鿿]")
+
+Quantity = namedtuple('Quantity', ['value', 'kind', 'unit'])
+EMPTY = Quantity(0.0, None, '')
+
+
+def _lookup_unit(unit):
+    """识别单位；中文单位可能连着包装名（如“千克每托盘”），逐步截短匹配。英文单位只整体匹配，
+    避免 GALLONS、LAYERS 之类被截成 G、L"""
+    unit = unit.upper()
+    if unit in UNITS:
+        return unit, UNITS[unit]
+    if _CJK_RE.match(unit):
+        for end in range(len(unit) - 1, 0, -1):
+            if unit[:end] in UNITS:
+                return unit[:end], UNITS[unit[:end]]
+    return unit, (UNKNOWN, 1.0)
+
+
+@lru_cache(maxsize=65536)
+def parse_quantity(text):
+    """解析第一个“数字+单位”，返回 Quantity(换算后的数值, 类别, 原单位)；没有数字时返回数值0"""
+    if text is None:
+        return EMPTY
+    text = str(text).strip()
+    # 只看斜杠/“每”之前的部分，避免把 "/20托盘" 之类的分母当成数量
+    head = _PER_RE.split(text, maxsplit=1)[0] or text
+    match = _QUANTITY_RE.search(head) or _QUANTITY_RE.search(text)
+    if not match:
+        return EMPTY
+    number = float(match.group('number').replace(',', ''))
+    unit = match.group('unit') or ''
+    if not unit:
+        return Quantity(number, None, '')
+    unit, (kind, factor) = _lookup_unit(unit)
+    return Quantity(number * factor, kind, unit)
+
+
+def _as(text, kind):
+    quantity = parse_quantity(text)
+    if quantity.kind not in (kind, None):
+        return 0.0
+    return quantity.value
+
+
+def parse_weight(text):
+    """毛重/净重 -> KGS；没有单位时按 KGS，单位不是重量时返回0"""
+    return _as(text, WEIGHT)
+
+
+def parse_volume(text):
+    """体积 -> CBM；没有单位时按 CBM，单位不是体积时返回0"""
+    return _as(text, VOLUME)
+
+
+def parse_units_per_package(text):
+    """单位换算 -> 每包装的销售单位数，如 "2 SETS/CTN" -> 2"""
+    return _as(text, COUNT)
+
+
+PARSERS = {WEIGHT: parse_weight, VOLUME: parse_volume, COUNT: parse_units_per_package}
+
+
+def parse_column(values, kind):
+    """整列解析，返回 float 数组；每个不同的字符串只解析一次"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna('').astype(str))
+    parser = PARSERS[kind]
+    parsed = np.array([parser(value) for value in uniques], dtype=float)
+    return parsed[codes] if len(parsed) else np.zeros(len(codes))
+
+
+def unit_mismatch(text, kind):
+    """字符串带有单位但无法识别或类别不符时返回该单位，否则返回空字符串"""
+    quantity = parse_quantity(text)
+    return quantity.unit if quantity.kind not in (kind, None) else ''
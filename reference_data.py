@@ -0,0 +1,90 @@
+"""进程内共享的基础数据：同一份数据文件只保留一份只读快照，所有会话引用同一个对象
+
+快照包含商品目录、HS编码税率表、运费单价、客户信息、汇率历史和费用规则，创建后不再修改；会话的 session_state
+只保存快照的引用和自己的输入。取快照时比较数据文件签名（修改时间+大小），文件变化后只重新读取变化的工作表
+并换成新快照，旧快照在没有会话引用后释放。
+"""
+import threading
+from datetime import datetime
+from types import MappingProxyType
+
+from budget_engine import DEFAULT_FREIGHT
+from data_loader import DEFAULT_CUSTOMER, SAMPLE_PRODUCT, file_signature, load_reference_data, resolve_sources
+from fee_rules import DEFAULT_FEE_SCHEDULE
+from fx_store import FxStore
+from hs_tariff import TariffTable
+from product_catalog import ProductCatalog
+
+
+class ReferenceData:
+    """一份只读的基础数据快照；sources 为 {数据类别: 路径}，示例数据的快照没有 sources"""
+
+    __slots__ = ('catalog', 'products', 'tariff', 'freight', 'customer', 'fx', 'fee_rules', 'sources', 'signatures',
+                 'loaded_at')
+
+    def __init__(self, products, hs=None, freight=None, customer=None, exchange=None, sources=None, signatures=None,
+                 fee_rules=None):
+        catalog = ProductCatalog([MappingProxyType(product) for product in products])
+        values = {
+            'catalog': catalog,
+            'products': tuple(catalog.records),
+            'tariff': TariffTable(hs or []),
+            'freight': MappingProxyType({**DEFAULT_FREIGHT, **(freight or {})}),
+            'customer': MappingProxyType({**DEFAULT_CUSTOMER, **(customer or {})}),
+            'fx': FxStore(exchange),
+            'fee_rules': fee_rules or DEFAULT_FEE_SCHEDULE,
+            'sources': MappingProxyType(dict(sources or {})),
+            'signatures': MappingProxyType(dict(signatures or {})),
+            'loaded_at': datetime.now(),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ReferenceData 是只读的")
+
+    @property
+    def from_file(self):
+        return bool(self.sources)
+
+    def is_current(self):
+        """数据文件自读取以来没有变化（示例数据总是最新的）"""
+        return all(file_signature(path) == signature for path, signature in self.signatures.items())
+
+
+# 没有数据文件时使用的示例数据，所有会话共用
+SAMPLE_REFERENCE = ReferenceData([SAMPLE_PRODUCT])
+
+# 数据来源 -> 当前快照
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_reference(sources=None, on_sheet_loaded=None):
+    """取数据文件对应的共享快照，文件签名变化时重新读取；文件不存在时抛出 FileNotFoundError
+
+    on_sheet_loaded 的含义同 data_loader.load_reference_data，没有变化的工作表也会回调。
+    """
+    sources = resolve_sources(sources)
+    key = tuple(sorted(sources.items()))
+    # 先取签名再读取：读取期间文件又发生变化时，下次取快照会再读一次
+    signatures = {path: file_signature(path) for path in set(sources.values())}
+    reference = load_reference_data(sources, on_sheet_loaded=on_sheet_loaded)
+    with _shared_lock:
+        current = _shared.get(key)
+        if current is not None and dict(current.signatures) == signatures:
+            return current
+        current = ReferenceData(reference['product'], reference['hs'], reference['freight'], reference['customer'],
+                                reference['exchange'], sources, signatures, reference.get('fee'))
+        _shared[key] = current
+        return current
+
+
+def current_reference(reference):
+    """数据文件变化后返回新的共享快照，否则原样返回；文件已不存在或内容有误（如费用规则无法识别）时继续使用原快照"""
+    if not reference.from_file or reference.is_current():
+        return reference
+    try:
+        return shared_reference(dict(reference.sources))
+    except (FileNotFoundError, ValueError):
+        return reference
@@ -0,0 +1,148 @@
+"""运费和汇率风险模拟：按指定波动率或历史数据抽取出运时的运费和汇率，一次向量化计算当前报价的利润分布
+
+报价时的运费和汇率到出运时会变化。这里假设两者在 horizon_days 天内按对数正态波动（期望值不变），
+波动率可以手工指定，也可以用历史序列估计；有历史时按历史日收益的经验分布抽样，保留肥尾。
+运费和汇率的相关性用高斯 copula 表示。测试报价(USD)固定，利润和利润率口径与页面“反算利润率”一致。
+"""
+import numpy as np
+import pandas as pd
+
+from budget_engine import compute_budget
+
+DEFAULT_DRAWS = 50_000
+DEFAULT_HORIZON_DAYS = 60
+DEFAULT_SEED = 20240501
+PERCENTILES = [5, 25, 50, 75, 95]
+# simulate_margin 读取的订单字段，页面按这些字段缓存模拟结果
+ORDER_FIELDS = ('quantity', 'purchase_price', 'vat_rate', 'export_rebate_rate', 'expected_profit_rate', 'total_volume',
+                'trade_term', 'payment', 'inspection_type', 'transport_note')
+# 历史文件表头 -> 字段名；数值列可以叫 运费/汇率/值
+HISTORY_COLUMNS = {'日期': 'date', '运费': 'value', '汇率': 'value', '值': 'value'}
+PERCENTILE_LABELS = {
+    'percentile': '分位', 'freight': '运费(USD)', 'exchange_rate': '汇率', 'profit': '利润(¥)', 'profit_margin': '利润率',
+}
+
+
+def read_history(source):
+    """读取历史文件（CSV 或 Excel，表头为 日期 + 运费/汇率/值），返回按日期升序的 DataFrame(date, value)"""
+    name = str(getattr(source, 'name', source)).lower()
+    frame = pd.read_excel(source) if name.endswith(('.xlsx', '.xls')) else pd.read_csv(source)
+    frame = frame.rename(columns=HISTORY_COLUMNS)
+    if 'date' not in frame or 'value' not in frame:
+        raise ValueError("历史文件需要 日期 列和 运费/汇率/值 列")
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+    history = pd.DataFrame({'date': pd.to_datetime(frame['date'], errors='coerce'),
+                            'value': pd.to_numeric(frame['value'], errors='coerce')}).dropna()
+    return history[history['value'] > 0].sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def daily_returns(dates, values):
+    """相邻两次观测的对数收益，按间隔天数换算为日收益（除以 √天数）；同一天的重复观测忽略"""
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy('datetime64[D]').astype('i8')
+    values = np.asarray(values, dtype=float)
+    gaps = np.diff(dates).astype(float)
+    log_returns = np.diff(np.log(values))
+    valid = gaps > 0
+    return log_returns[valid] / np.sqrt(gaps[valid])
+
+
+def annual_volatility(returns):
+    """日收益 -> 年化波动率（按自然日 365 天）"""
+    returns = np.asarray(returns, dtype=float)
+    return float(returns.std(ddof=1) * np.sqrt(365.0)) if len(returns) > 1 else 0.0
+
+
+def _correlated_normals(draws, correlation, rng):
+    z = rng.standard_normal((2, draws))
+    z[1] = correlation * z[0] + np.sqrt(1.0 - correlation ** 2) * z[1]
+    return z
+
+
+def _uniform_ranks(z):
+    """标准正态样本 -> (0, 1) 内的均匀分位（按秩，避免依赖正态分布函数）"""
+    ranks = np.empty(len(z))
+    ranks[np.argsort(z)] = np.arange(len(z))
+    return (ranks + 0.5) / len(z)
+
+
+def draw_factors(z, horizon_days, volatility=0.0, returns=None):
+    """出运时价格 ÷ 当前价格的倍数
+
+    z 为标准正态样本。有 returns（历史日收益，至少两条）时按其经验分布取分位，否则按年化 volatility
+    的对数正态分布；两种方式都调整漂移使倍数的期望为 1。
+    """
+    horizon = max(float(horizon_days), 0.0) / 365.0
+    if returns is not None and len(returns) > 1:
+        returns = np.asarray(returns, dtype=float)
+        shocks = np.quantile(returns - returns.mean(), _uniform_ranks(z)) * np.sqrt(horizon * 365.0)
+        factors = np.exp(shocks)
+        return factors / factors.mean()
+    sigma = max(float(volatility), 0.0) * np.sqrt(horizon)
+    return np.exp(sigma * z - sigma ** 2 / 2.0)
+
+
+def simulate_margin(order, exchange_rate, best_freight, test_price, horizon_days=DEFAULT_HORIZON_DAYS,
+                    freight_volatility=0.0, fx_volatility=0.0, correlation=0.0, freight_returns=None,
+                    fx_returns=None, draws=DEFAULT_DRAWS, seed=DEFAULT_SEED, fee_rules=None):
+    """模拟 draws 组出运时的运费和汇率，返回每组的 freight、exchange_rate、profit、profit_margin
+
+    order 为页面的订单字典（数量、采购单价、税率、体积、贸易术语等）；波动率为年化小数（0.2 表示 20%），
+    freight_returns / fx_returns 为历史日收益，给出时代替对应的波动率；fee_rules 为第四步费用规则。
+    """
+    rng = np.random.default_rng(seed)
+    z = _correlated_normals(int(draws), float(np.clip(correlation, -1.0, 1.0)), rng)
+    freight = best_freight * draw_factors(z[0], horizon_days, freight_volatility, freight_returns)
+    rates = exchange_rate * draw_factors(z[1], horizon_days, fx_volatility, fx_returns)
+
+    budget = compute_budget(
+        order['quantity'], order['purchase_price'], order['vat_rate'], order['export_rebate_rate'], rates,
+        order['expected_profit_rate'], order['total_volume'], freight, trade_term=order['trade_term'],
+        payment=order['payment'], inspection_type=order['inspection_type'], test_price=test_price,
+        transport_note=order.get('transport_note', '普通'), fee_rules=fee_rules)
+    return {
+        'freight': freight,
+        'exchange_rate': rates,
+        'profit': budget['profit'],
+        'profit_margin': np.broadcast_to(budget['profit_margin'], budget['profit'].shape),
+    }
+
+
+def risk_summary(simulation, target_margin):
+    """未达到目标利润率的概率、亏损概率和期望利润；target_margin 为小数"""
+    margin = simulation['profit_margin']
+    return {
+        'miss_probability': float(np.mean(margin < target_margin)),
+        'loss_probability': float(np.mean(simulation['profit'] < 0.0)),
+        'expected_profit': float(simulation['profit'].mean()),
+        'expected_margin': float(margin.mean()),
+    }
+
+
+def percentile_frame(simulation, percentiles=PERCENTILES):
+    """各分位的运费、汇率、利润和利润率（各列分别取分位，不是同一组样本）"""
+    frame = pd.DataFrame({key: np.percentile(simulation[key], percentiles)
+                          for key in ('freight', 'exchange_rate', 'profit', 'profit_margin')})
+    frame.insert(0, 'percentile', [f"P{p}" for p in percentiles])
+    return frame
+
+
+def margin_histogram(simulation, bins=60):
+    """利润率直方图的分箱结果，图表只传分箱而不是全部样本"""
+    counts, edges = np.histogram(simulation['profit_margin'], bins=bins)
+    return pd.DataFrame({'margin_lo': edges[:-1], 'margin_hi': edges[1:], 'share': counts / counts.sum()})
+
+
+def histogram_chart(histogram, target_margin):
+    """利润率分布直方图，标出目标利润率"""
+    import altair as alt
+
+    bars = alt.Chart(histogram).mark_rect().encode(
+        x=alt.X('margin_lo:Q', title='利润率', axis=alt.Axis(format='%')), x2='margin_hi:Q',
+        y=alt.Y('share:Q', title='概率', axis=alt.Axis(format='%')),
+        color=alt.condition(alt.datum.margin_hi <= target_margin, alt.value('#e45756'), alt.value('#4c78a8')),
+        tooltip=[alt.Tooltip('margin_lo:Q', format='.1%', title='从'), alt.Tooltip('margin_hi:Q', format='.1%', title='到'),
+                 alt.Tooltip('share:Q', format='.2%', title='概率')],
+    )
+    rule = alt.Chart(pd.DataFrame({'target': [target_margin]})).mark_rule(color='black', strokeDash=[4, 2]).encode(
+        x='target:Q')
+    return bars + rule
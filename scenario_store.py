@@ -0,0 +1,212 @@
+"""报价方案存储：把完整的输入和预算结果保存到本地 SQLite，支持按客户/商品/贸易术语/日期筛选和分页"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DEFAULT_DATA_PATH
+
+DEFAULT_DB_PATH = os.environ.get(
+    "EXPORT_BUDGET_DB", os.path.join(os.path.dirname(DEFAULT_DATA_PATH), "Quotes.db"))
+PAGE_SIZE = 50
+
+# 列表页显示的列（其余内容在 inputs / budget 两个 JSON 字段中）
+LIST_COLUMNS = ['id', 'saved_at', 'quote_date', 'customer', 'product_code', 'product_name',
+                'trade_term', 'payment', 'quantity', 'suggested_price', 'total_cost']
+LIST_LABELS = {
+    'id': '编号', 'saved_at': '保存时间', 'quote_date': '报价日期', 'customer': '客户', 'product_code': '商品编号',
+    'product_name': '商品名称', 'trade_term': '贸易术语', 'payment': '支付方式', 'quantity': '交易数量',
+    'suggested_price': '建议报价($)', 'total_cost': '总成本(¥)',
+}
+FILTER_COLUMNS = ['customer', 'product_code', 'trade_term']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    saved_at TEXT NOT NULL,
+    quote_date TEXT NOT NULL,
+    customer TEXT NOT NULL DEFAULT '',
+    product_code TEXT NOT NULL DEFAULT '',
+    product_name TEXT NOT NULL DEFAULT '',
+    trade_term TEXT NOT NULL DEFAULT '',
+    payment TEXT NOT NULL DEFAULT '',
+    quantity REAL,
+    suggested_price REAL,
+    total_cost REAL,
+    inputs TEXT NOT NULL,
+    budget TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quotes_customer ON quotes (customer, id);
+CREATE INDEX IF NOT EXISTS idx_quotes_product ON quotes (product_code, id);
+CREATE INDEX IF NOT EXISTS idx_quotes_trade_term ON quotes (trade_term, id);
+CREATE INDEX IF NOT EXISTS idx_quotes_date ON quotes (quote_date, id);
+"""
+
+
+def _plain(value):
+    """转换为 JSON 可保存的值：numpy 数值取标量，日期转为 ISO 字符串"""
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _plain(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _row(quote):
+    """报价方案字典 -> quotes 表的一行；quote 含 inputs（页面全部输入）和 budget（预算结果）"""
+    inputs, budget = _plain(quote['inputs']), _plain(quote['budget'])
+    return (
+        quote.get('saved_at') or datetime.now().isoformat(timespec='seconds'),
+        str(inputs.get('quote_date') or date.today().isoformat()),
+        str(inputs.get('customer', '')), str(inputs.get('product_code', '')),
+        str(inputs.get('product_name', '')), str(inputs.get('trade_term', '')),
+        str(inputs.get('payment', '')), inputs.get('quantity'),
+        budget.get('suggested_price'), budget.get('total_cost'),
+        json.dumps(inputs, ensure_ascii=False), json.dumps(budget, ensure_ascii=False),
+    )
+
+
+class ScenarioStore:
+    """SQLite 报价方案库；每次操作使用独立连接，可在多个会话线程中共用一个实例"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._write_lock = threading.Lock()
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def save_many(self, quotes):
+        """在一个事务中批量写入，返回新方案的编号列表"""
+        rows = [_row(quote) for quote in quotes]
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO quotes (saved_at, quote_date, customer, product_code, product_name, trade_term, "
+                        "payment, quantity, suggested_price, total_cost, inputs, budget) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    # 同一事务内写入的编号连续，最后一个编号记录在 sqlite_sequence 中
+                    last = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'quotes'").fetchone()
+            finally:
+                conn.close()
+        last = last[0] if last else 0
+        return list(range(last - len(rows) + 1, last + 1))
+
+    def save(self, inputs, budget):
+        """保存一个报价方案，返回编号"""
+        return self.save_many([{'inputs': inputs, 'budget': budget}])[0]
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for column in FILTER_COLUMNS:
+            if filters.get(column):
+                clauses.append(f"{column} = ?")
+                params.append(str(filters[column]))
+        if filters.get('date_from'):
+            clauses.append("quote_date >= ?")
+            params.append(str(filters['date_from']))
+        if filters.get('date_to'):
+            clauses.append("quote_date <= ?")
+            params.append(str(filters['date_to']))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters):
+        where, params = self._where(filters)
+        conn = self._connect()
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM quotes{where}", params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def list(self, page=1, page_size=PAGE_SIZE, **filters):
+        """分页列出方案（最新的在前），返回 (DataFrame, 总条数)
+
+        filters 可包含 customer、product_code、trade_term（精确匹配）和 date_from、date_to（报价日期范围）。
+        """
+        where, params = self._where(filters)
+        conn = self._connect()
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM quotes{where}", params).fetchone()[0]
+            frame = pd.read_sql_query(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM quotes{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                conn, params=params + [int(page_size), (max(int(page), 1) - 1) * int(page_size)])
+        finally:
+            conn.close()
+        return frame, total
+
+    def distinct(self, column):
+        """某个筛选列已有的取值，用于下拉选项"""
+        if column not in FILTER_COLUMNS:
+            raise ValueError(column)
+        conn = self._connect()
+        try:
+            return [value for (value,) in conn.execute(f"SELECT DISTINCT {column} FROM quotes ORDER BY {column}")]
+        finally:
+            conn.close()
+
+    def load(self, quote_id):
+        """读取一个方案，返回 {'id', 'saved_at', 'inputs', 'budget'}，不存在时返回 None"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT id, saved_at, inputs, budget FROM quotes WHERE id = ?", (int(quote_id),)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {'id': row[0], 'saved_at': row[1], 'inputs': json.loads(row[2]), 'budget': json.loads(row[3])}
+
+    def iter_quotes(self, batch_size=500, **filters):
+        """按编号升序逐批读取符合条件的方案，逐个返回与 load 相同的字典；内存占用只与 batch_size 有关"""
+        where, params = self._where(filters)
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"SELECT id, saved_at, inputs, budget FROM quotes{where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for quote_id, saved_at, inputs, budget in rows:
+                    yield {'id': quote_id, 'saved_at': saved_at, 'inputs': json.loads(inputs), 'budget': json.loads(budget)}
+        finally:
+            conn.close()
+
+    def delete(self, quote_id):
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM quotes WHERE id = ?", (int(quote_id),))
+            finally:
+                conn.close()
+
+
+# 同一个数据库文件在进程内只初始化一次
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(path=DEFAULT_DB_PATH):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ScenarioStore(path)
+        return _stores[path]
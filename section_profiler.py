@@ -0,0 +1,105 @@
+"""页面分段计时：记录每次重跑中各区域的耗时，按会话和进程汇总 p50/p95，可导出为 JSON"""
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# 每个区域保留的最近样本数
+WINDOW = 500
+SUMMARY_LABELS = {
+    'section': '区域', 'count': '次数', 'last_ms': '最近(ms)', 'p50_ms': 'p50(ms)', 'p95_ms': 'p95(ms)',
+    'mean_ms': '平均(ms)', 'max_ms': '最大(ms)',
+}
+
+
+class SectionTimings:
+    """各区域最近 WINDOW 次耗时（秒），线程安全；区域按首次出现的顺序排列"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._samples = OrderedDict()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, section, seconds):
+        with self._lock:
+            if section not in self._samples:
+                self._samples[section] = deque(maxlen=self.window)
+                self._counts[section] = 0
+            self._samples[section].append(seconds)
+            self._counts[section] += 1
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+    def summary(self):
+        """每个区域一行：总次数、最近一次、p50、p95、平均和最大耗时（毫秒，按保留的样本计算）"""
+        with self._lock:
+            snapshot = [(section, np.array(samples) * 1000.0, self._counts[section])
+                        for section, samples in self._samples.items()]
+        return [{
+            'section': section,
+            'count': count,
+            'last_ms': round(float(values[-1]), 2),
+            'p50_ms': round(float(np.percentile(values, 50)), 2),
+            'p95_ms': round(float(np.percentile(values, 95)), 2),
+            'mean_ms': round(float(values.mean()), 2),
+            'max_ms': round(float(values.max()), 2),
+        } for section, values, count in snapshot]
+
+    def samples(self):
+        with self._lock:
+            return {section: [round(value * 1000.0, 3) for value in samples] for section, samples in self._samples.items()}
+
+
+# 进程内所有会话共用
+PROCESS_TIMINGS = SectionTimings()
+
+
+@contextmanager
+def timed(section, sinks):
+    """计时上下文，也可作装饰器；结束时把耗时记入 sinks() 返回的每个 SectionTimings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for timings in sinks():
+            timings.record(section, elapsed)
+
+
+class RerunClock:
+    """顶层脚本的分段计时：每次 lap 记录距上一次 lap 的耗时，total 记录整次重跑的耗时"""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, section):
+        now = time.perf_counter()
+        for timings in self.sinks():
+            timings.record(section, now - self.last)
+        self.last = now
+
+    def total(self, section):
+        elapsed = time.perf_counter() - self.start
+        for timings in self.sinks():
+            timings.record(section, elapsed)
+
+
+def export_json(session, process=PROCESS_TIMINGS, include_samples=True):
+    """会话和进程两级汇总导出为 UTF-8 JSON"""
+    payload = {
+        'exported_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'session': {'summary': session.summary()},
+        'process': {'summary': process.summary()},
+    }
+    if include_samples:
+        payload['session']['samples_ms'] = session.samples()
+        payload['process']['samples_ms'] = process.samples()
+    return json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
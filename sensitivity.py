@@ -0,0 +1,127 @@
+"""利润敏感性分析：在 测试报价 × 汇率 × 交易数量 网格上一次性计算利润和利润率，以及全部贸易术语 × 支付方式的对比"""
+import numpy as np
+import pandas as pd
+
+from budget_engine import PAYMENTS, TRADE_TERMS, calc_profit_margin, calc_revenue, compute_totals, compute_budget
+from container_solver import solve_containers_batch
+from inverse_solvers import price_for_margin
+
+# 贸易术语 × 支付方式 对比表的列名
+TERM_MATRIX_LABELS = {
+    'trade_term': '贸易术语', 'payment': '支付方式', 'insurance': '保险费(¥)', 'customs_fee': '报关费(¥)',
+    'bank_fee': '银行费用($)', 'total_cost': '总成本(¥)', 'suggested_price': '建议报价($)', 'profit': '测试报价利润(¥)',
+    'profit_margin': '测试报价利润率',
+}
+
+
+def profit_surface(test_prices, exchange_rates, quantities, specs, purchase_price, vat_rate,
+                   export_rebate_rate, freight_data=None, transport_note="普通", trade_term="FOB", capacities=None,
+                   fee_rules=None):
+    """计算利润曲面，返回形状为 (报价数, 汇率数, 数量数) 的 profit、profit_margin 和各数量下的 reverse_cost
+
+    specs 为 budget_engine.product_specs 的结果。运费按每个数量重新求解装箱方案（capacities 为托盘装柜规划
+    得到的各柜型有效体积，可选），利润和利润率口径与页面“反算利润率”一致。
+    """
+    test_prices = np.asarray(test_prices, dtype=float)
+    exchange_rates = np.asarray(exchange_rates, dtype=float)
+    quantities = np.asarray(quantities, dtype=float)
+
+    totals = compute_totals(quantities, specs['units_per_package'], specs['single_gross'],
+                            specs['single_net'], specs['single_volume'])
+    freight = solve_containers_batch(totals['total_volume'], totals['total_gross'],
+                                     freight_data, transport_note, capacities)['freight']
+
+    budget = compute_budget(
+        quantities[None, None, :], purchase_price, vat_rate, export_rebate_rate,
+        exchange_rates[None, :, None], 0.0, totals['total_volume'][None, None, :], freight[None, None, :],
+        trade_term=trade_term, test_price=test_prices[:, None, None], transport_note=transport_note,
+        fee_rules=fee_rules)
+    return {
+        'profit': budget['profit'],
+        'profit_margin': np.broadcast_to(budget['profit_margin'], budget['profit'].shape),
+        'reverse_cost': budget['reverse_cost'],
+        'freight': freight,
+    }
+
+
+def term_payment_matrix(quantity, purchase_price, vat_rate, export_rebate_rate, exchange_rate, expected_profit_rate,
+                        total_volume, best_freight, test_price, inspection_type="无", transport_note="普通",
+                        fee_rules=None, trade_terms=TRADE_TERMS, payments=PAYMENTS):
+    """在 贸易术语 × 支付方式 网格上一次计算全部组合，返回每个组合一行的 DataFrame
+
+    贸易术语和支付方式只影响第四步的保险费、报关费和银行费用。第三步的建议报价不含这些费用，各组合都相同，
+    所以这里的建议报价按第四步总成本加期望利润率反算；利润和利润率为测试报价下的 收入 - 总成本。
+    """
+    terms = np.asarray(trade_terms, dtype=str)[:, None]
+    pays = np.asarray(payments, dtype=str)[None, :]
+    shape = (len(trade_terms), len(payments))
+    budget = compute_budget(quantity, purchase_price, vat_rate, export_rebate_rate, exchange_rate,
+                            expected_profit_rate, total_volume, best_freight,
+                            trade_term=terms, payment=pays, inspection_type=inspection_type,
+                            transport_note=transport_note, fee_rules=fee_rules)
+    profit = calc_revenue(test_price, quantity, exchange_rate) - budget['total_cost']
+    columns = {
+        'trade_term': np.broadcast_to(terms, shape),
+        'payment': np.broadcast_to(pays, shape),
+        'insurance': budget['insurance'],
+        'customs_fee': budget['customs_fee'],
+        'bank_fee': budget['bank_fee'],
+        'total_cost': budget['total_cost'],
+        'suggested_price': price_for_margin(budget, quantity, exchange_rate, expected_profit_rate / 100.0),
+        'profit': profit,
+        'profit_margin': calc_profit_margin(profit, budget['purchase_total']),
+    }
+    return pd.DataFrame({name: np.broadcast_to(values, shape).ravel() for name, values in columns.items()})
+
+
+def break_even_frame(surface, exchange_rates, quantities, quantity_index):
+    """某个数量下各汇率的盈亏平衡报价(USD)：reverse_cost / (数量 × 汇率)"""
+    exchange_rates = np.asarray(exchange_rates, dtype=float)
+    reverse_cost = np.broadcast_to(surface['reverse_cost'], (1, len(exchange_rates), len(quantities)))
+    return pd.DataFrame({
+        'test_price': reverse_cost[0, :, quantity_index] / (quantities[quantity_index] * exchange_rates),
+        'exchange_rate': exchange_rates,
+    })
+
+
+def _cell_edges(values):
+    """网格点 -> 单元格左右边界"""
+    values = np.asarray(values, dtype=float)
+    step = np.diff(values).mean() if len(values) > 1 else 1.0
+    return values - step / 2, values + step / 2
+
+
+def heatmap_frame(surface, test_prices, exchange_rates, quantity_index):
+    """取某个数量的切片，转换为热力图用的长表"""
+    price_lo, price_hi = _cell_edges(test_prices)
+    rate_lo, rate_hi = _cell_edges(exchange_rates)
+    index = np.meshgrid(np.arange(len(test_prices)), np.arange(len(exchange_rates)), indexing='ij')
+    i, j = index[0].ravel(), index[1].ravel()
+    return pd.DataFrame({
+        'test_price': np.asarray(test_prices)[i], 'price_lo': price_lo[i], 'price_hi': price_hi[i],
+        'exchange_rate': np.asarray(exchange_rates)[j], 'rate_lo': rate_lo[j], 'rate_hi': rate_hi[j],
+        'profit': surface['profit'][:, :, quantity_index].ravel(),
+        'profit_margin': surface['profit_margin'][:, :, quantity_index].ravel(),
+    })
+
+
+def heatmap_chart(frame, break_even):
+    """利润率热力图，叠加盈亏平衡线"""
+    import altair as alt
+
+    price_scale = alt.Scale(domain=[frame['price_lo'].min(), frame['price_hi'].max()], nice=False)
+    rate_scale = alt.Scale(domain=[frame['rate_lo'].min(), frame['rate_hi'].max()], nice=False)
+    heatmap = alt.Chart(frame).mark_rect().encode(
+        x=alt.X('price_lo:Q', scale=price_scale, title='测试报价 (USD)'), x2='price_hi:Q',
+        y=alt.Y('rate_lo:Q', scale=rate_scale, title='汇率'), y2='rate_hi:Q',
+        color=alt.Color('profit_margin:Q', title='利润率', scale=alt.Scale(scheme='redyellowgreen', domainMid=0)),
+        tooltip=[alt.Tooltip('test_price:Q', format='.2f', title='报价'),
+                 alt.Tooltip('exchange_rate:Q', format='.3f', title='汇率'),
+                 alt.Tooltip('profit:Q', format=',.2f', title='利润'),
+                 alt.Tooltip('profit_margin:Q', format='.1%', title='利润率')],
+    )
+    break_even = break_even[break_even['test_price'].between(frame['price_lo'].min(), frame['price_hi'].max())]
+    line = alt.Chart(break_even).mark_line(color='black', strokeDash=[4, 2]).encode(
+        x=alt.X('test_price:Q', scale=price_scale), y=alt.Y('exchange_rate:Q', scale=rate_scale),
+        order='exchange_rate:Q')
+    return heatmap + line
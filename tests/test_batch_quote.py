@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from batch_quote import quote_chunk
+from budget_engine import product_specs_table
+from data_loader import SAMPLE_PRODUCT
+
+DEFAULTS = {'vat_rate': 13.0, 'export_rebate_rate': 13.0, 'expected_profit_rate': 15.0, 'exchange_rate': 7.1}
+
+
+def quote(rows):
+    return quote_chunk(pd.DataFrame(rows), product_specs_table([SAMPLE_PRODUCT]), None, DEFAULTS)
+
+
+def test_bad_profit_rate_falls_back_to_default():
+    """利润率单元格无法解析时按默认利润率计算，不影响同一块中的其他行"""
+    order = {'product_code': SAMPLE_PRODUCT['product_code'], 'quantity': 10, 'purchase_price': 3000}
+    result = quote([{**order, 'expected_profit_rate': '15%?'}, {**order, 'expected_profit_rate': None},
+                    {**order, 'expected_profit_rate': 15}, {**order, 'expected_profit_rate': 30}])
+    assert (result['error'] == '').all()
+    price = result['suggested_price']
+    assert price[0] == price[1] == price[2]
+    assert price[3] == pytest.approx(price[2] / 1.15 * 1.30, abs=0.01)
+
+
+def test_invalid_rows_are_reported():
+    order = {'product_code': SAMPLE_PRODUCT['product_code'], 'quantity': 10, 'purchase_price': 3000}
+    result = quote([order, {**order, 'product_code': 'NOPE'}, {**order, 'quantity': 'abc'}])
+    assert list(result['error']) == ['', '未找到商品', '数量或单价无效']
+    assert result['total_cost'][1:].isna().all()
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from budget_engine import budget_scalar, compute_budget
+
+ORDER = {
+    'quantity': 1200.0, 'purchase_price': 85.5, 'vat_rate': 13.0, 'export_rebate_rate': 9.0,
+    'exchange_rate': 7.15, 'expected_profit_rate': 15.0, 'total_volume': 18.6, 'best_freight': 1452.0,
+}
+TEST_PRICE = 16.8
+CASES = [
+    ('FOB', 'T/T', '无'),
+    ('CIF', 'D/P', 'A/B'),
+    ('EXW', 'L/C', 'B'),
+    ('DDP', 'T/T+LC', 'P/Q'),
+]
+
+
+def page_budget(quantity, purchase_price, vat_rate, export_rebate_rate, exchange_rate, expected_profit_rate,
+                total_volume, best_freight, trade_term, payment, inspection_type, test_price):
+    """原页面（计算报价、第四步预算表、反算利润率）的公式，逐行照抄"""
+    purchase_total = purchase_price * quantity
+    rebate = purchase_total / (1.0 + vat_rate/100.0) * (export_rebate_rate/100.0)
+    total_cost = purchase_total - rebate + (best_freight * exchange_rate)
+    suggested_price = (total_cost * (1.0 + expected_profit_rate/100.0)) / quantity / exchange_rate
+
+    inland_fee = max(50.0, total_volume * 10.0) * exchange_rate
+    forwarder_fee = max(70.0, total_volume * 2.5) * exchange_rate
+    inspection_fee = 30.0 * exchange_rate if "B" in str(inspection_type) else 0.0
+    certificate_fee = 100.0 * exchange_rate if "B" in str(inspection_type) else 0.0
+    customs_fee = 30.0 * exchange_rate if trade_term != "EXW" else 0.0
+    insurance = purchase_total * 1.1 * 0.005 if trade_term in ["CIF", "CIP", "DAP", "DPU", "DDP"] else 0.0
+    if payment in ["D/P", "D/A"]:
+        bank_fee = max(15.0, min(285.0, purchase_total * 0.001)) + 45.0
+    elif "L/C" in payment:
+        bank_fee = max(15.0, purchase_total * 0.00125) + 75.0
+    else:
+        bank_fee = 0.0
+    domestic_total = inland_fee + forwarder_fee + inspection_fee + certificate_fee + customs_fee + insurance
+    total_cost_final = purchase_total - rebate + domestic_total + (bank_fee * exchange_rate) + (best_freight * exchange_rate)
+
+    reverse_cost = purchase_total - rebate + inland_fee + forwarder_fee + customs_fee + (best_freight * exchange_rate)
+    revenue = test_price * quantity * exchange_rate
+    profit = revenue - reverse_cost
+    profit_margin = profit / purchase_total if purchase_total > 0 else 0.0
+    return {
+        'purchase_total': purchase_total, 'rebate': rebate, 'suggested_price': suggested_price,
+        'inland_fee': inland_fee, 'forwarder_fee': forwarder_fee, 'inspection_fee': inspection_fee,
+        'certificate_fee': certificate_fee, 'customs_fee': customs_fee, 'insurance': insurance,
+        'bank_fee': bank_fee, 'domestic_total': domestic_total, 'total_cost': total_cost_final,
+        'reverse_cost': reverse_cost, 'revenue': revenue, 'profit': profit, 'profit_margin': profit_margin,
+    }
+
+
+@pytest.mark.parametrize('trade_term, payment, inspection_type', CASES)
+def test_budget_matches_original_page(trade_term, payment, inspection_type):
+    expected = page_budget(**ORDER, trade_term=trade_term, payment=payment, inspection_type=inspection_type,
+                           test_price=TEST_PRICE)
+    budget = budget_scalar(compute_budget(**ORDER, trade_term=trade_term, payment=payment,
+                                          inspection_type=inspection_type, test_price=TEST_PRICE))
+    for key, value in expected.items():
+        assert budget[key] == pytest.approx(value, rel=1e-12, abs=1e-9), key
+
+
+def test_batch_matches_original_page():
+    """整批数组计算与逐笔照抄的页面公式一致，包括银行费用的上下限和最低收费"""
+    rng = np.random.default_rng(1)
+    size = 200
+    orders = {
+        'quantity': rng.integers(1, 5000, size).astype(float),
+        'purchase_price': rng.uniform(1.0, 2000.0, size),
+        'vat_rate': rng.choice([9.0, 13.0], size),
+        'export_rebate_rate': rng.choice([0.0, 9.0, 13.0], size),
+        'exchange_rate': np.full(size, 7.15),
+        'expected_profit_rate': rng.uniform(0.0, 40.0, size),
+        'total_volume': rng.uniform(0.0, 80.0, size),
+        'best_freight': rng.uniform(0.0, 6000.0, size),
+    }
+    terms = np.array([case[0] for case in CASES])[rng.integers(0, len(CASES), size)]
+    payments = np.array(['T/T', 'L/C', 'D/P', 'D/A', 'T/T+LC'])[rng.integers(0, 5, size)]
+    inspections = np.array(['无', 'A/B', 'B', 'P/Q'])[rng.integers(0, 4, size)]
+    test_price = rng.uniform(1.0, 400.0, size)
+    budget = compute_budget(**orders, trade_term=terms, payment=payments, inspection_type=inspections,
+                            test_price=test_price)
+    for i in range(size):
+        expected = page_budget(**{name: float(values[i]) for name, values in orders.items()},
+                               trade_term=str(terms[i]), payment=str(payments[i]),
+                               inspection_type=str(inspections[i]), test_price=float(test_price[i]))
+        for key, value in expected.items():
+            assert budget[key][i] == pytest.approx(value, rel=1e-12, abs=1e-9), (key, i)
@@ -0,0 +1,53 @@
+import json
+import re
+
+from budget_engine import compute_budget
+from budget_export import export_bytes, export_tempfile, quote_rows
+from fee_rules import DEFAULT_FEE_SCHEDULE, FeeSchedule
+
+RATE = 7.1
+CUSTOM = FeeSchedule([
+    {'fee': 'bank_fee', 'label': '托收手续费', 'payment': 'D/P', 'base': 'fixed', 'rate': 20, 'currency': 'USD'},
+    {'fee': 'inland_fee', 'label': '拖车费', 'base': 'volume', 'rate': 12},
+])
+
+
+def saved_quote(schedule, payment='D/P'):
+    """与页面保存的方案相同的结构（经过一次 JSON 往返）"""
+    budget = compute_budget(100, 3000.0, 13.0, 13.0, RATE, 15.0, 20.0, 3000.0, trade_term='FOB', payment=payment,
+                            fee_rules=schedule)
+    inputs = {'quantity': 100, 'purchase_price': 3000.0, 'vat_rate': 13.0, 'export_rebate_rate': 13.0,
+              'total_volume': 20.0, 'exchange_rate': RATE, 'best_freight': 3000.0, 'trade_term': 'FOB',
+              'payment': payment, 'fee_rules': schedule.applied_records('FOB', payment, '无', '普通')}
+    return json.loads(json.dumps({'inputs': inputs, 'budget': {key: float(value) for key, value in budget.items()}}))
+
+
+def labels(rows):
+    return {sub: principle for _, sub, _, _, principle, _ in rows}
+
+
+def test_saved_quote_keeps_rules_it_was_computed_with():
+    quote = saved_quote(CUSTOM)
+    assert len(quote['inputs']['fee_rules']) == 2
+    rows = labels(quote_rows(quote, DEFAULT_FEE_SCHEDULE))
+    assert rows['托收手续费'] == '20' and rows['拖车费'] == '20.0×12'
+    assert '出口内陆运费' not in rows
+
+    rows = labels(quote_rows(saved_quote(DEFAULT_FEE_SCHEDULE), CUSTOM))
+    assert '出口内陆运费' in rows and '拖车费' not in rows
+
+
+def test_quote_without_saved_rules_uses_given_schedule():
+    quote = saved_quote(CUSTOM)
+    del quote['inputs']['fee_rules']
+    assert '拖车费' in labels(quote_rows(quote, CUSTOM))
+    assert '出口内陆运费' in labels(quote_rows(quote))
+
+
+def test_pdf_export_writes_one_page_per_quote():
+    quotes = [saved_quote(CUSTOM), saved_quote(DEFAULT_FEE_SCHEDULE, 'T/T')]
+    content = export_bytes(quotes, 'pdf')
+    assert content.startswith(b'%PDF')
+    assert re.findall(rb'/Count (\d+)', content) == [b'2']
+    with export_tempfile(iter(quotes), 'pdf') as exported:
+        assert exported.read().startswith(b'%PDF')
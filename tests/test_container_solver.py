@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from container_solver import _tables, solve_containers, solve_containers_batch
+
+BRUTE_LIMIT = 40
+
+
+def brute_force(volume, weight, kind):
+    """每种柜型 0~BRUTE_LIMIT 柜全部枚举，返回最低运费"""
+    names, prices, volumes, payloads, lcl = _tables(None, kind)
+    grid = np.arange(BRUTE_LIMIT + 1.0)
+    combos = np.stack([g.ravel() for g in np.meshgrid(grid, grid, grid, indexing='ij')], axis=1)
+    short = np.maximum(1.0 - combos @ volumes / volume, 1.0 - combos @ payloads / weight)
+    lcl_full = max(weight / 1000.0 * lcl[0], volume * lcl[1])
+    return (combos @ prices + np.clip(short, 0.0, 1.0) * lcl_full).min()
+
+
+@pytest.mark.parametrize('transport_note, kind', [("普通", 'normal'), ("冷冻", 'frozen')])
+def test_large_orders_match_brute_force(transport_note, kind):
+    """需要十几到三十几柜的大订单（含轻货、重货）与穷举结果一致"""
+    rng = np.random.default_rng(3)
+    volume = rng.uniform(300.0, 2000.0, 60)
+    weight = volume * np.exp(rng.uniform(np.log(50.0), np.log(1200.0), 60))
+    _, _, volumes, payloads, _ = _tables(None, kind)
+    keep = (volume < 30 * volumes.min()) & (weight < 30 * payloads.min())
+    volume, weight = volume[keep], weight[keep]
+    freight = solve_containers_batch(volume, weight, transport_note=transport_note)['freight']
+    expected = [brute_force(v, w, kind) for v, w in zip(volume, weight)]
+    np.testing.assert_allclose(freight, expected, rtol=1e-9)
+
+
+def test_thirteen_cheapest_containers():
+    """871 CBM 轻货：13个40'GP 比 2个20'GP + 12个40'GP 便宜"""
+    mix = solve_containers(871.0, 10000.0)
+    assert mix['counts'] == {"20'GP": 0, "40'GP": 13, "40'HC": 0}
+    assert mix['freight'] == pytest.approx(brute_force(871.0, 10000.0, 'normal'))
+
+
+def test_small_order_uses_lcl():
+    mix = solve_containers(0.5, 100.0)
+    assert mix['containers'] == 0
+    assert mix['lcl_volume'] == pytest.approx(0.5)
+    assert mix['description'] == "拼箱0.50CBM"
+
+
+def test_batch_matches_single():
+    volume = np.array([12.0, 255.0, 871.0, 255.0])
+    weight = np.array([3000.0, 28000.0, 10000.0, 28000.0])
+    batch = solve_containers_batch(volume, weight)
+    for i in range(len(volume)):
+        assert batch['freight'][i] == pytest.approx(solve_containers(volume[i], weight[i])['freight'])
+
+
+def test_all_zero_capacities_fall_back_to_lcl():
+    """托盘装不进任何柜型：不报错，全部拼箱"""
+    with np.errstate(all='raise'):
+        mix = solve_containers(10.0, 2800.0, None, "普通", np.zeros(3))
+    assert mix['containers'] == 0
+    assert mix['lcl_volume'] == pytest.approx(10.0)
+    assert np.isfinite(mix['freight'])
+
+
+@pytest.mark.parametrize('volume, weight', [(100.0, 2800.0), (871.0, 10000.0), (2000.0, 60000.0)])
+def test_zero_capacity_types_are_never_used(volume, weight):
+    capacities = np.array([0.0, 60.0, 0.0])
+    with np.errstate(all='raise'):
+        mix = solve_containers(volume, weight, None, "普通", capacities)
+    assert mix['counts']["20'GP"] == mix['counts']["40'HC"] == 0
+    # 只能用40'GP：与逐个柜数枚举的最低运费一致
+    _, prices, _, payloads, lcl = _tables(None, 'normal')
+    full = int(np.ceil(max(volume / 60.0, weight / payloads[1])))
+    lcl_full = max(weight / 1000.0 * lcl[0], volume * lcl[1])
+    candidates = [n * prices[1] + np.clip(max(1.0 - n * 60.0 / volume, 1.0 - n * payloads[1] / weight), 0.0, 1.0)
+                  * lcl_full for n in range(full + 1)]
+    assert mix['freight'] == pytest.approx(min(candidates))
@@ -0,0 +1,99 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from fee_rules import DEFAULT_FEE_SCHEDULE, FEE_LABELS, FeeSchedule
+
+RATE = 7.1
+
+
+def test_default_rules_match_original_formulas():
+    fees = DEFAULT_FEE_SCHEDULE.evaluate(200000.0, 3.0, RATE, 'CIF', 'D/P', 'A/B', '普通')
+    assert fees['inland_fee'] == 50.0 * RATE
+    assert fees['forwarder_fee'] == 70.0 * RATE
+    assert fees['inspection_fee'] == 30.0 * RATE
+    assert fees['certificate_fee'] == 100.0 * RATE
+    assert fees['customs_fee'] == 30.0 * RATE
+    assert fees['insurance'] == 200000.0 * 1.1 * 0.005
+    assert fees['bank_fee'] == max(15.0, min(285.0, 200000.0 * 0.001)) + 45.0
+
+    fees = DEFAULT_FEE_SCHEDULE.evaluate(200000.0, 30.0, RATE, 'EXW', 'L/C', '无', '普通')
+    assert fees['inland_fee'] == 300.0 * RATE
+    assert fees['inspection_fee'] == fees['customs_fee'] == fees['insurance'] == 0.0
+    assert fees['bank_fee'] == 200000.0 * 0.00125 + 75.0
+
+
+def test_first_matching_rule_wins():
+    schedule = FeeSchedule([
+        {'fee': 'customs_fee', 'trade_term': 'F*', 'payment': '!T/T*', 'base': 'fixed', 'rate': 5},
+        {'fee': 'customs_fee', 'transport_note': '冷冻,冷藏', 'base': 'value', 'rate': 0.01},
+        {'fee': 'customs_fee', 'base': 'fixed', 'rate': 1, 'currency': 'USD'},
+    ])
+    assert schedule.evaluate(100.0, 1.0, RATE, 'FOB', 'L/C', '无', '冷冻')['customs_fee'] == 5.0
+    assert schedule.evaluate(100.0, 1.0, RATE, 'FOB', 'T/T+LC', '无', '冷冻')['customs_fee'] == 1.0
+    assert schedule.evaluate(100.0, 1.0, RATE, 'CIF', 'L/C', '无', '普通')['customs_fee'] == RATE
+    assert schedule.evaluate(100.0, 1.0, RATE, 'CIF', 'L/C', '无', '普通')['bank_fee'] == 0.0
+
+
+@pytest.mark.parametrize('dtype', ['U', 'O'])
+def test_arrays_match_single_orders(dtype):
+    """数组计算与逐笔计算一致，包括不在页面选项中的取值、非 ASCII 和较长的字符串"""
+    schedule = FeeSchedule([{'fee': 'customs_fee', 'trade_term': 'F*', 'payment': '!T/T*', 'inspection_type': '*B*',
+                             'base': 'fixed', 'rate': 5}] + DEFAULT_FEE_SCHEDULE.records())
+    rng = np.random.default_rng(0)
+    size = 500
+    terms = np.array(['EXW', 'FOB', 'CIF', 'DDP', 'fob', '离岸价', 'FREE-ON-BOARD'], dtype=dtype)
+    payments = np.array(['T/T', 'L/C', 'D/P', 'D/A', 'T/T+LC', 'Sight L/C'], dtype=dtype)
+    inspections = np.array(['无', 'B', 'A/B', ''], dtype=dtype)
+    term = terms[rng.integers(0, len(terms), size)]
+    payment = payments[rng.integers(0, len(payments), size)]
+    inspection = inspections[rng.integers(0, len(inspections), size)]
+    purchase_total = rng.uniform(0.0, 1e6, size)
+    volume = rng.uniform(0.0, 300.0, size)
+    fees = schedule.evaluate(purchase_total, volume, RATE, term, payment, inspection, '普通')
+    for i in range(size):
+        single = schedule.evaluate(purchase_total[i], volume[i], RATE, str(term[i]), str(payment[i]),
+                                   str(inspection[i]), '普通')
+        for fee in FEE_LABELS:
+            assert fees[fee][i] == single[fee], (fee, term[i], payment[i], inspection[i])
+
+
+def test_missing_values_match_as_empty():
+    terms = np.array(['FOB', None, np.nan, 'EXW'], dtype=object)
+    fees = DEFAULT_FEE_SCHEDULE.evaluate(1e5, 10.0, RATE, terms, np.array(['L/C', None, 'T/T', np.nan], dtype=object))
+    single = DEFAULT_FEE_SCHEDULE.evaluate(1e5, 10.0, RATE, '', '')
+    np.testing.assert_array_equal(fees['customs_fee'], [30.0 * RATE, single['customs_fee'], single['customs_fee'], 0.0])
+    np.testing.assert_array_equal(fees['bank_fee'][1:], [0.0, 0.0, 0.0])
+
+
+def test_broadcast_shapes():
+    fees = DEFAULT_FEE_SCHEDULE.evaluate(np.full((1, 3), 1e5), 10.0, RATE, np.array(['EXW', 'CIF'])[:, None],
+                                         np.array(['T/T', 'L/C', 'D/P']))
+    assert all(amount.shape == (2, 3) for amount in fees.values())
+    np.testing.assert_array_equal(fees['customs_fee'][:, 0], [0.0, 30.0 * RATE])
+    fees = DEFAULT_FEE_SCHEDULE.evaluate(np.ones(1), np.ones(1), RATE, np.array(['FOB']), np.array(['T/T']))
+    assert all(amount.shape == (1,) for amount in fees.values())
+
+
+def test_records_round_trip():
+    schedule = FeeSchedule(DEFAULT_FEE_SCHEDULE.records())
+    assert schedule.records() == DEFAULT_FEE_SCHEDULE.records()
+    assert pickle.loads(pickle.dumps(DEFAULT_FEE_SCHEDULE)).records() == DEFAULT_FEE_SCHEDULE.records()
+
+
+def test_matching_and_describe():
+    rule = DEFAULT_FEE_SCHEDULE.matching('inland_fee')
+    assert rule.describe(255.0, RATE) == "MAX(50, 255.0×10)×7.100"
+    assert DEFAULT_FEE_SCHEDULE.matching('bank_fee', payment='L/C').label == '信用证费用'
+    assert DEFAULT_FEE_SCHEDULE.matching('bank_fee', payment='T/T') is None
+
+
+@pytest.mark.parametrize('record, message', [
+    ({'fee': '海运费'}, "费用规则第1条：无法识别的费用“海运费”"),
+    ({'fee': 'customs_fee', 'rate': 'abc'}, "费用规则第1条：费率“abc”不是数字"),
+    ({'fee': 'customs_fee', 'currency': 'EUR'}, "费用规则第1条：无法识别的币种“EUR”"),
+])
+def test_invalid_rules(record, message):
+    with pytest.raises(ValueError, match=message):
+        FeeSchedule([record])
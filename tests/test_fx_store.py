@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import DEFAULT_EXCHANGE_RATE
+from fx_store import FxStore, normalize_pair
+
+EXCHANGE = pd.DataFrame({
+    'pair': ['usd/cny', 'USD/CNY', 'USD / CNY', 'EUR/CNY', 'USD/CNY'],
+    'date': ['2026-05-01', '2026-05-10', '2026-05-10', '2026-05-01', None],
+    'rate': [7.10, 7.20, 7.25, 7.80, 'n/a'],
+})
+
+
+def test_normalize_pair():
+    assert normalize_pair(' usd / cny ') == 'USD/CNY'
+    assert normalize_pair(None) == ''
+
+
+def test_as_of_lookup():
+    store = FxStore(EXCHANGE)
+    assert store.pairs == ['EUR/CNY', 'USD/CNY']
+    assert store.rate('USD/CNY', '2026-04-30') == DEFAULT_EXCHANGE_RATE
+    assert store.rate('USD/CNY', '2026-05-01') == 7.10
+    assert store.rate('USD/CNY', '2026-05-09') == 7.10
+    # 同一天有多条时取表中靠后的一条；没有日期取最新
+    assert store.rate('USD/CNY', '2026-05-10') == 7.25
+    assert store.rate('USD/CNY') == 7.25
+    assert store.rate('GBP/CNY', '2026-05-10', default=9.0) == 9.0
+
+
+def test_inverse_pair():
+    store = FxStore(EXCHANGE)
+    assert store.rate('CNY/USD', '2026-05-20') == 1.0 / 7.25
+
+
+def test_batch_matches_single_lookups():
+    store = FxStore(EXCHANGE)
+    pairs = ['USD/CNY', 'eur/cny', None, 'CNY/USD', 'USD/CNY']
+    dates = ['2026-05-05', '2026-06-01', '2026-05-05', None, pd.NaT]
+    expected = [store.rate(pair or '', date) for pair, date in zip(pairs, dates)]
+    np.testing.assert_array_equal(store.rates(pairs, dates), expected)
+    np.testing.assert_array_equal(store.rates('USD/CNY', dates), [store.rate('USD/CNY', date) for date in dates])
+
+
+def test_history_and_empty_store():
+    history = FxStore(EXCHANGE).history('usd/cny')
+    assert list(history['rate']) == [7.10, 7.20, 7.25]
+    assert history['date'].is_monotonic_increasing
+    empty = FxStore()
+    assert len(empty) == 0 and empty.history().empty
+    assert empty.rate() == DEFAULT_EXCHANGE_RATE
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from hs_tariff import TariffTable, normalize_code
+
+RECORDS = [
+    {'hs_code': '8476810000', 'vat_rate': 13, 'export_rebate_rate': 13, 'inspection_type': '无'},
+    {'hs_code': '0303', 'vat_rate': 9, 'export_rebate_rate': 9, 'inspection_type': 'P/Q'},
+    {'hs_code': '030389', 'vat_rate': 9, 'export_rebate_rate': 0, 'inspection_type': 'P/Q'},
+    {'hs_code': '30312', 'vat_rate': 1},
+    {'hs_code': '847681000', 'vat_rate': 1},
+    {'hs_code': ''},
+]
+
+
+def test_normalize_code():
+    assert normalize_code('8476.81.0000') == '8476810000'
+    assert normalize_code('8476810000101') == '8476810000'
+    assert normalize_code(None) == ''
+
+
+def test_longest_prefix_wins():
+    table = TariffTable(RECORDS)
+    assert table.lookup('0303.89.9000')['hs_code'] == '030389'
+    assert table.lookup('0303.89.9000')['export_rebate_rate'] == 0.0
+    assert table.lookup('03031100')['hs_code'] == '0303'
+    assert table.lookup('8476810000')['vat_rate'] == 13.0
+    assert table.lookup('9999') is None
+
+
+def test_invalid_lengths_are_reported():
+    """5/7/9 位编码永远查不到，读取时跳过并记录；空编码不算"""
+    table = TariffTable(RECORDS)
+    assert len(table) == 3
+    assert table.skipped == ('30312', '847681000')
+    assert table.lookup('3031200000') is None
+
+
+def test_lookup_many():
+    table = TariffTable(RECORDS)
+    rows = table.lookup_many(['0303890000', None, '9999', '0303890000'])
+    assert list(rows['hs_code'].iloc[[0, 3]]) == ['030389', '030389']
+    assert rows.loc[[1, 2], 'hs_code'].isna().all()
+    assert pd.api.types.is_float_dtype(rows['vat_rate'])
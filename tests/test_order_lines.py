@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from budget_engine import compute_budget, compute_totals
+from container_solver import solve_containers
+from order_lines import order_budget
+
+LINE = {'product_code': 'A', 'quantity': 100, 'purchase_price': 3000.0, 'vat_rate': 13.0, 'export_rebate_rate': 13.0,
+        'units_per_package': 1, 'single_gross': 60.0, 'single_net': 55.0, 'single_volume': 0.3}
+RATE = 7.1
+
+
+def test_single_line_matches_compute_budget():
+    """只有一行时分摊比例为 1，各项应与单品预算完全一致"""
+    result = order_budget(pd.DataFrame([LINE]), RATE, 15.0, 'CIF', 'L/C', 'A/B')
+    totals = compute_totals(100, 1, 60.0, 55.0, 0.3)
+    freight = solve_containers(float(totals['total_volume']), float(totals['total_gross']))['freight']
+    budget = compute_budget(100, 3000.0, 13.0, 13.0, RATE, 15.0, float(totals['total_volume']), freight,
+                            'CIF', 'L/C', 'A/B')
+    line = result['lines'].iloc[0]
+    for key in ['purchase_total', 'rebate', 'freight_cny', 'inland_fee', 'forwarder_fee', 'inspection_fee',
+                'certificate_fee', 'customs_fee', 'insurance', 'domestic_total', 'bank_fee', 'total_cost',
+                'suggested_price']:
+        assert line[key] == pytest.approx(float(budget[key]), rel=1e-12), key
+    assert result['total']['quote_cost'] == pytest.approx(float(budget['quote_cost']))
+
+
+def test_shipment_fees_are_allocated_in_full():
+    lines = pd.DataFrame([LINE, {**LINE, 'product_code': 'B', 'quantity': 250, 'purchase_price': 120.0,
+                                 'units_per_package': 10, 'single_gross': 12.0, 'single_volume': 0.05}])
+    result = order_budget(lines, RATE, 15.0, 'CIF', 'L/C')
+    single = order_budget(lines.iloc[:1], RATE, 15.0, 'CIF', 'L/C')
+    # 按票收取的费用整票只算一次，各行之和等于整票金额
+    assert result['lines']['customs_fee'].sum() == pytest.approx(single['lines']['customs_fee'].sum())
+    assert result['total']['total_cost'] == pytest.approx(result['lines']['total_cost'].sum())
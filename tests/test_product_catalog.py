@@ -0,0 +1,27 @@
+from product_catalog import ProductCatalog
+
+PRODUCTS = [
+    {'product_code': 'A100', 'product_name': '冷冻虾仁', 'product_name_en': 'Frozen Shrimp', 'hs_code': '0306.17'},
+    {'product_code': 'A101', 'product_name': '冷冻鱿鱼', 'product_name_en': 'Frozen Squid', 'hs_code': '0307.43'},
+    {'product_code': 'B200', 'product_name': '花生油', 'product_name_en': 'Peanut Oil', 'hs_code': '1508.10'},
+    {'product_code': 'Z900', 'product_name': '大虾', 'product_name_en': 'Prawn', 'hs_code': '0306.17'},
+]
+
+
+def codes(products):
+    return [product['product_code'] for product in products]
+
+
+def test_prefix_matches_come_first():
+    catalog = ProductCatalog(PRODUCTS)
+    assert codes(catalog.search('a10')) == ['A100', 'A101']
+    assert codes(catalog.search('冷冻')) == ['A100', 'A101']
+    assert codes(catalog.search('虾')) == ['A100', 'Z900']
+    assert codes(catalog.search('0306.17')) == ['A100', 'Z900']
+
+
+def test_prefix_stops_at_end_of_index():
+    catalog = ProductCatalog(PRODUCTS)
+    assert codes(catalog.search('z9')) == ['Z900']
+    assert catalog.search('zz') == []
+    assert codes(catalog.search('frozen', limit=1)) == ['A100']
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from quantity_parser import (COUNT, UNKNOWN, VOLUME, WEIGHT, parse_column, parse_quantity, parse_units_per_package,
+                             parse_volume, parse_weight, unit_mismatch)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("280.00KGS/托盘", 280.0),
+    ("617 LBS/CTN", 617 * 0.45359237),
+    ("1,250 G", 1.25),
+    ("2.5 MT", 2500.0),
+    ("12千克每托盘", 12.0),
+    ("25", 25.0),
+    ("", 0.0),
+])
+def test_weight(text, expected):
+    assert parse_weight(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("2.55CBM/托盘", 2.55),
+    ("90 CFT/PALLET", 90 * 0.028316846592),
+    ("500 L", 0.5),
+    ("1.2立方米", 1.2),
+])
+def test_volume(text, expected):
+    assert parse_volume(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('text, expected', [("2 SETS/CTN", 2.0), ("1 SET/PALLET", 1.0), ("1 DOZ/CTN", 12.0),
+                                            ("6套/箱", 6.0)])
+def test_units_per_package(text, expected):
+    assert parse_units_per_package(text) == expected
+
+
+@pytest.mark.parametrize('text, unit', [("5 GALLONS", 'GALLONS'), ("2 LAYERS", 'LAYERS'), ("1 PALLET", 'PALLET'),
+                                        ("3 托盘", '托盘')])
+def test_unknown_unit_is_not_truncated(text, unit):
+    """无法识别的单位不能被截短成 G / L 等已知单位，按0计算并由 unit_mismatch 报告"""
+    quantity = parse_quantity(text)
+    assert quantity.kind == UNKNOWN and quantity.unit == unit
+    assert parse_weight(text) == parse_volume(text) == parse_units_per_package(text) == 0.0
+    assert unit_mismatch(text, WEIGHT) == unit
+
+
+def test_unit_mismatch():
+    assert unit_mismatch("2.55CBM/托盘", WEIGHT) == 'CBM'
+    assert unit_mismatch("2.55CBM/托盘", VOLUME) == ''
+    assert unit_mismatch("25", COUNT) == ''
+
+
+def test_parse_column():
+    values = ["280KGS", None, "617 LBS", "280KGS", "5 GALLONS"]
+    np.testing.assert_allclose(parse_column(values, WEIGHT), [280.0, 0.0, 617 * 0.45359237, 280.0, 0.0])
+    assert len(parse_column([], VOLUME)) == 0